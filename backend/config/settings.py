@@ -3,6 +3,7 @@ Django settings for config project.
 """
 
 from pathlib import Path
+import json
 import os
 import dj_database_url
 
@@ -65,6 +66,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "ohsms.core.authorization.AuthorizationContextMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -102,6 +104,71 @@ DATABASES = {
     )
 }
 
+# =========================
+# Cache
+# =========================
+# كاش مشترك (Redis) مطلوب عند تشغيل أكثر من worker حتى يصل إبطال
+# كاش الصلاحيات لكل العمليات. بدون REDIS_URL نستخدم كاش محلي للعملية.
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# مدة كاش أدوار ونطاقات المستخدم (ثوانٍ) - شبكة أمان إضافية فوق الإبطال بالإصدار
+OHSMS_AUTHZ_CACHE_TTL = int(os.getenv("OHSMS_AUTHZ_CACHE_TTL", "300"))
+
+# مدة كاش لقطات لوحة المؤشرات (ثوانٍ) - الإبطال الأساسي عبر إصدارات الفروع
+OHSMS_DASHBOARD_CACHE_TTL = int(os.getenv("OHSMS_DASHBOARD_CACHE_TTL", "300"))
+
+# مدة إبقاء اللقطة القديمة بعد انتهاء صلاحيتها (تُعاد أثناء إعادة حسابها من طلب واحد)
+OHSMS_DASHBOARD_STALE_TTL = int(os.getenv("OHSMS_DASHBOARD_STALE_TTL", "600"))
+
+# حجم مجمع الخيوط لحساب ودجات اللوحة بالتوازي (1 = تنفيذ متتابع داخل الطلب)
+OHSMS_DASHBOARD_WORKERS = int(os.getenv("OHSMS_DASHBOARD_WORKERS", "4"))
+
+# مستخدم النظام لأحداث المهام الدورية (مثل: manage.py sweep_sla)
+OHSMS_SYSTEM_USERNAME = os.getenv("OHSMS_SYSTEM_USERNAME", "system")
+
+# قياس استعلامات/زمن ودجات اللوحة (ohsms.core.instrumentation) - آخر N قياس لكل اسم
+OHSMS_INSTRUMENTATION_ENABLED = os.getenv("OHSMS_INSTRUMENTATION_ENABLED", "1") == "1"
+OHSMS_INSTRUMENTATION_WINDOW = int(os.getenv("OHSMS_INSTRUMENTATION_WINDOW", "500"))
+
+# ميزانيات اختيارية لكل اسم قياس (تحذير في السجل عند التجاوز) كـ JSON، مثال:
+# {"dashboard.snapshot": {"queries": 12, "total_ms": 500}, "widget.kpis": {"queries": 3}}
+OHSMS_DASHBOARD_BUDGETS = json.loads(os.getenv("OHSMS_DASHBOARD_BUDGETS", "{}"))
+
+# =========================
+# Logging
+# =========================
+# سطر JSON لكل تجاوز ميزانية (WARNING) على stdout؛ أزمنة كل استدعاء في /api/dashboard/metrics/
+# OHSMS_INSTRUMENTATION_LOG_LEVEL=INFO → سطر لكل قياس أيضًا (للتشخيص)
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "plain": {"format": "%(asctime)s %(levelname)s %(name)s %(message)s"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "stream": "ext://sys.stdout", "formatter": "plain"},
+    },
+    "loggers": {
+        "ohsms.instrumentation": {
+            "handlers": ["console"],
+            "level": os.getenv("OHSMS_INSTRUMENTATION_LOG_LEVEL", "WARNING"),
+            "propagate": False,
+        },
+    },
+}
+
 # =========================
 # Passwords
 # =========================
@@ -1,24 +1,26 @@
 from django.contrib import admin
 from django.core.exceptions import ValidationError
+from django.forms.models import BaseInlineFormSet
 
 from .models import (
     # Organization
     Branch, Department, Section,
 
     # Incidents
-    Incident, IncidentEvent,
+    Incident, IncidentEvent, IncidentSlaPolicy,
 
     # Users & RBAC
     UserProfile, Role, UserRole,
 
     # Risk Management
     RiskCategory, RiskSubCategory, RiskCause,
-    AffectedGroup, Risk, RiskNote,
+    AffectedGroup, Risk, RiskNote, RiskMatrix, RiskMatrixBand,
 
     # Digital Forms
-    FormTemplate, FormField, FormSubmission, FormAnswer,
+    FormTemplate, FormField, FormTemplateVersion, FormSubmission, FormAnswer,
 
 )
+from .services.risk_matrix import MatrixBand, band_errors
 
 # =========================
 # Organization Structure
@@ -58,6 +60,12 @@ class IncidentEventAdmin(admin.ModelAdmin):
     list_filter = ("action", "created_at")
 
 
+@admin.register(IncidentSlaPolicy)
+class IncidentSlaPolicyAdmin(admin.ModelAdmin):
+    list_display = ("incident_type", "receive_minutes", "resolve_minutes", "is_active")
+    list_filter = ("is_active",)
+
+
 # =========================
 # Risk Management
 # =========================
@@ -96,6 +104,44 @@ class RiskNoteAdmin(admin.ModelAdmin):
     list_display = ("risk", "created_by", "created_at")
 
 
+class RiskMatrixBandFormSet(BaseInlineFormSet):
+    """
+    الشرائح معًا تغطي 1..(الشدة × الاحتمالية) بدون فجوات أو تداخل
+    (التقييم في فجوة كان يُصنّف أعلى شريحة في الخريطة ولا يُعد في المؤشرات)
+    """
+
+    def clean(self):
+        super().clean()
+        if any(self.errors):
+            return
+
+        bands = [
+            MatrixBand(
+                form.cleaned_data.get("code"), "", form.cleaned_data.get("min_score"),
+                form.cleaned_data.get("max_score"), "",
+            )
+            for form in self.forms
+            if form.cleaned_data and not form.cleaned_data.get("DELETE")
+        ]
+        matrix = self.instance
+        errors = band_errors(bands, max_score=matrix.severity_levels * matrix.likelihood_levels)
+        if errors:
+            raise ValidationError(errors)
+
+
+class RiskMatrixBandInline(admin.TabularInline):
+    model = RiskMatrixBand
+    formset = RiskMatrixBandFormSet
+    extra = 0
+
+
+@admin.register(RiskMatrix)
+class RiskMatrixAdmin(admin.ModelAdmin):
+    list_display = ("name", "severity_levels", "likelihood_levels", "is_active")
+    list_filter = ("is_active",)
+    inlines = [RiskMatrixBandInline]
+
+
 # =========================
 # Digital Forms
 # =========================
@@ -112,9 +158,24 @@ class FormFieldAdmin(admin.ModelAdmin):
     list_filter = ("field_type",)
 
 
+@admin.register(FormTemplateVersion)
+class FormTemplateVersionAdmin(admin.ModelAdmin):
+    """
+    عرض فقط: الإصدار ثابت بعد إنشائه (التقديمات السابقة تُقرأ منه)
+    """
+    list_display = ("form", "version", "created_at")
+    list_filter = ("form",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(FormSubmission)
 class FormSubmissionAdmin(admin.ModelAdmin):
-    list_display = ("form", "submitted_by", "submitted_at")
+    list_display = ("form", "template_version", "submitted_by", "submitted_at")
 
 
 @admin.register(FormAnswer)
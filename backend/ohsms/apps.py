@@ -8,6 +8,9 @@ class OhsmsConfig(AppConfig):
     name = 'ohsms'
 
     def ready(self):
+        # إشارات إبطال الكاش (مستقلة عن تهيئة قاعدة البيانات)
+        from ohsms import signals  # noqa: F401
+
         # ⛔ لا تنفّذ أي شيء إذا لم تكن قاعدة البيانات مهيأة
         if not os.getenv("DATABASE_URL"):
             return
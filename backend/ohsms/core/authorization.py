@@ -0,0 +1,343 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+from ohsms.core.cache_versions import get_version, bump_version
+
+# =====================================================
+# Authorization Context
+# =====================================================
+
+_CONTEXT_ATTR = "_ohsms_authz_context"
+
+PERMISSIONS_VERSION = "permissions"
+_CACHE_KEY = "ohsms:authz:{version}:{user_id}"
+
+# سطر UserRole واحد بعد التحميل (بدون كائنات موديل)
+ScopeGrant = namedtuple(
+    "ScopeGrant",
+    ["role_code", "is_global", "branch_id", "department_id", "section_id"],
+)
+
+
+def _pk(value):
+    """
+    يقبل كائن موديل أو رقم معرف ويُرجع المعرف
+    """
+    if value is None:
+        return None
+    return getattr(value, "pk", value)
+
+
+class AuthorizationContext:
+    """
+    صلاحيات المستخدم محمّلة مرة واحدة لكل طلب.
+
+    - استعلام واحد على UserRole (مع role__code / role__is_global / النطاقات)
+    - كل فحوصات PermissionService / FormPolicy / RiskEventPolicy تُجاب من الذاكرة
+    """
+
+    ROLE_FIELDS = (
+        "role__code",
+        "role__is_global",
+        "branch_id",
+        "department_id",
+        "section_id",
+        # آباء النطاق (لإسقاط النطاقات المغطاة بنطاق أوسع)
+        "department__branch_id",
+        "section__department_id",
+        "section__department__branch_id",
+    )
+
+    _UNLOADED = object()
+
+    def __init__(self, user_id=None, grants=(), scope_signature=((), (), ())):
+        self.user_id = user_id
+
+        self.grants = tuple(ScopeGrant(*g) for g in grants)
+
+        self.role_codes = frozenset(g.role_code for g in self.grants)
+        self.is_global = any(g.is_global for g in self.grants)
+
+        # (branch_ids, department_ids, section_ids) بعد إسقاط المغطى - مرتبة وثابتة
+        self.scope_signature = tuple(tuple(ids) for ids in scope_signature)
+        self._scope_sets = tuple(frozenset(ids) for ids in self.scope_signature)
+
+        self._profile_scope = self._UNLOADED
+
+    # =========================
+    # Loading
+    # =========================
+
+    @classmethod
+    def load(cls, user):
+        """
+        تحميل صلاحيات المستخدم من قاعدة البيانات
+        """
+        from ohsms.models import UserRole
+
+        if not user or not getattr(user, "is_authenticated", False):
+            return cls()
+
+        rows = list(UserRole.objects.filter(user_id=user.pk).values(*cls.ROLE_FIELDS))
+
+        grants = [
+            (
+                row["role__code"],
+                row["role__is_global"],
+                row["branch_id"],
+                row["department_id"],
+                row["section_id"],
+            )
+            for row in rows
+        ]
+
+        return cls(
+            user_id=user.pk,
+            grants=grants,
+            scope_signature=cls.minimal_scopes(rows),
+        )
+
+    @staticmethod
+    def minimal_scopes(rows):
+        """
+        تحويل أسطر UserRole إلى أصغر مجموعة نطاقات مكافئة:
+        - النطاق الأدق في السطر هو المعتمد (قسم ثم إدارة ثم فرع)
+        - تُسقط الإدارة إذا كان فرعها ممنوحاً، والقسم إذا كانت إدارته أو فرعه ممنوحاً
+        - سطر بدون نطاق لدور غير عالمي لا يمنح أي نطاق (الصلاحية الشاملة عبر is_global فقط)
+        """
+        branches = set()
+        departments = {}
+        sections = {}
+
+        for row in rows:
+            if row["role__is_global"]:
+                continue
+            if row["section_id"]:
+                sections[row["section_id"]] = (
+                    row["section__department_id"],
+                    row["section__department__branch_id"],
+                )
+            elif row["department_id"]:
+                departments[row["department_id"]] = row["department__branch_id"]
+            elif row["branch_id"]:
+                branches.add(row["branch_id"])
+
+        minimal_departments = {
+            department_id
+            for department_id, branch_id in departments.items()
+            if branch_id not in branches
+        }
+        minimal_sections = {
+            section_id
+            for section_id, (department_id, branch_id) in sections.items()
+            if department_id not in departments and branch_id not in branches
+        }
+
+        return (
+            tuple(sorted(branches)),
+            tuple(sorted(minimal_departments)),
+            tuple(sorted(minimal_sections)),
+        )
+
+    @classmethod
+    def load_cached(cls, user):
+        """
+        تحميل الصلاحيات من الكاش المشترك (مفتاح: المستخدم + إصدار الصلاحيات)
+
+        أي حفظ/حذف على UserRole أو Role يرفع الإصدار (ohsms.signals)،
+        فتصبح كل المفاتيح القديمة غير مستخدمة في كل الـ workers.
+        """
+        if not user or not getattr(user, "is_authenticated", False):
+            return cls()
+
+        key = _CACHE_KEY.format(
+            version=get_version(PERMISSIONS_VERSION),
+            user_id=user.pk,
+        )
+
+        payload = cache.get(key)
+        if payload is not None:
+            return cls(user_id=user.pk, **payload)
+
+        context = cls.load(user)
+        cache.set(
+            key,
+            {
+                "grants": [tuple(g) for g in context.grants],
+                "scope_signature": context.scope_signature,
+            },
+            getattr(settings, "OHSMS_AUTHZ_CACHE_TTL", 300),
+        )
+        return context
+
+    @classmethod
+    def invalidate_all(cls):
+        """
+        إبطال كاش الصلاحيات لكل المستخدمين
+        """
+        return bump_version(PERMISSIONS_VERSION)
+
+    @classmethod
+    def for_user(cls, user):
+        """
+        إرجاع السياق المخزّن على كائن المستخدم (أو تحميله لأول مرة)
+
+        request.user نفس الكائن طوال الطلب، لذلك أي Service يستقبل user
+        يستفيد من نفس السياق بدون استعلام إضافي.
+        """
+        if user is None:
+            return cls()
+
+        context = getattr(user, _CONTEXT_ATTR, None)
+        if context is None:
+            context = cls.load_cached(user)
+            try:
+                setattr(user, _CONTEXT_ATTR, context)
+            except AttributeError:
+                pass
+        return context
+
+    @classmethod
+    def clear(cls, user):
+        """
+        إزالة السياق المخزّن (مثلاً بعد تعديل أدوار المستخدم داخل نفس الطلب)
+        """
+        if user is not None and hasattr(user, _CONTEXT_ATTR):
+            delattr(user, _CONTEXT_ATTR)
+
+    @property
+    def profile_scope(self):
+        """
+        نطاق UserProfile القديم (branch_id, department_id, section_id) أو None
+        يُحمّل عند أول حاجة فقط (fallback في can_access)
+        """
+        if self._profile_scope is self._UNLOADED:
+            from ohsms.models import UserProfile
+
+            profile = None
+            if self.user_id:
+                profile = (
+                    UserProfile.objects
+                    .filter(user_id=self.user_id)
+                    .values_list("branch_id", "department_id", "section_id")
+                    .first()
+                )
+            self._profile_scope = tuple(profile) if profile else None
+        return self._profile_scope
+
+    # =========================
+    # Checks
+    # =========================
+
+    def has_role(self, role_code: str) -> bool:
+        return role_code in self.role_codes
+
+    def has_any_role(self, role_codes) -> bool:
+        return not self.role_codes.isdisjoint(role_codes)
+
+    def _matching_grants(self, *, role_code=None, branch=None, department=None, section=None):
+        """
+        نفس منطق الفلترة القديم: القسم ثم الإدارة ثم الفرع (الأدق أولاً)
+        """
+        section_id = _pk(section)
+        department_id = _pk(department)
+        branch_id = _pk(branch)
+
+        for grant in self.grants:
+            if role_code and grant.role_code != role_code:
+                continue
+
+            if section_id:
+                if grant.section_id != section_id:
+                    continue
+            elif department_id:
+                if grant.department_id != department_id:
+                    continue
+            elif branch_id:
+                if grant.branch_id != branch_id:
+                    continue
+
+            yield grant
+
+    def covers(self, *, branch_id=None, department_id=None, section_id=None) -> bool:
+        """
+        هل سجل مرتبط بهذه العقد التنظيمية داخل نطاقات المستخدم؟ (بدون استعلام)
+        نفس منطق compile_scope_predicate لمسار واحد على الذاكرة؛ مسارات الآباء
+        للموديلات غير المكتملة (Risk / FormTemplate) يمررها ScopedQuerySet.is_visible
+        """
+        if self.is_global:
+            return True
+
+        branches, departments, sections = self._scope_sets
+        return (
+            (branch_id is not None and branch_id in branches)
+            or (department_id is not None and department_id in departments)
+            or (section_id is not None and section_id in sections)
+        )
+
+    def has_scope(self, *, branch=None, department=None, section=None) -> bool:
+        if self.is_global:
+            return True
+
+        return any(
+            True for _ in self._matching_grants(
+                branch=branch,
+                department=department,
+                section=section,
+            )
+        )
+
+    def can_access(self, *, role_code=None, branch=None, department=None, section=None) -> bool:
+        if self.is_global:
+            return True
+
+        if any(
+            True for _ in self._matching_grants(
+                role_code=role_code,
+                branch=branch,
+                department=department,
+                section=section,
+            )
+        ):
+            return True
+
+        # fallback مؤقت لـ UserProfile (للأنظمة القديمة)
+        if (section or department or branch) and self.profile_scope:
+            p_branch, p_department, p_section = self.profile_scope
+
+            if section and p_section == _pk(section):
+                return True
+            if department and p_department == _pk(department):
+                return True
+            if branch and p_branch == _pk(branch):
+                return True
+
+        return False
+
+
+# =====================================================
+# Middleware
+# =====================================================
+
+class AuthorizationContextMiddleware:
+    """
+    يربط request.authz بسياق صلاحيات المستخدم (تحميل كسول عند أول استخدام)
+
+    يجب أن يأتي بعد AuthenticationMiddleware.
+    ويثبّت OrgTree للطلب (قراءة إصدار الشجرة مرة واحدة مهما كان عدد الصفوف)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from ohsms.services.org_tree import OrgTree
+
+        request.authz = SimpleLazyObject(
+            lambda: AuthorizationContext.for_user(getattr(request, "user", None))
+        )
+        with OrgTree.request_scope():
+            return self.get_response(request)
@@ -0,0 +1,50 @@
+import time
+
+from django.core.cache import cache
+
+# =====================================================
+# Versioned cache namespaces
+# =====================================================
+
+_VERSION_KEY = "ohsms:version:{name}"
+
+
+def get_version(name: str) -> int:
+    """
+    رقم الإصدار الحالي لمجال كاش معيّن (permissions / org_tree ...)
+
+    القيمة الابتدائية مبنية على الوقت، حتى لا يعود العداد لقيمة قديمة
+    إذا حُذف المفتاح من الكاش (eviction) فيُقرأ كاش منتهي الصلاحية.
+    """
+    key = _VERSION_KEY.format(name=name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(names) -> dict:
+    """
+    نفس get_version لعدة مجالات في رحلة واحدة للكاش (get_many)
+    """
+    keys = {_VERSION_KEY.format(name=name): name for name in names}
+    found = cache.get_many(list(keys))
+
+    versions = {}
+    for key, name in keys.items():
+        version = found.get(key)
+        versions[name] = version if version is not None else get_version(name)
+    return versions
+
+
+def bump_version(name: str) -> int:
+    """
+    إبطال كل الكاش المرتبط بهذا المجال (عبر كل الـ workers عند استخدام كاش مشترك)
+    """
+    key = _VERSION_KEY.format(name=name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        return cache.get(key)
@@ -0,0 +1,116 @@
+import math
+
+# =====================================================
+# Fixed log-scale histogram (mergeable sketch)
+# =====================================================
+#
+# - كل قيمة تُحوّل إلى رقم شريحة ثابت (لا يعتمد على البيانات)
+# - دمج أي عدد من الملخصات = جمع العدادات لكل شريحة (SUM ... GROUP BY bucket)
+# - النسب المئوية تُقدّر من العدادات بخطأ نسبي ≤ (GROWTH - 1)
+
+
+class LogHistogram:
+    """
+    شرائح لوغاريتمية: الشريحة 0 = [0, MIN_VALUE)، ثم كل شريحة أكبر بـ GROWTH
+
+    مثال (الافتراضي للمدد بالثواني): من دقيقة حتى ~سنة بخطأ نسبي ≤ 25%
+    """
+
+    def __init__(self, min_value=60.0, growth=1.25, max_buckets=64):
+        self.min_value = float(min_value)
+        self.growth = float(growth)
+        self.max_buckets = max_buckets
+        self._log_growth = math.log(self.growth)
+
+    def bucket(self, value) -> int:
+        if value is None or value < self.min_value:
+            return 0
+        index = int(math.log(value / self.min_value) / self._log_growth) + 1
+        return min(index, self.max_buckets - 1)
+
+    def bounds(self, bucket):
+        """
+        (الحد الأدنى، الحد الأعلى) للشريحة
+        """
+        if bucket <= 0:
+            return (0.0, self.min_value)
+        low = self.min_value * self.growth ** (bucket - 1)
+        return (low, low * self.growth)
+
+    def representative(self, bucket) -> float:
+        """
+        قيمة تمثيلية للشريحة (الوسط الهندسي - يقلل الخطأ النسبي)
+        """
+        low, high = self.bounds(bucket)
+        if low == 0:
+            return high / 2
+        return math.sqrt(low * high)
+
+    @staticmethod
+    def merge(*counts):
+        """
+        دمج عدة ملخصات {bucket: count}
+        """
+        merged = {}
+        for summary in counts:
+            for bucket, count in summary.items():
+                merged[bucket] = merged.get(bucket, 0) + count
+        return merged
+
+    def percentiles(self, counts, quantiles=(0.5, 0.9, 0.99)):
+        """
+        {bucket: count} → {"p50": value, ...} (None إذا كان الملخص فارغًا)
+        """
+        return self._quantiles(
+            [(self.representative(bucket), counts[bucket]) for bucket in sorted(counts)],
+            quantiles,
+            digits=1,
+        )
+
+    # =========================
+    # Signed values (إجابات رقمية قد تكون سالبة)
+    # =========================
+
+    def signed_bucket(self, value) -> int:
+        """
+        مثل bucket() مع القيم السالبة: الشريحة -n هي انعكاس الشريحة n
+        """
+        if value is not None and value < 0:
+            return -self.bucket(-value)
+        return self.bucket(value)
+
+    def signed_percentiles(self, counts, quantiles=(0.5, 0.9, 0.99)):
+        values = sorted(
+            (-self.representative(-bucket) if bucket < 0 else self.representative(bucket), count)
+            for bucket, count in counts.items()
+        )
+        return self._quantiles(values, quantiles, digits=2)
+
+    @staticmethod
+    def _quantiles(values, quantiles, digits):
+        """
+        values: [(قيمة تمثيلية، عدد)] مرتبة تصاعديًا
+        """
+        total = sum(count for _, count in values)
+        result = {}
+        for q in quantiles:
+            name = f"p{round(q * 100):g}"
+            if total == 0:
+                result[name] = None
+                continue
+
+            rank = q * total
+            running = 0
+            for value, count in values:
+                running += count
+                if running >= rank:
+                    result[name] = round(value, digits)
+                    break
+        return result
+
+
+# مدد الاستجابة بالثواني (الاستلام / الإغلاق)
+DURATION_HISTOGRAM = LogHistogram()
+
+# إجابات الحقول الرقمية في النماذج: من 0.01 حتى ~10^10 (والسالبة بالانعكاس)
+NUMBER_HISTOGRAM = LogHistogram(min_value=0.01, growth=1.25, max_buckets=128)
@@ -0,0 +1,188 @@
+import functools
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from ohsms.core.histogram import LogHistogram
+
+logger = logging.getLogger("ohsms.instrumentation")
+
+# =====================================================
+# Per-call instrumentation (queries / DB time / Python time / rows)
+# =====================================================
+#
+# - instrument(name): context manager يلتف حول استعلامات هذا الخيط فقط
+#   (execute_wrapper على اتصالات الخيط الحالي) - يصلح داخل مجمع الخيوط
+# - القياسات المتداخلة مسموحة: الداخلية تُسجّل وحدها والخارجية تشملها
+# - كل قياس: سطر JSON في السجل + نافذة متحركة في الذاكرة (snapshot)
+# - الميزانيات (OHSMS_DASHBOARD_BUDGETS) تُسجّل تحذيرًا عند تجاوزها:
+#   {"dashboard.snapshot": {"queries": 8, "total_ms": 300}, ...}
+
+# زمن بالملّي ثانية: من 1ms بخطأ نسبي ≤ 25%
+TIMING_HISTOGRAM = LogHistogram(min_value=1.0, growth=1.25)
+
+_METRICS = ("queries", "db_ms", "python_ms", "total_ms", "rows")
+
+_lock = threading.Lock()
+_windows = {}
+
+
+class _Measurement:
+    def __init__(self, name):
+        self.name = name
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+
+    def wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += time.perf_counter() - start
+
+
+class _Window:
+    """
+    آخر N قياس لاسم واحد + مدرّج total_ms متحرك (يُطرح القياس الخارج من النافذة)
+    """
+
+    def __init__(self, size):
+        self.samples = deque(maxlen=size)
+        self.buckets = {}
+        self.calls = 0
+        self.budget_violations = 0
+
+    def add(self, sample):
+        if len(self.samples) == self.samples.maxlen:
+            evicted = TIMING_HISTOGRAM.bucket(self.samples[0]["total_ms"])
+            self.buckets[evicted] -= 1
+            if not self.buckets[evicted]:
+                del self.buckets[evicted]
+
+        self.samples.append(sample)
+        bucket = TIMING_HISTOGRAM.bucket(sample["total_ms"])
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.calls += 1
+
+    def summary(self):
+        count = len(self.samples)
+        averages = {
+            f"avg_{metric}": round(sum(s[metric] for s in self.samples) / count, 2) if count else None
+            for metric in _METRICS
+        }
+        return {
+            "calls": self.calls,
+            "window": count,
+            "budget_violations": self.budget_violations,
+            "total_ms": TIMING_HISTOGRAM.percentiles(self.buckets),
+            "max_queries": max((s["queries"] for s in self.samples), default=None),
+            **averages,
+        }
+
+
+def count_rows(value):
+    """
+    عدد الصفوف في النتيجة: عناصر كل القوائم (بدون تقييم QuerySet كسول)
+    """
+    if isinstance(value, dict):
+        return sum(count_rows(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return len(value) + sum(count_rows(item) for item in value if isinstance(item, (dict, list, tuple)))
+    return 0
+
+
+def _check_budget(sample, window):
+    budget = getattr(settings, "OHSMS_DASHBOARD_BUDGETS", {}).get(sample["name"])
+    if not budget:
+        return
+
+    exceeded = {
+        metric: {"value": sample[metric], "budget": limit}
+        for metric, limit in budget.items()
+        if metric in sample and sample[metric] > limit
+    }
+    if exceeded:
+        window.budget_violations += 1
+        logger.warning(json.dumps(
+            {"event": "budget_exceeded", "name": sample["name"], "exceeded": exceeded},
+            ensure_ascii=False,
+        ))
+
+
+def record(sample):
+    size = getattr(settings, "OHSMS_INSTRUMENTATION_WINDOW", 500)
+    with _lock:
+        window = _windows.get(sample["name"])
+        if window is None:
+            window = _windows[sample["name"]] = _Window(size)
+        window.add(sample)
+        _check_budget(sample, window)
+
+    logger.info(json.dumps({"event": "timing", **sample}, ensure_ascii=False))
+
+
+@contextmanager
+def instrument(name):
+    """
+    with instrument("dashboard.kpis") as m:
+        result = ...
+        m.rows = count_rows(result)   # اختياري
+    """
+    if not getattr(settings, "OHSMS_INSTRUMENTATION_ENABLED", True):
+        yield _Measurement(name)
+        return
+
+    measurement = _Measurement(name)
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(measurement.wrapper))
+        try:
+            yield measurement
+        finally:
+            total_ms = (time.perf_counter() - start) * 1000
+            db_ms = measurement.db_seconds * 1000
+            record({
+                "name": name,
+                "queries": measurement.queries,
+                "db_ms": round(db_ms, 2),
+                "python_ms": round(max(total_ms - db_ms, 0.0), 2),
+                "total_ms": round(total_ms, 2),
+                "rows": measurement.rows,
+            })
+
+
+def instrumented(name):
+    """
+    نفس instrument() كـ decorator (يوضع تحت @staticmethod)، ويحسب صفوف النتيجة
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with instrument(name) as measurement:
+                result = func(*args, **kwargs)
+                measurement.rows = count_rows(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    """
+    ملخص النوافذ الحالية لكل الأسماء (لنقطة المراقبة الخاصة بالموظفين)
+    """
+    with _lock:
+        return {name: window.summary() for name, window in sorted(_windows.items())}
+
+
+def reset():
+    with _lock:
+        _windows.clear()
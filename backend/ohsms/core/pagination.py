@@ -0,0 +1,197 @@
+import base64
+import json
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Q
+
+from ohsms.core.errors import ValidationFailed
+
+# =====================================================
+# Keyset (cursor) pagination
+# =====================================================
+
+NEXT = "n"
+PREV = "p"
+
+KeysetPage = namedtuple(
+    "KeysetPage",
+    ["items", "sort", "next_cursor", "prev_cursor", "page_size", "estimated_total"],
+)
+
+
+def _split(field):
+    """
+    "-created_at" → ("created_at", True)
+    """
+    return (field[1:], True) if field.startswith("-") else (field, False)
+
+
+INVALID_CURSOR = "مؤشر الصفحة غير صالح"
+
+
+def encode_cursor(values, direction, sort):
+    """
+    المؤشر يحمل مفتاح الترتيب الذي أُنشئ عليه (القيم لا معنى لها على ترتيب آخر)
+    """
+    raw = json.dumps([direction, sort, values], separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    يُرجع (direction, sort, values)، أو None بدون مؤشر
+
+    مؤشر تالف → ValidationFailed (400) بدلاً من عرض الصفحة الأولى بصمت
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        direction, sort, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValidationFailed(message=INVALID_CURSOR, details={"cursor": cursor})
+    if direction not in (NEXT, PREV) or not isinstance(sort, str) or not isinstance(values, list):
+        raise ValidationFailed(message=INVALID_CURSOR, details={"cursor": cursor})
+    return direction, sort, values
+
+
+class KeysetPaginator:
+    """
+    ترقيم صفحات بالمؤشر على ترتيب ثابت (آخر حقل دائماً id)
+
+    - كل صفحة = استعلام واحد WHERE (ترتيب) > المؤشر ORDER BY ... LIMIT n+1
+      → زمن الصفحة لا يعتمد على حجم الجدول (بدون OFFSET ولا COUNT)
+    - sort_options: {"newest": ("-created_at", "-id"), ...}
+    - مؤشر من ترتيب آخر أو تالف → ValidationFailed (الواجهة تعيد 400)
+    """
+
+    MAX_PAGE_SIZE = 200
+    ESTIMATE_CAP = 10000
+
+    def __init__(self, queryset, sort_options, default_sort, page_size=50):
+        self.queryset = queryset
+        self.sort_options = sort_options
+        self.default_sort = default_sort
+        self.page_size = max(1, min(int(page_size), self.MAX_PAGE_SIZE))
+
+    # =========================
+    # Ordering helpers
+    # =========================
+
+    def _ordering(self, sort):
+        return self.sort_options.get(sort) or self.sort_options[self.default_sort]
+
+    def _cursor_values(self, obj, ordering):
+        return [getattr(obj, _split(field)[0]) for field in ordering]
+
+    def _parse_values(self, values, ordering):
+        """
+        تحويل قيم المؤشر من JSON إلى أنواع الحقول (datetime / int ...)
+        """
+        if len(values) != len(ordering):
+            raise ValueError("cursor does not match ordering")
+
+        model = self.queryset.model
+        parsed = []
+        for field, value in zip(ordering, values):
+            name, _ = _split(field)
+            model_field = model._meta.get_field(name)
+            parsed.append(None if value is None else model_field.to_python(value))
+        return parsed
+
+    @staticmethod
+    def _after(ordering, values, reverse=False):
+        """
+        الشرط المعجمي "بعد المؤشر" حسب الترتيب:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        q = Q()
+        equal = Q()
+        for field, value in zip(ordering, values):
+            name, desc = _split(field)
+            lookup = "lt" if desc != reverse else "gt"
+            q |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+        return q
+
+    @staticmethod
+    def _reversed(ordering):
+        return tuple(field[1:] if field.startswith("-") else f"-{field}" for field in ordering)
+
+    # =========================
+    # Page
+    # =========================
+
+    def page(self, cursor=None, sort=None, with_total=False):
+        sort = sort if sort in self.sort_options else self.default_sort
+        ordering = self._ordering(sort)
+
+        qs = self.queryset
+        direction, values = NEXT, None
+
+        decoded = decode_cursor(cursor)
+        if decoded is not None:
+            direction, cursor_sort, raw_values = decoded
+            if cursor_sort != sort:
+                raise ValidationFailed(
+                    message="مؤشر الصفحة لا يطابق الترتيب المطلوب",
+                    details={"cursor_sort": cursor_sort, "sort": sort},
+                )
+            try:
+                values = self._parse_values(raw_values, ordering)
+            except (ValueError, ValidationError):
+                raise ValidationFailed(message=INVALID_CURSOR, details={"cursor": cursor})
+
+        if values is not None:
+            qs = qs.filter(self._after(ordering, values, reverse=(direction == PREV)))
+
+        if direction == PREV:
+            rows = list(qs.order_by(*self._reversed(ordering))[: self.page_size + 1])
+            has_more = len(rows) > self.page_size
+            items = rows[: self.page_size][::-1]
+            has_next, has_prev = values is not None, has_more
+        else:
+            rows = list(qs.order_by(*ordering)[: self.page_size + 1])
+            has_more = len(rows) > self.page_size
+            items = rows[: self.page_size]
+            has_next, has_prev = has_more, values is not None
+
+        next_cursor = prev_cursor = None
+        if items:
+            if has_next:
+                next_cursor = encode_cursor(self._cursor_values(items[-1], ordering), NEXT, sort)
+            if has_prev:
+                prev_cursor = encode_cursor(self._cursor_values(items[0], ordering), PREV, sort)
+
+        return KeysetPage(
+            items=items,
+            sort=sort,
+            next_cursor=next_cursor,
+            prev_cursor=prev_cursor,
+            page_size=self.page_size,
+            estimated_total=self.estimate_total() if with_total else None,
+        )
+
+    def estimate_total(self):
+        """
+        عدد تقريبي للسجلات (اختياري - لا يُحسب إلا عند الطلب)
+
+        - PostgreSQL: تقدير المخطط من EXPLAIN (بدون مسح)
+        - غير ذلك: COUNT محدود بـ ESTIMATE_CAP (يُعرض "+10000" عند التجاوز)
+        يُرجع (count, is_exact)
+        """
+        qs = self.queryset.order_by()
+
+        if connection.vendor == "postgresql":
+            sql, params = qs.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]["Plan"]["Plan Rows"]), False
+
+        count = qs[: self.ESTIMATE_CAP + 1].count()
+        return min(count, self.ESTIMATE_CAP), count <= self.ESTIMATE_CAP
@@ -0,0 +1,149 @@
+import hashlib
+import threading
+import time
+
+from django.core.cache import cache
+
+# =====================================================
+# Single-flight (request coalescing) + stale-while-revalidate
+# =====================================================
+#
+# - داخل العملية: قفل لكل مفتاح، فالطلبات المتزامنة تنتظر حسابًا واحدًا
+# - بين العمليات: lease في الكاش المشترك (cache.add)، ومن لا يملكه ينتظر النتيجة
+#   الـ lease لكل (مفتاح × بصمة) ولا يُحذف بل ينتهي بعد lease_timeout: واجهة الكاش
+#   لا توفر حذفًا مشروطًا ذريًا، وget ثم delete قد يحذف lease طلب آخر بعد انتهاء
+#   lease الحالي. بعد الإبطال تتغير البصمة فيُستخدم lease جديد مباشرة
+# - stale-while-revalidate: القيمة القديمة تُعاد فورًا أثناء تحديثها من طلب واحد
+#
+# المدخل المخزّن: {"value", "tag", "fresh_until"}
+# tag: بصمة البيانات (مثل إصدارات الكاش) - تغيّرها يجعل المدخل قديمًا لا مفقودًا
+
+_LEASE_KEY = "{key}:lease:{tag}"
+
+_locks_guard = threading.Lock()
+_locks = {}
+
+
+class _KeyLock:
+    """
+    قفل لكل مفتاح مع عدّاد استخدام (يُحذف من القاموس عند آخر مستخدم)
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = 0
+
+
+def _acquire_local(key, blocking=True):
+    with _locks_guard:
+        entry = _locks.get(key)
+        if entry is None:
+            entry = _locks[key] = _KeyLock()
+        entry.users += 1
+
+    if entry.lock.acquire(blocking):
+        return entry
+
+    with _locks_guard:
+        entry.users -= 1
+        if entry.users == 0:
+            _locks.pop(key, None)
+    return None
+
+
+def _release_local(key, entry):
+    entry.lock.release()
+    with _locks_guard:
+        entry.users -= 1
+        if entry.users == 0:
+            _locks.pop(key, None)
+
+
+def _is_fresh(entry, tag):
+    return (
+        entry is not None
+        and entry.get("tag") == tag
+        and entry.get("fresh_until", 0) > time.time()
+    )
+
+
+def peek(key, tag=None):
+    """
+    المدخل المخزّن إذا كان حديثًا لهذه البصمة (بدون حساب) وإلا None
+    - لبناء ETag من القيمة التي ستُعاد فعلًا وليس من الإصدارات الحالية
+    """
+    entry = cache.get(key)
+    return entry if _is_fresh(entry, tag) else None
+
+
+def _store(key, value, tag, ttl, stale_ttl):
+    cache.set(
+        key,
+        {"value": value, "tag": tag, "fresh_until": time.time() + ttl},
+        ttl + stale_ttl,
+    )
+
+
+def _acquire_lease(key, tag, lease_timeout) -> bool:
+    digest = hashlib.sha1(repr(tag).encode()).hexdigest()[:12]
+    return cache.add(_LEASE_KEY.format(key=key, tag=digest), True, lease_timeout)
+
+
+def single_flight(
+    key,
+    compute,
+    *,
+    tag=None,
+    ttl=300,
+    stale_ttl=0,
+    lease_timeout=30,
+    wait_timeout=10.0,
+    poll_interval=0.05,
+):
+    """
+    إرجاع قيمة المفتاح من الكاش، أو حسابها مرة واحدة فقط مهما كان عدد الطالبين
+
+    - مدخل حديث (نفس tag وضمن ttl) → يُعاد مباشرة
+    - مدخل قديم (ضمن stale_ttl) → يُعاد فورًا، وطلب واحد فقط يعيد الحساب
+    - لا مدخل → طلب واحد يحسب (lease)، والباقي ينتظر حتى wait_timeout
+      ثم يحسب بنفسه كحل أخير (lease منتهي / كاش غير مشترك)
+
+    lease_timeout أقصر من ttl: انتهاء صلاحية المدخل بالوقت (نفس البصمة)
+    يجد lease الحساب السابق منتهيًا
+    """
+    entry = cache.get(key)
+    if _is_fresh(entry, tag):
+        return entry["value"]
+
+    # مدخل قديم وخيط آخر في نفس العملية يحدّثه → القيمة القديمة بدون انتظار
+    local = _acquire_local(key, blocking=entry is None)
+    if local is None:
+        return entry["value"]
+
+    try:
+        # ربما انتهى طلب آخر في نفس العملية أثناء انتظار القفل
+        entry = cache.get(key)
+        if _is_fresh(entry, tag):
+            return entry["value"]
+
+        leased = _acquire_lease(key, tag, lease_timeout)
+
+        if not leased and entry is not None:
+            # عملية أخرى تُحدّث القيمة الآن → القيمة القديمة
+            return entry["value"]
+
+        if not leased:
+            deadline = time.monotonic() + wait_timeout
+            while time.monotonic() < deadline:
+                time.sleep(poll_interval)
+                entry = cache.get(key)
+                if _is_fresh(entry, tag):
+                    return entry["value"]
+                if _acquire_lease(key, tag, lease_timeout):
+                    break
+
+        value = compute()
+        _store(key, value, tag, ttl, stale_ttl)
+        return value
+    finally:
+        _release_local(key, local)
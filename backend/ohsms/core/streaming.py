@@ -0,0 +1,182 @@
+import csv
+import re
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+
+# =====================================================
+# Streaming writers (CSV / XLSX)
+# =====================================================
+#
+# الهدف: ذاكرة ثابتة مهما كان عدد الصفوف
+# - كل مولّد يُرجع bytes على دفعات صغيرة (لـ StreamingHttpResponse)
+# - لا يُحمّل أي ملف كامل في الذاكرة
+
+
+class _Echo:
+    """
+    "ملف" وهمي لـ csv.writer: write تُرجع السطر بدل تخزينه
+    """
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(header, rows):
+    """
+    CSV سطر بسطر (مع BOM حتى يقرأ Excel العربية بشكل صحيح)
+    """
+    writer = csv.writer(_Echo())
+    yield "\ufeff" + writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(["" if value is None else value for value in row])
+
+
+class _ChunkBuffer:
+    """
+    مخرج غير قابل للـ seek لـ zipfile: يجمع البايتات ثم تُسحب بـ drain()
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '{sheets}'
+    '</Types>'
+)
+_SHEET_CONTENT_TYPE = (
+    '<Override PartName="/xl/worksheets/sheet{n}.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets>{sheets}</sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '{rels}'
+    '</Relationships>'
+)
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetViews><sheetView workbookViewId="0" rightToLeft="1"/></sheetViews>'
+    '<sheetData>'
+)
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+
+# محارف تحكم غير مسموحة في XML 1.0 (حتى لو هُرّبت) → تُحذف من النص
+_XML_ILLEGAL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _xml_text(value):
+    return escape(_XML_ILLEGAL.sub("", str(value)))
+
+
+def _cell(value):
+    if value is None or value == "":
+        return "<c/>"
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f"<c><v>{value}</v></c>"
+    if isinstance(value, (datetime, date)):
+        value = value.isoformat(sep=" ", timespec="seconds") if isinstance(value, datetime) else value.isoformat()
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{_xml_text(value)}</t></is></c>'
+
+
+def _row(values):
+    return "<row>" + "".join(_cell(v) for v in values) + "</row>"
+
+
+def stream_xlsx(sheets, flush_rows=500):
+    """
+    ملف XLSX بسيط (inline strings، بدون أنماط) يُكتب أثناء الإرسال
+
+    sheets: [(title, header, rows_iterable), ...]
+    يُستخدم zipfile مع مخرج غير قابل للـ seek، فلا يُحمّل الملف كاملاً.
+    """
+    buffer = _ChunkBuffer()
+
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        count = len(sheets)
+
+        archive.writestr(
+            "[Content_Types].xml",
+            _CONTENT_TYPES.format(
+                sheets="".join(_SHEET_CONTENT_TYPE.format(n=n) for n in range(1, count + 1))
+            ),
+        )
+        archive.writestr("_rels/.rels", _ROOT_RELS)
+        archive.writestr(
+            "xl/workbook.xml",
+            _WORKBOOK.format(sheets="".join(
+                f'<sheet name="{_xml_text(title[:31])}" sheetId="{n}" r:id="rId{n}"/>'
+                for n, (title, _, _) in enumerate(sheets, start=1)
+            )),
+        )
+        archive.writestr(
+            "xl/_rels/workbook.xml.rels",
+            _WORKBOOK_RELS.format(rels="".join(
+                f'<Relationship Id="rId{n}" '
+                f'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+                f'Target="worksheets/sheet{n}.xml"/>'
+                for n in range(1, count + 1)
+            )),
+        )
+        yield buffer.drain()
+
+        for n, (_, header, rows) in enumerate(sheets, start=1):
+            # force_zip64: الحجم غير معروف مسبقاً (قد يتجاوز 2GB)
+            with archive.open(f"xl/worksheets/sheet{n}.xml", "w", force_zip64=True) as sheet:
+                sheet.write((_SHEET_HEAD + _row(header)).encode())
+
+                pending = []
+                for row in rows:
+                    pending.append(_row(row))
+                    if len(pending) >= flush_rows:
+                        sheet.write("".join(pending).encode())
+                        pending = []
+                        yield buffer.drain()
+
+                sheet.write(("".join(pending) + _SHEET_TAIL).encode())
+            yield buffer.drain()
+
+    yield buffer.drain()
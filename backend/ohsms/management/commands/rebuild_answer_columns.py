@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from ohsms.services.form_versions import FormVersionService
+
+
+class Command(BaseCommand):
+    help = "إعادة تعبئة الأعمدة المصنّفة لإجابات النماذج (رقم / تاريخ / نعم-لا / خيار)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=FormVersionService.BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        total = FormVersionService.rebuild_typed_columns(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"FormAnswer: {total} rows rebuilt"))
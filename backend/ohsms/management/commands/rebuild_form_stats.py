@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from ohsms.services.form_stats import FormStatsService
+
+
+class Command(BaseCommand):
+    help = "إعادة بناء إحصاءات حقول النماذج اليومية (FormFieldDailyStat) من الإجابات"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=FormStatsService.BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        total = FormStatsService.rebuild(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"FormFieldDailyStat: {total} rows rebuilt"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from ohsms.services.incident_access import IncidentAccessService
+
+
+class Command(BaseCommand):
+    help = "إعادة بناء جدول رؤية البلاغات (IncidentAccess) بالكامل"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=IncidentAccessService.BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        total = IncidentAccessService.rebuild(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"IncidentAccess: {total} rows rebuilt"))
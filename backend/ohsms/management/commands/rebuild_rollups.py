@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from ohsms.services.rollups import RollupService
+
+
+class Command(BaseCommand):
+    help = "إعادة بناء جداول التجميع اليومية للوحة المؤشرات (البلاغات والمخاطر ومدد الاستجابة)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=RollupService.BATCH_SIZE,
+            help="عدد الصفوف في كل دفعة إدخال",
+        )
+
+    def handle(self, *args, **options):
+        incident_rows, risk_rows, response_rows = RollupService.rebuild(batch_size=options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"IncidentDailyRollup: {incident_rows} rows | RiskDailyRollup: {risk_rows} rows"
+                f" | IncidentResponseRollup: {response_rows} rows"
+            )
+        )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from ohsms.services.status_durations import StatusDurationService
+
+
+class Command(BaseCommand):
+    help = "إعادة بناء جدول مدد البقاء في الحالات (IncidentStatusSpan) من سجل الأحداث"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=StatusDurationService.BATCH_SIZE,
+        )
+        parser.add_argument(
+            "--python",
+            action="store_true",
+            help="المرور المرتب في Python بدل دوال النافذة (LAG/LEAD)",
+        )
+
+    def handle(self, *args, **options):
+        total = StatusDurationService.rebuild(
+            batch_size=options["batch_size"],
+            use_window=False if options["python"] else None,
+        )
+        self.stdout.write(self.style.SUCCESS(f"IncidentStatusSpan: {total} rows rebuilt"))
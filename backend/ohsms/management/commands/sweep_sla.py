@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from ohsms.services.sla import SlaService
+
+
+class Command(BaseCommand):
+    help = "تصعيد البلاغات التي تجاوزت مواعيد SLA (للتشغيل الدوري عبر cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=SlaService.BATCH_SIZE,
+            help="عدد البلاغات في كل معاملة",
+        )
+        parser.add_argument(
+            "--actor",
+            default=getattr(settings, "OHSMS_SYSTEM_USERNAME", "system"),
+            help="اسم مستخدم النظام الذي تُسجّل باسمه أحداث التصعيد",
+        )
+
+    def handle(self, *args, **options):
+        actor, _ = get_user_model().objects.get_or_create(
+            username=options["actor"],
+            defaults={"is_active": False},
+        )
+
+        total = SlaService.sweep(actor=actor, batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"SLA escalations: {total}"))
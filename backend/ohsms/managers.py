@@ -0,0 +1,278 @@
+from functools import lru_cache
+
+from django.db import models
+from django.db.models import Q
+
+
+# =====================================================
+# Scope predicate compiler
+# =====================================================
+
+@lru_cache(maxsize=1024)
+def compile_scope_predicate(scope_signature, denormalized: bool = True):
+    """
+    بناء شرط Q واحد من توقيع النطاقات (branch_ids, department_ids, section_ids)
+
+    - ثلاث شروط IN كحد أقصى بدل OR لكل سطر UserRole
+    - denormalized=True: الموديل يخزن الفرع والإدارة والقسم معاً (مثل Incident)
+    - denormalized=False: قد يُعبّأ مستوى واحد فقط (Risk / FormTemplate)
+      فنضيف المسارات عبر العلاقات حتى لا يضيع سجل مربوط بقسم فقط
+
+    يُخزّن الناتج لكل توقيع، فالمستخدمون بنفس النطاقات يشتركون في نفس الشرط.
+    يُرجع None إذا لم يكن هناك أي نطاق.
+    """
+    branch_ids, department_ids, section_ids = scope_signature
+
+    q = Q()
+
+    if branch_ids:
+        q |= Q(branch_id__in=branch_ids)
+        if not denormalized:
+            q |= Q(department__branch_id__in=branch_ids)
+            q |= Q(section__department__branch_id__in=branch_ids)
+
+    if department_ids:
+        q |= Q(department_id__in=department_ids)
+        if not denormalized:
+            q |= Q(section__department_id__in=department_ids)
+
+    if section_ids:
+        q |= Q(section_id__in=section_ids)
+
+    return q or None
+
+
+def restrict_to_scope(queryset, context, denormalized: bool = True):
+    """
+    تطبيق نطاقات سياق الصلاحيات على أي QuerySet له branch / department / section
+    (بدون الرؤية المباشرة الخاصة بالمستخدم - للتجميعات المشتركة بين نفس النطاقات)
+
+    context=None أو دور عالمي → بدون تقييد
+    """
+    if context is None or context.is_global:
+        return queryset
+
+    q = compile_scope_predicate(context.scope_signature, denormalized)
+    if q is None:
+        return queryset.none()
+    return queryset.filter(q)
+
+
+# =====================================================
+# Scoped QuerySets
+# =====================================================
+
+class ScopedQuerySet(models.QuerySet):
+    """
+    QuerySet لموديلات مرتبطة بالهيكل التنظيمي (branch / department / section)
+    """
+
+    # هل الفرع والإدارة والقسم معبأة دائماً معاً؟
+    scope_denormalized = False
+
+    def _authorization_context(self, user):
+        from ohsms.core.authorization import AuthorizationContext
+
+        return AuthorizationContext.for_user(user)
+
+    def scope_predicate(self, user):
+        """
+        شرط النطاق فقط (بدون أي رؤية مباشرة)
+        """
+        context = self._authorization_context(user)
+        return compile_scope_predicate(
+            context.scope_signature,
+            self.scope_denormalized,
+        )
+
+    def extra_visibility(self, user):
+        """
+        شروط رؤية إضافية خاصة بالموديل (تُعاد كتابتها في الفئات الفرعية)
+        """
+        return None
+
+    def extra_visibility_for(self, user, obj) -> bool:
+        """
+        نفس extra_visibility لكن على كائن محمّل (بدون استعلام)
+        """
+        return False
+
+    def is_visible(self, user, obj, context=None) -> bool:
+        """
+        المقابل في الذاكرة لـ visible_to(user) لكائن واحد
+        """
+        if not user or not getattr(user, "is_authenticated", False):
+            return False
+
+        context = context or self._authorization_context(user)
+
+        branch_id = getattr(obj, "branch_id", None)
+        department_id = getattr(obj, "department_id", None)
+        section_id = getattr(obj, "section_id", None)
+
+        paths = [(branch_id, department_id, section_id)]
+
+        if not self.scope_denormalized:
+            # نفس مسارات compile_scope_predicate(denormalized=False) من الشجرة المخزنة:
+            # department__branch_id / section__department_id / section__department__branch_id
+            # (القيم المخزنة تبقى مسارًا مستقلًا ولا تُستبدل بآباء القسم)
+            from ohsms.services.org_tree import OrgTree
+
+            tree = OrgTree.current()
+            if department_id is not None:
+                paths.append(tree.ancestors(OrgTree.DEPARTMENT, department_id))
+            if section_id is not None:
+                paths.append(tree.ancestors(OrgTree.SECTION, section_id))
+
+        if any(
+            context.covers(branch_id=branch, department_id=department, section_id=section)
+            for branch, department, section in paths
+        ):
+            return True
+
+        return self.extra_visibility_for(user, obj)
+
+    def visible_to(self, user):
+        """
+        السجلات التي يحق للمستخدم رؤيتها حسب RBAC:
+        - غير مسجل دخول → لا شيء
+        - دور عالمي → الكل
+        - غير ذلك → نطاقاته (بعد إسقاط المغطى) + الرؤية الخاصة بالموديل
+        """
+        if not user or not getattr(user, "is_authenticated", False):
+            return self.none()
+
+        if self._authorization_context(user).is_global:
+            return self.all()
+
+        q = self.scope_predicate(user)
+
+        extra = self.extra_visibility(user)
+        if extra is not None:
+            q = extra if q is None else (q | extra)
+
+        if q is None:
+            return self.none()
+
+        return self.filter(q)
+
+
+class IncidentQuerySet(ScopedQuerySet):
+    scope_denormalized = True
+
+    def visible_to(self, user):
+        """
+        الرؤية عبر جدول IncidentAccess: semi-join واحد على الفهرس
+        (principal, incident) بدل OR + DISTINCT على جدول البلاغات
+        """
+        if not user or not getattr(user, "is_authenticated", False):
+            return self.none()
+
+        if self._authorization_context(user).is_global:
+            return self.all()
+
+        from ohsms.services.incident_access import IncidentAccessService
+
+        return self.filter(id__in=IncidentAccessService.visible_incident_ids(user))
+
+    def extra_visibility(self, user):
+        # رؤية مباشرة: منشئ البلاغ أو المحال إليه
+        return Q(actor_id=user.pk) | Q(assigned_to_id=user.pk)
+
+    def extra_visibility_for(self, user, obj) -> bool:
+        return user.pk is not None and user.pk in (obj.actor_id, obj.assigned_to_id)
+
+
+class RiskQuerySet(ScopedQuerySet):
+    pass
+
+
+class FormTemplateQuerySet(ScopedQuerySet):
+
+    def extra_visibility(self, user):
+        # النماذج العامة متاحة لكل مستخدم مسجل
+        return Q(visibility="public")
+
+    def extra_visibility_for(self, user, obj) -> bool:
+        return obj.visibility == "public"
+
+
+class FormFieldQuerySet(models.QuerySet):
+    """
+    الكتابة الجماعية على الحقول لا تُطلق post_save (ohsms.signals.invalidate_form_schema)
+    → إصدار مخطط جديد هنا لكل نموذج متأثر، حتى لا يبقى مخطط مترجم قديم بنفس الإصدار
+    """
+
+    @staticmethod
+    def _bump(forms):
+        """
+        forms: {form_id: FormTemplate المحمّل أو None}
+        """
+        from ohsms.services.form_schema import FormSchema
+
+        for form_id in sorted(forms):
+            FormSchema.bump(form_id, forms[form_id])
+
+    def _forms_of(self, objs) -> dict:
+        forms = {}
+        for obj in objs:
+            cached = obj.form if self.model.form.is_cached(obj) else None
+            if forms.get(obj.form_id) is None:
+                forms[obj.form_id] = cached
+        return forms
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        self._bump(self._forms_of(objs))
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        # كل دفعة تمر من update() أدناه (رفع الإصدار) → تحديث النماذج المحمّلة فقط
+        objs = list(objs)
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        for form in self._forms_of(objs).values():
+            if form is not None:
+                form.refresh_from_db(fields=["schema_version"])
+        return rows
+
+    def update(self, **kwargs):
+        forms = dict.fromkeys(self.values_list("form_id", flat=True).distinct())
+        rows = super().update(**kwargs)
+
+        # نقل حقول إلى نموذج آخر يغيّر مخطط النموذج الجديد أيضًا
+        target = kwargs.get("form_id", kwargs.get("form"))
+        target = getattr(target, "pk", target)
+        if rows and target is not None:
+            forms.setdefault(target, None)
+
+        self._bump(forms)
+        return rows
+
+
+class FormSubmissionQuerySet(models.QuerySet):
+    """
+    تصفية التقديمات حسب الإجابات على الأعمدة المصنّفة لـ FormAnswer
+
+    كل where_answer() = JOIN مستقل على الإجابات بشرط (field_id + عمود النوع)
+    → مسح مدى على الفهرس الجزئي للحقل بدل قراءة كل الإجابات وتحويلها في بايثون.
+    إجابة واحدة لكل حقل في التقديم، فلا تتكرر الصفوف مع تعدد الشروط.
+
+        FormSubmission.objects.filter(form=form)
+            .submitted_between(start, end)
+            .where_answer(temperature, "gt", 40)
+            .where_answer(exit_ok, "eq", "لا")
+    """
+
+    def submitted_between(self, start=None, end=None):
+        qs = self
+        if start is not None:
+            qs = qs.filter(submitted_at__gte=start)
+        if end is not None:
+            qs = qs.filter(submitted_at__lt=end)
+        return qs
+
+    def where_answer(self, field, op, value):
+        from ohsms.services.form_schema import answer_lookup
+
+        # filter() منفصل لكل شرط → JOIN خاص به على العلاقة متعددة القيم
+        return self.filter(**answer_lookup(field, op, value))
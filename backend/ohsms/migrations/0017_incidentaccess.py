@@ -0,0 +1,55 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_incident_access(apps, schema_editor):
+    Incident = apps.get_model("ohsms", "Incident")
+    IncidentAccess = apps.get_model("ohsms", "IncidentAccess")
+
+    batch = []
+    rows = Incident.objects.values_list(
+        "id", "actor_id", "assigned_to_id", "branch_id", "department_id", "section_id"
+    ).iterator(chunk_size=2000)
+
+    for incident_id, actor_id, assigned_to_id, branch_id, department_id, section_id in rows:
+        principals = {
+            f"{prefix}:{value}"
+            for prefix, value in (
+                ("u", actor_id),
+                ("u", assigned_to_id),
+                ("b", branch_id),
+                ("d", department_id),
+                ("s", section_id),
+            )
+            if value
+        }
+        batch += [IncidentAccess(incident_id=incident_id, principal=p) for p in principals]
+
+        if len(batch) >= 2000:
+            IncidentAccess.objects.bulk_create(batch)
+            batch = []
+
+    if batch:
+        IncidentAccess.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ohsms', '0016_formsubmission_incident'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IncidentAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('principal', models.CharField(max_length=32, verbose_name='صاحب الصلاحية')),
+                ('incident', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access_entries', to='ohsms.incident', verbose_name='البلاغ')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('principal', 'incident'), name='ohsms_incidentaccess_principal_incident_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_incident_access, migrations.RunPython.noop),
+    ]
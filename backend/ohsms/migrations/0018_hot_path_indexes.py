@@ -0,0 +1,41 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ohsms', '0017_incidentaccess'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='formevent',
+            index=models.Index(fields=['created_at', 'action'], name='ohsms_formevent_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='incident',
+            index=models.Index(fields=['created_at', 'incident_type'], name='ohsms_inc_created_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='incident',
+            index=models.Index(fields=['status', 'created_at'], name='ohsms_inc_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='incident',
+            index=models.Index(condition=models.Q(('status__in', ('new', 'received', 'assigned', 'in_progress', 'escalated', 'open', 'pending_reporter_confirmation'))), fields=['section', 'created_at'], name='ohsms_inc_open_section_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='incidentevent',
+            index=models.Index(fields=['incident', 'created_at'], name='ohsms_incevent_inc_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='risk',
+            index=models.Index(fields=['risk_score'], name='ohsms_risk_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='risk',
+            index=models.Index(fields=['created_at'], name='ohsms_risk_created_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ohsms', '0018_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='incident',
+            index=models.Index(fields=['created_at', 'id'], name='ohsms_inc_created_id_idx'),
+        ),
+    ]
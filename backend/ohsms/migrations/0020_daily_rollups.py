@@ -0,0 +1,47 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ohsms', '0019_incident_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IncidentDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='اليوم')),
+                ('incident_type', models.CharField(max_length=20, verbose_name='نوع البلاغ')),
+                ('status', models.CharField(max_length=50, verbose_name='الحالة')),
+                ('count', models.IntegerField(default=0, verbose_name='العدد')),
+                ('branch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ohsms.branch', verbose_name='الفرع')),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ohsms.department', verbose_name='الإدارة')),
+                ('section', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ohsms.section', verbose_name='القسم')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'branch', 'department', 'section', 'incident_type', 'status'), name='ohsms_incrollup_key_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RiskDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='اليوم')),
+                ('band', models.CharField(choices=[('low', 'منخفض'), ('medium', 'متوسط'), ('high', 'مرتفع')], max_length=10, verbose_name='شريحة التقييم')),
+                ('status', models.CharField(max_length=20, verbose_name='الحالة')),
+                ('count', models.IntegerField(default=0, verbose_name='العدد')),
+                ('branch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ohsms.branch', verbose_name='الفرع')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ohsms.riskcategory', verbose_name='فئة الخطر')),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ohsms.department', verbose_name='الإدارة')),
+                ('section', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ohsms.section', verbose_name='القسم')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'branch', 'department', 'section', 'category', 'band', 'status'), name='ohsms_riskrollup_key_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ohsms', '0020_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IncidentResponseRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='اليوم')),
+                ('incident_type', models.CharField(max_length=20, verbose_name='نوع البلاغ')),
+                ('metric', models.CharField(choices=[('receive', 'زمن الاستلام'), ('close', 'زمن الإغلاق')], max_length=10, verbose_name='المقياس')),
+                ('bucket', models.PositiveSmallIntegerField(verbose_name='الشريحة')),
+                ('count', models.IntegerField(default=0, verbose_name='العدد')),
+                ('branch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ohsms.branch', verbose_name='الفرع')),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ohsms.department', verbose_name='الإدارة')),
+                ('section', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ohsms.section', verbose_name='القسم')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'branch', 'department', 'section', 'incident_type', 'metric', 'bucket'), name='ohsms_incresp_key_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ohsms', '0021_incident_response_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IncidentStatusSpan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('incident_type', models.CharField(max_length=20, verbose_name='نوع البلاغ')),
+                ('status', models.CharField(max_length=50, verbose_name='الحالة')),
+                ('entered_at', models.DateTimeField(verbose_name='دخول الحالة')),
+                ('exited_at', models.DateTimeField(blank=True, null=True, verbose_name='الخروج من الحالة')),
+                ('duration_seconds', models.FloatField(blank=True, null=True, verbose_name='المدة (ثانية)')),
+                ('bucket', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='الشريحة')),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ohsms.branch', verbose_name='الفرع')),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ohsms.department', verbose_name='الإدارة')),
+                ('incident', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_spans', to='ohsms.incident', verbose_name='البلاغ')),
+                ('section', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ohsms.section', verbose_name='القسم')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['exited_at', 'status'], name='ohsms_incspan_exited_idx'), models.Index(condition=models.Q(('exited_at__isnull', True)), fields=['status', 'entered_at'], name='ohsms_incspan_open_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('exited_at__isnull', True)), fields=('incident',), name='ohsms_incspan_one_open_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ohsms', '0022_incident_status_spans'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IncidentSlaPolicy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('incident_type', models.CharField(choices=[('normal', 'بلاغ عادي'), ('urgent', 'بلاغ عاجل'), ('secret', 'بلاغ سري')], max_length=20, unique=True, verbose_name='نوع البلاغ')),
+                ('receive_minutes', models.PositiveIntegerField(blank=True, null=True, verbose_name='مهلة الاستلام (دقيقة)')),
+                ('resolve_minutes', models.PositiveIntegerField(blank=True, null=True, verbose_name='مهلة المعالجة (دقيقة)')),
+                ('is_active', models.BooleanField(default=True, verbose_name='مفعّلة')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='incident',
+            name='receive_breached_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='تاريخ تجاوز موعد الاستلام'),
+        ),
+        migrations.AddField(
+            model_name='incident',
+            name='receive_due_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='موعد الاستلام (SLA)'),
+        ),
+        migrations.AddField(
+            model_name='incident',
+            name='resolve_breached_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='تاريخ تجاوز موعد المعالجة'),
+        ),
+        migrations.AddField(
+            model_name='incident',
+            name='resolve_due_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='موعد المعالجة (SLA)'),
+        ),
+        migrations.AddField(
+            model_name='incident',
+            name='sla_due_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='الموعد المعلّق التالي (SLA)'),
+        ),
+        migrations.AddIndex(
+            model_name='incident',
+            index=models.Index(condition=models.Q(('sla_due_at__isnull', False)), fields=['sla_due_at'], name='ohsms_inc_sla_due_idx'),
+        ),
+    ]
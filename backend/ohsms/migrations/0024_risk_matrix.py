@@ -0,0 +1,50 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ohsms', '0023_incident_sla'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='riskdailyrollup',
+            name='band',
+            field=models.CharField(max_length=10, verbose_name='شريحة التقييم'),
+        ),
+        migrations.CreateModel(
+            name='RiskMatrix',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='اسم المصفوفة')),
+                ('severity_levels', models.PositiveSmallIntegerField(default=5, verbose_name='مستويات الشدة')),
+                ('likelihood_levels', models.PositiveSmallIntegerField(default=5, verbose_name='مستويات الاحتمالية')),
+                ('is_active', models.BooleanField(default=True, verbose_name='مفعّلة')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الإنشاء')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('is_active',), name='ohsms_riskmatrix_one_active_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RiskMatrixBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=10, verbose_name='الرمز')),
+                ('label', models.CharField(max_length=50, verbose_name='الاسم')),
+                ('min_score', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='من تقييم')),
+                ('max_score', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='إلى تقييم')),
+                ('color', models.CharField(default='#9e9e9e', max_length=7, verbose_name='اللون')),
+                ('order', models.PositiveSmallIntegerField(default=0, verbose_name='الترتيب')),
+                ('matrix', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='ohsms.riskmatrix', verbose_name='المصفوفة')),
+            ],
+            options={
+                'ordering': ['order', 'min_score'],
+                'constraints': [models.UniqueConstraint(fields=('matrix', 'code'), name='ohsms_riskmatrixband_code_uniq')],
+            },
+        ),
+    ]
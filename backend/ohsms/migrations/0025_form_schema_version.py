@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ohsms', '0024_risk_matrix'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='formtemplate',
+            name='schema_version',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='إصدار الحقول'),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:53
+
+import django.db.models.deletion
+import re
+
+from django.db import migrations, models
+
+
+def pin_existing_submissions(apps, schema_editor):
+    """
+    التقديمات السابقة → إصدار من الحقول الحالية (أفضل ما هو متاح)
+    """
+    FormTemplate = apps.get_model("ohsms", "FormTemplate")
+    FormField = apps.get_model("ohsms", "FormField")
+    FormSubmission = apps.get_model("ohsms", "FormSubmission")
+    FormTemplateVersion = apps.get_model("ohsms", "FormTemplateVersion")
+
+    forms = FormTemplate.objects.filter(
+        id__in=FormSubmission.objects.values("form_id")
+    ).values_list("id", "title", "schema_version")
+
+    for form_id, title, schema_version in forms.iterator(chunk_size=500):
+        fields = []
+        rows = FormField.objects.filter(form_id=form_id).order_by("order", "id").values_list(
+            "id", "label", "field_type", "is_required", "order", "options"
+        )
+        for pk, label, field_type, is_required, order, options in rows:
+            choices = []
+            if field_type in ("select", "radio"):
+                choices = list(dict.fromkeys(
+                    option.strip() for option in re.split(r"[,،]", options or "") if option.strip()
+                ))
+            fields.append({
+                "id": pk,
+                "label": label,
+                "field_type": field_type,
+                "is_required": is_required,
+                "order": order,
+                "choices": choices,
+            })
+
+        version = FormTemplateVersion.objects.create(
+            form_id=form_id,
+            version=schema_version,
+            schema={"title": title, "fields": fields},
+        )
+        FormSubmission.objects.filter(form_id=form_id, template_version__isnull=True).update(
+            template_version=version
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ohsms', '0025_form_schema_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='formanswer',
+            name='field',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='ohsms.formfield', verbose_name='الحقل'),
+        ),
+        migrations.CreateModel(
+            name='FormTemplateVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(verbose_name='الإصدار')),
+                ('schema', models.JSONField(verbose_name='الحقول')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الإنشاء')),
+                ('form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versions', to='ohsms.formtemplate', verbose_name='النموذج')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='formsubmission',
+            name='template_version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='submissions', to='ohsms.formtemplateversion', verbose_name='إصدار النموذج'),
+        ),
+        migrations.AddConstraint(
+            model_name='formtemplateversion',
+            constraint=models.UniqueConstraint(fields=('form', 'version'), name='ohsms_formver_uniq'),
+        ),
+        migrations.RunPython(pin_existing_submissions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ohsms', '0026_form_template_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='formanswer',
+            name='value_bool',
+            field=models.BooleanField(blank=True, null=True, verbose_name='قيمة نعم/لا'),
+        ),
+        migrations.AddField(
+            model_name='formanswer',
+            name='value_date',
+            field=models.DateField(blank=True, null=True, verbose_name='قيمة تاريخ'),
+        ),
+        migrations.AddField(
+            model_name='formanswer',
+            name='value_number',
+            field=models.FloatField(blank=True, null=True, verbose_name='قيمة رقمية'),
+        ),
+        migrations.AddField(
+            model_name='formanswer',
+            name='value_option',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='الخيار'),
+        ),
+        migrations.AddIndex(
+            model_name='formanswer',
+            index=models.Index(condition=models.Q(('value_number__isnull', False)), fields=['field', 'value_number', 'submission'], name='ohsms_formans_num_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='formanswer',
+            index=models.Index(condition=models.Q(('value_date__isnull', False)), fields=['field', 'value_date', 'submission'], name='ohsms_formans_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='formanswer',
+            index=models.Index(condition=models.Q(('value_bool__isnull', False)), fields=['field', 'value_bool', 'submission'], name='ohsms_formans_bool_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='formanswer',
+            index=models.Index(condition=models.Q(('value_option__isnull', False)), fields=['field', 'value_option', 'submission'], name='ohsms_formans_option_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='formsubmission',
+            index=models.Index(fields=['form', 'submitted_at'], name='ohsms_formsub_form_time_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.9 on 2026-10-18 11:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ohsms', '0027_form_answer_typed_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FormFieldDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='اليوم')),
+                ('metric', models.CharField(choices=[('answered', 'إجابات'), ('option', 'خيار'), ('number', 'رقم'), ('number_bucket', 'شريحة رقم'), ('date', 'تاريخ')], max_length=20, verbose_name='المقياس')),
+                ('key', models.CharField(blank=True, default='', max_length=255, verbose_name='المفتاح')),
+                ('count', models.IntegerField(default=0, verbose_name='العدد')),
+                ('total', models.FloatField(default=0, verbose_name='المجموع')),
+                ('min_value', models.FloatField(blank=True, null=True, verbose_name='الأدنى')),
+                ('max_value', models.FloatField(blank=True, null=True, verbose_name='الأعلى')),
+                ('field', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='ohsms.formfield', verbose_name='الحقل')),
+                ('form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ohsms.formtemplate', verbose_name='النموذج')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['form', 'day'], name='ohsms_formstat_form_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('field', 'day', 'metric', 'key'), name='ohsms_formstat_key_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+from django.db import migrations
+
+# كما كانت وقت الترحيل (SlaService.DEFAULT_POLICIES و حالات models)
+DEFAULT_POLICIES = {
+    "urgent": (60, 24 * 60),
+    "secret": (4 * 60, 3 * 24 * 60),
+    "normal": (24 * 60, 7 * 24 * 60),
+}
+OPEN_STATUSES = ("new", "received", "assigned", "in_progress", "escalated", "open")
+AWAITING_STATUSES = ("new", "open")
+BATCH_SIZE = 2000
+
+
+def backfill_incident_sla(apps, schema_editor):
+    """
+    مواعيد SLA للبلاغات المفتوحة المنشأة قبل 0023 (محسوبة من created_at)
+
+    البلاغات التي تجاوزت مواعيدها تُصعّد في أول تشغيل لـ sweep_sla
+    """
+    Incident = apps.get_model("ohsms", "Incident")
+    IncidentSlaPolicy = apps.get_model("ohsms", "IncidentSlaPolicy")
+
+    policies = dict(DEFAULT_POLICIES)
+    policies.update(
+        (incident_type, (receive_minutes, resolve_minutes))
+        for incident_type, receive_minutes, resolve_minutes in IncidentSlaPolicy.objects.filter(
+            is_active=True
+        ).values_list("incident_type", "receive_minutes", "resolve_minutes")
+    )
+
+    def due(start, minutes):
+        return start + timedelta(minutes=minutes) if minutes else None
+
+    pending_incidents = (
+        Incident.objects
+        .filter(
+            status__in=OPEN_STATUSES,
+            receive_due_at__isnull=True,
+            resolve_due_at__isnull=True,
+        )
+        .only("id", "incident_type", "status", "created_at")
+        .order_by("id")
+    )
+
+    # دفعات بالمعرّف (لا تحديث للجدول أثناء المرور عليه بمؤشر مفتوح)
+    last_id = 0
+    while True:
+        batch = list(pending_incidents.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+
+        for incident in batch:
+            receive_minutes, resolve_minutes = policies.get(incident.incident_type, (None, None))
+            incident.receive_due_at = due(incident.created_at, receive_minutes)
+            incident.resolve_due_at = due(incident.created_at, resolve_minutes)
+
+            pending = [incident.resolve_due_at]
+            if incident.status in AWAITING_STATUSES:
+                pending.append(incident.receive_due_at)
+            pending = [value for value in pending if value is not None]
+            incident.sla_due_at = min(pending) if pending else None
+
+        Incident.objects.bulk_update(batch, ["receive_due_at", "resolve_due_at", "sla_due_at"])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ohsms', '0028_form_field_daily_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_incident_sla, migrations.RunPython.noop),
+    ]
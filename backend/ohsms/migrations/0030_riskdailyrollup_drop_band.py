@@ -0,0 +1,59 @@
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def merge_bands(apps, schema_editor):
+    """
+    دمج صفوف نفس المفتاح التي تختلف في الشريحة فقط قبل حذف العمود
+    """
+    RiskDailyRollup = apps.get_model("ohsms", "RiskDailyRollup")
+
+    counts = Counter()
+    rows = RiskDailyRollup.objects.values_list(
+        "day", "branch_id", "department_id", "section_id", "category_id", "status", "count",
+    ).iterator(chunk_size=2000)
+    for *key, count in rows:
+        counts[tuple(key)] += count
+
+    RiskDailyRollup.objects.all().delete()
+    RiskDailyRollup.objects.bulk_create(
+        (
+            RiskDailyRollup(
+                day=day,
+                branch_id=branch_id,
+                department_id=department_id,
+                section_id=section_id,
+                category_id=category_id,
+                band="",
+                status=status,
+                count=total,
+            )
+            for (day, branch_id, department_id, section_id, category_id, status), total in counts.items()
+            if total > 0
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ohsms', '0029_backfill_incident_sla'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_bands, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='riskdailyrollup',
+            name='ohsms_riskrollup_key_uniq',
+        ),
+        migrations.RemoveField(
+            model_name='riskdailyrollup',
+            name='band',
+        ),
+        migrations.AddConstraint(
+            model_name='riskdailyrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'branch', 'department', 'section', 'category', 'status'), name='ohsms_riskrollup_key_uniq'),
+        ),
+    ]
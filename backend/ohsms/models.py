@@ -1,5 +1,10 @@
 from django.db import models
 
+from ohsms.core.errors import ValidationFailed
+from ohsms.managers import (
+    IncidentQuerySet, RiskQuerySet, FormTemplateQuerySet, FormFieldQuerySet, FormSubmissionQuerySet,
+)
+
 
 class Branch(models.Model):
     name = models.CharField(max_length=200, verbose_name="اسم الفرع")
@@ -18,7 +23,11 @@ class Department(models.Model):
     name = models.CharField(max_length=200, verbose_name="اسم الإدارة")
 
     def __str__(self):
-        return f"{self.branch} - {self.name}"
+        # المسار الكامل من الشجرة المخزنة (بدون استعلام للفرع)
+        from ohsms.services.org_tree import OrgTree
+
+        label = OrgTree.current().label(OrgTree.DEPARTMENT, self.pk)
+        return label or f"{self.branch} - {self.name}"
 
 
 class Section(models.Model):
@@ -31,7 +40,30 @@ class Section(models.Model):
     name = models.CharField(max_length=200, verbose_name="اسم القسم")
 
     def __str__(self):
-        return f"{self.department} - {self.name}"
+        # المسار الكامل من الشجرة المخزنة (بدون استعلامين للإدارة والفرع)
+        from ohsms.services.org_tree import OrgTree
+
+        label = OrgTree.current().label(OrgTree.SECTION, self.pk)
+        return label or f"{self.department} - {self.name}"
+
+
+# الحالات غير المنتهية للبلاغ (تُستخدم في الفهرس الجزئي للبلاغات المفتوحة)
+INCIDENT_OPEN_STATUSES = (
+    'new',
+    'received',
+    'assigned',
+    'in_progress',
+    'escalated',
+    'open',
+    'pending_reporter_confirmation',
+)
+
+# بانتظار الاستلام (لم تبدأ معالجتها بعد)
+INCIDENT_AWAITING_STATUSES = (
+    'new',
+    'open',
+)
+
 
 class Incident(models.Model):
     INCIDENT_TYPES = [
@@ -42,11 +74,19 @@ class Incident(models.Model):
     ]
 
     STATUS_CHOICES = [
-        ('open', 'مفتوح'),
+        ('new', 'بلاغ جديد'),
+        ('received', 'تم الاستلام'),
+        ('assigned', 'تمت الإحالة'),
         ('in_progress', 'قيد المعالجة'),
+        ('resolved', 'تمت المعالجة'),
         ('closed', 'مغلق'),
+        ('escalated', 'مصعّد'),
+        ('open', 'مفتوح (توافق)'),
+        ('pending_reporter_confirmation', 'بانتظار موافقة المبلّغ'),
     ]
 
+    OPEN_STATUSES = INCIDENT_OPEN_STATUSES
+
     branch = models.ForeignKey(Branch, on_delete=models.CASCADE, verbose_name="الفرع")
     department = models.ForeignKey(Department, on_delete=models.CASCADE, verbose_name="الإدارة")
     section = models.ForeignKey(Section, on_delete=models.CASCADE, verbose_name="القسم")
@@ -54,23 +94,24 @@ class Incident(models.Model):
     title = models.CharField(max_length=200, verbose_name="عنوان البلاغ")
     description = models.TextField(verbose_name="وصف البلاغ")
     incident_type = models.CharField(max_length=20, choices=INCIDENT_TYPES, verbose_name="نوع البلاغ")
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open', verbose_name="الحالة")
+    status = models.CharField(max_length=50, choices=STATUS_CHOICES, default='open', verbose_name="الحالة")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="تاريخ الإنشاء")
-secret_key = models.CharField(
-    max_length=64,
-    unique=True,
-    null=True,
-    blank=True,
-    verbose_name="مفتاح متابعة البلاغ السري"
-)
 
-handled_at = models.DateTimeField(
-    null=True,
-    blank=True,
-    verbose_name="تاريخ بدء المعالجة"
-)
+    secret_key = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        verbose_name="مفتاح متابعة البلاغ السري"
+    )
 
-actor = models.ForeignKey(
+    handled_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="تاريخ بدء المعالجة"
+    )
+
+    actor = models.ForeignKey(
         "auth.User",
         null=True,
         blank=True,
@@ -78,19 +119,120 @@ actor = models.ForeignKey(
         verbose_name="تم بواسطة"
     )
 
+    risks = models.ManyToManyField(
+        "Risk",
+        blank=True,
+        related_name="incidents",
+        verbose_name="المخاطر المرتبطة"
+    )
+
+    assigned_to = models.ForeignKey(
+        "auth.User",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="assigned_incidents",
+        verbose_name="المحال إليه"
+    )
+
+    assigned_by = models.ForeignKey(
+        "auth.User",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="assigned_by_incidents",
+        verbose_name="أُحيل بواسطة"
+    )
+
+    assigned_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="تاريخ الإحالة"
+    )
+
+    executor = models.ForeignKey(
+        "auth.User",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="executed_incidents",
+        verbose_name="منفّذ الإجراء التصحيحي"
+    )
+
+    # =========================
+    # SLA (ohsms.services.sla)
+    # =========================
+
+    receive_due_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="موعد الاستلام (SLA)"
+    )
+
+    resolve_due_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="موعد المعالجة (SLA)"
+    )
+
+    receive_breached_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="تاريخ تجاوز موعد الاستلام"
+    )
+
+    resolve_breached_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="تاريخ تجاوز موعد المعالجة"
+    )
 
+    # أقرب موعد لم يُتجاوز بعد للمرحلة الحالية (NULL = لا شيء معلّق)
+    sla_due_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="الموعد المعلّق التالي (SLA)"
+    )
+
+    objects = IncidentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # نطاقات التاريخ في لوحة المؤشرات + التجميع حسب النوع/الحالة
+            models.Index(fields=["created_at", "incident_type"], name="ohsms_inc_created_type_idx"),
+            models.Index(fields=["status", "created_at"], name="ohsms_inc_status_created_idx"),
+            # ترقيم الصفحات بالمؤشر (created_at, id)
+            models.Index(fields=["created_at", "id"], name="ohsms_inc_created_id_idx"),
+            # البلاغات المفتوحة حسب القسم (فهرس جزئي)
+            models.Index(
+                fields=["section", "created_at"],
+                name="ohsms_inc_open_section_idx",
+                condition=models.Q(status__in=INCIDENT_OPEN_STATUSES),
+            ),
+            # مُجمّع SLA: أقرب موعد معلّق فقط (فهرس جزئي بدون البلاغات المنتهية/المصعّدة)
+            # فحص المتأخرة = مسح نطاق sla_due_at <= الآن: كلفة بحجم التجاوزات لا البلاغات
+            models.Index(
+                fields=["sla_due_at"],
+                name="ohsms_inc_sla_due_idx",
+                condition=models.Q(sla_due_at__isnull=False),
+            ),
+        ]
+
+    @property
+    def location_label(self):
+        """
+        "الفرع - الإدارة - القسم" من الشجرة المخزنة (بدون N+1 في القوالب والتصدير)
+        """
+        from ohsms.services.org_tree import OrgTree
+
+        return OrgTree.current().label(OrgTree.SECTION, self.section_id)
 
-def __str__(self):
+    def __str__(self):
         return self.title
 class IncidentEvent(models.Model):
     ACTION_CHOICES = [
         ('create', 'إنشاء'),
-        ('receive', 'استلام'),
-        ('assign', 'إحالة'),
-        ('forward', 'تحويل'),
-        ('progress', 'قيد المعالجة'),
-        ('close', 'إغلاق'),
-        ('escalate', 'تصعيد'),
+        ('status_change', 'تغيير حالة'),
         ('note', 'ملاحظة'),
     ]
 
@@ -102,19 +244,21 @@ class IncidentEvent(models.Model):
     )
 
     action = models.CharField(
-        max_length=20,
+        max_length=50,
         choices=ACTION_CHOICES,
         verbose_name="الإجراء"
     )
 
     from_status = models.CharField(
-        max_length=20,
-        verbose_name="الحالة السابقة"
+        max_length=50,
+        blank=True,
+        verbose_name="من حالة"
     )
 
     to_status = models.CharField(
-        max_length=20,
-        verbose_name="الحالة الحالية"
+        max_length=50,
+        blank=True,
+        verbose_name="إلى حالة"
     )
 
     note = models.TextField(
@@ -124,16 +268,159 @@ class IncidentEvent(models.Model):
 
     actor = models.CharField(
         max_length=200,
-        verbose_name="تم بواسطة"
+        verbose_name="المنفذ"
     )
 
     created_at = models.DateTimeField(
         auto_now_add=True,
-        verbose_name="التاريخ"
+        verbose_name="تاريخ الحدث"
     )
 
+    class Meta:
+        indexes = [
+            # السجل الزمني لبلاغ واحد مرتبًا (بدون ترتيب إضافي)
+            models.Index(fields=["incident", "created_at"], name="ohsms_incevent_inc_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.incident} | {self.action}"
+
+
+class IncidentAccess(models.Model):
+    """
+    جدول رؤية البلاغات (ACL) - يُحدّث تلقائيًا مع البلاغ
+
+    principal:
+    - u:<user_id>        منشئ البلاغ / المحال إليه
+    - b:<branch_id>      الفرع
+    - d:<department_id>  الإدارة
+    - s:<section_id>     القسم
+
+    نطاقات المستخدم تتحول لنفس الصيغة من AuthorizationContext،
+    فالرؤية = semi-join واحد على الفهرس (principal, incident).
+    """
+
+    incident = models.ForeignKey(
+        Incident,
+        on_delete=models.CASCADE,
+        related_name="access_entries",
+        verbose_name="البلاغ"
+    )
+
+    principal = models.CharField(
+        max_length=32,
+        verbose_name="صاحب الصلاحية"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["principal", "incident"],
+                name="ohsms_incidentaccess_principal_incident_uniq",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.incident_id} | {self.principal}"
+
+
+class IncidentSlaPolicy(models.Model):
+    """
+    سياسة SLA لكل نوع بلاغ (بالدقائق) - فارغ = بدون موعد لتلك المرحلة
+    الأنواع بدون سياسة تستخدم SlaService.DEFAULT_POLICIES
+    """
+
+    incident_type = models.CharField(
+        max_length=20,
+        choices=Incident.INCIDENT_TYPES,
+        unique=True,
+        verbose_name="نوع البلاغ"
+    )
+
+    receive_minutes = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="مهلة الاستلام (دقيقة)"
+    )
+
+    resolve_minutes = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="مهلة المعالجة (دقيقة)"
+    )
+
+    is_active = models.BooleanField(default=True, verbose_name="مفعّلة")
+
+    def __str__(self):
+        return f"{self.incident_type} | {self.receive_minutes} / {self.resolve_minutes}"
+
+
+class IncidentStatusSpan(models.Model):
+    """
+    مدة بقاء البلاغ في كل حالة (فترة لكل انتقال حالة في IncidentEvent)
+
+    - exited_at = NULL → الحالة الحالية للبلاغ (فترة مفتوحة)
+    - يُحدّث تزايديًا مع كل حدث جديد ويُعاد بناؤه بـ: manage.py rebuild_status_spans
+    - الفرع/الإدارة/القسم/النوع منسوخة من البلاغ لتقارير الاختناقات بدون join
+    """
+
+    incident = models.ForeignKey(
+        Incident,
+        on_delete=models.CASCADE,
+        related_name="status_spans",
+        verbose_name="البلاغ"
+    )
+
+    branch = models.ForeignKey(
+        Branch,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="الفرع"
+    )
+    department = models.ForeignKey(
+        Department,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="الإدارة"
+    )
+    section = models.ForeignKey(
+        Section,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="القسم"
+    )
+    incident_type = models.CharField(max_length=20, verbose_name="نوع البلاغ")
+
+    status = models.CharField(max_length=50, verbose_name="الحالة")
+    entered_at = models.DateTimeField(verbose_name="دخول الحالة")
+    exited_at = models.DateTimeField(null=True, blank=True, verbose_name="الخروج من الحالة")
+
+    duration_seconds = models.FloatField(null=True, blank=True, verbose_name="المدة (ثانية)")
+    # شريحة المدة في DURATION_HISTOGRAM (للنسب المئوية بالتجميع)
+    bucket = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name="الشريحة")
+
+    class Meta:
+        indexes = [
+            # الفترات المنتهية ضمن مدة زمنية (تقارير الاختناقات)
+            models.Index(fields=["exited_at", "status"], name="ohsms_incspan_exited_idx"),
+            # البلاغات العالقة حاليًا في كل حالة
+            models.Index(
+                fields=["status", "entered_at"],
+                name="ohsms_incspan_open_idx",
+                condition=models.Q(exited_at__isnull=True),
+            ),
+        ]
+        constraints = [
+            # فترة مفتوحة واحدة فقط لكل بلاغ
+            models.UniqueConstraint(
+                fields=["incident"],
+                condition=models.Q(exited_at__isnull=True),
+                name="ohsms_incspan_one_open_uniq",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.incident_id} | {self.status} | {self.duration_seconds}"
 # =========================
 # Risk Management Models
 # =========================
@@ -286,6 +573,24 @@ class Risk(models.Model):
         verbose_name="تاريخ الإدخال"
     )
 
+    reference = models.ForeignKey(
+        "RiskReference",
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="scoped_risks",
+        verbose_name="مرجع الخطر (Reference)"
+    )
+
+    objects = RiskQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # شرائح التقييم (منخفض / متوسط / مرتفع)
+            models.Index(fields=["risk_score"], name="ohsms_risk_score_idx"),
+            models.Index(fields=["created_at"], name="ohsms_risk_created_idx"),
+        ]
+
     def save(self, *args, **kwargs):
         # حساب تقييم الخطر تلقائيًا
         self.risk_score = self.severity * self.likelihood
@@ -315,6 +620,166 @@ class RiskNote(models.Model):
 
     def __str__(self):
         return f"ملاحظة على: {self.risk}"
+
+
+class RiskReference(models.Model):
+    """
+    سجل المخاطر العام (مرجعي) - تُشتق منه المخاطر حسب النطاق
+    """
+
+    title = models.CharField(max_length=200, verbose_name="عنوان الخطر (مرجعي)")
+    description = models.TextField(verbose_name="وصف الخطر (مرجعي)")
+
+    category = models.ForeignKey(
+        RiskCategory,
+        on_delete=models.PROTECT,
+        verbose_name="الفئة الرئيسية"
+    )
+    sub_category = models.ForeignKey(
+        RiskSubCategory,
+        on_delete=models.PROTECT,
+        verbose_name="الفئة الفرعية"
+    )
+    cause = models.ForeignKey(
+        RiskCause,
+        on_delete=models.PROTECT,
+        verbose_name="السبب"
+    )
+
+    affected_groups = models.ManyToManyField(
+        AffectedGroup,
+        blank=True,
+        verbose_name="الفئات المتأثرة (مرجعي)"
+    )
+
+    default_severity = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="الشدة الافتراضية"
+    )
+    default_likelihood = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="الاحتمالية الافتراضية"
+    )
+
+    corrective_action = models.TextField(blank=True, verbose_name="الإجراء التصحيحي (مرجعي)")
+    preventive_action = models.TextField(blank=True, verbose_name="الإجراء الوقائي (مرجعي)")
+
+    is_active = models.BooleanField(default=True, verbose_name="مفعل")
+
+    created_by = models.CharField(max_length=200, verbose_name="أُدخل بواسطة")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="تاريخ الإدخال")
+
+    def __str__(self):
+        return self.title
+
+
+class RiskEvent(models.Model):
+    ACTION_CHOICES = [
+        ('create', 'إنشاء'),
+        ('submit', 'تقديم'),
+        ('approve', 'اعتماد'),
+        ('reject', 'رفض'),
+        ('start_handling', 'بدء المعالجة'),
+        ('close', 'إغلاق'),
+        ('link_incident', 'ربط بلاغ'),
+        ('unlink_incident', 'فك ربط بلاغ'),
+    ]
+
+    risk = models.ForeignKey(
+        Risk,
+        on_delete=models.CASCADE,
+        related_name="events",
+        verbose_name="الخطر"
+    )
+
+    action = models.CharField(
+        max_length=50,
+        choices=ACTION_CHOICES,
+        verbose_name="الإجراء"
+    )
+
+    from_status = models.CharField(max_length=50, blank=True, verbose_name="من حالة")
+    to_status = models.CharField(max_length=50, blank=True, verbose_name="إلى حالة")
+
+    actor = models.ForeignKey(
+        "auth.User",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        verbose_name="المنفذ"
+    )
+
+    payload = models.JSONField(default=dict, blank=True, verbose_name="بيانات إضافية")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="تاريخ الحدث")
+
+    class Meta:
+        ordering = ["created_at"]
+
+    def __str__(self):
+        return f"{self.risk} | {self.action}"
+
+
+class RiskMatrix(models.Model):
+    """
+    مصفوفة تقييم المخاطر (الشدة × الاحتمالية) - مصفوفة واحدة مفعّلة فقط
+
+    تعديل الشرائح يغيّر تصنيف المخاطر في اللوحات مباشرة؛ جداول التجميع اليومية
+    تحتفظ بالشريحة وقت الإدخال حتى تشغيل: manage.py rebuild_rollups
+    """
+
+    name = models.CharField(max_length=100, verbose_name="اسم المصفوفة")
+
+    severity_levels = models.PositiveSmallIntegerField(default=5, verbose_name="مستويات الشدة")
+    likelihood_levels = models.PositiveSmallIntegerField(default=5, verbose_name="مستويات الاحتمالية")
+
+    is_active = models.BooleanField(default=True, verbose_name="مفعّلة")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="تاريخ الإنشاء")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["is_active"],
+                condition=models.Q(is_active=True),
+                name="ohsms_riskmatrix_one_active_uniq",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.severity_levels}×{self.likelihood_levels})"
+
+
+class RiskMatrixBand(models.Model):
+    """
+    شريحة تقييم: risk_score بين min_score و max_score (شاملة، فارغ = مفتوح)
+    """
+
+    matrix = models.ForeignKey(
+        RiskMatrix,
+        on_delete=models.CASCADE,
+        related_name="bands",
+        verbose_name="المصفوفة"
+    )
+
+    code = models.CharField(max_length=10, verbose_name="الرمز")
+    label = models.CharField(max_length=50, verbose_name="الاسم")
+
+    min_score = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name="من تقييم")
+    max_score = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name="إلى تقييم")
+
+    color = models.CharField(max_length=7, default="#9e9e9e", verbose_name="اللون")
+    order = models.PositiveSmallIntegerField(default=0, verbose_name="الترتيب")
+
+    class Meta:
+        ordering = ["order", "min_score"]
+        constraints = [
+            models.UniqueConstraint(fields=["matrix", "code"], name="ohsms_riskmatrixband_code_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.matrix_id} | {self.code} | {self.min_score}-{self.max_score}"
 # =========================
 # Digital Forms Models
 # =========================
@@ -375,6 +840,22 @@ class FormTemplate(models.Model):
         verbose_name="أنشئ بواسطة"
     )
 
+    risk_references = models.ManyToManyField(
+        "RiskReference",
+        blank=True,
+        related_name="form_templates",
+        verbose_name="المخاطر المرجعية المرتبطة"
+    )
+
+    # يُرفع مع أي حفظ/حذف لحقول النموذج (ohsms.signals) → مفتاح المخطط المترجم
+    schema_version = models.PositiveIntegerField(
+        default=1,
+        editable=False,
+        verbose_name="إصدار الحقول"
+    )
+
+    objects = FormTemplateQuerySet.as_manager()
+
     created_at = models.DateTimeField(
         auto_now_add=True,
         verbose_name="تاريخ الإنشاء"
@@ -426,8 +907,44 @@ class FormField(models.Model):
         verbose_name="الخيارات (مفصولة بفواصل)"
     )
 
+    objects = FormFieldQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.form} - {self.label}"
+class FormTemplateVersion(models.Model):
+    """
+    لقطة ثابتة لحقول نموذج عند schema_version معيّن (تُنشأ مع أول تقديم عليها)
+    """
+
+    form = models.ForeignKey(
+        FormTemplate,
+        on_delete=models.CASCADE,
+        related_name="versions",
+        verbose_name="النموذج"
+    )
+
+    version = models.PositiveIntegerField(verbose_name="الإصدار")
+
+    # {"title": ..., "fields": [{"id", "label", "field_type", "is_required", "order", "choices"}]}
+    schema = models.JSONField(verbose_name="الحقول")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="تاريخ الإنشاء")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["form", "version"], name="ohsms_formver_uniq"),
+        ]
+
+    def save(self, *args, **kwargs):
+        # الإصدار لا يُعدّل بعد إنشائه (تقديمات سابقة تعتمد عليه)
+        if self.pk is not None:
+            raise ValidationFailed(message="لا يمكن تعديل إصدار نموذج محفوظ")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.form} - v{self.version}"
+
+
 class FormSubmission(models.Model):
 
     form = models.ForeignKey(
@@ -443,11 +960,37 @@ class FormSubmission(models.Model):
         verbose_name="مُعبئ النموذج"
     )
 
+    # نسخة الحقول وقت التقديم (ثابتة) - القراءة/التصدير منها بدون FormField
+    template_version = models.ForeignKey(
+        "FormTemplateVersion",
+        on_delete=models.RESTRICT,
+        null=True,
+        blank=True,
+        related_name="submissions",
+        verbose_name="إصدار النموذج"
+    )
+
     submitted_at = models.DateTimeField(
         auto_now_add=True,
         verbose_name="تاريخ الإرسال"
     )
 
+    incident = models.ForeignKey(
+        Incident,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="form_submissions",
+        verbose_name="البلاغ المرتبط"
+    )
+
+    objects = FormSubmissionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["form", "submitted_at"], name="ohsms_formsub_form_time_idx"),
+        ]
+
     def __str__(self):
         return f"تقديم: {self.form} - {self.submitted_at}"
 class FormAnswer(models.Model):
@@ -459,9 +1002,12 @@ class FormAnswer(models.Model):
         verbose_name="التقديم"
     )
 
+    # بدون قيد قاعدة بيانات: حذف حقل من النموذج لا يحذف إجابات التقديمات السابقة
+    # (field_id يبقى مفتاحًا في نسخة النموذج المثبتة على التقديم)
     field = models.ForeignKey(
         FormField,
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
         verbose_name="الحقل"
     )
 
@@ -469,8 +1015,92 @@ class FormAnswer(models.Model):
         verbose_name="الإجابة"
     )
 
+    # أعمدة مصنّفة تُعبأ عند التقديم حسب نوع الحقل (ohsms.services.form_schema.TYPED_COLUMNS)
+    value_number = models.FloatField(null=True, blank=True, verbose_name="قيمة رقمية")
+    value_date = models.DateField(null=True, blank=True, verbose_name="قيمة تاريخ")
+    value_bool = models.BooleanField(null=True, blank=True, verbose_name="قيمة نعم/لا")
+    value_option = models.CharField(max_length=255, null=True, blank=True, verbose_name="الخيار")
+
+    class Meta:
+        # (الحقل، القيمة، التقديم): شرط على حقل = مسح مدى، والتقديم من الفهرس نفسه
+        # جزئية: كل فهرس يحوي فقط إجابات نوعه
+        indexes = [
+            models.Index(
+                fields=["field", "value_number", "submission"],
+                name="ohsms_formans_num_idx",
+                condition=models.Q(value_number__isnull=False),
+            ),
+            models.Index(
+                fields=["field", "value_date", "submission"],
+                name="ohsms_formans_date_idx",
+                condition=models.Q(value_date__isnull=False),
+            ),
+            models.Index(
+                fields=["field", "value_bool", "submission"],
+                name="ohsms_formans_bool_idx",
+                condition=models.Q(value_bool__isnull=False),
+            ),
+            models.Index(
+                fields=["field", "value_option", "submission"],
+                name="ohsms_formans_option_idx",
+                condition=models.Q(value_option__isnull=False),
+            ),
+        ]
+
+    def __str__(self):
+        # الحقل قد يكون محذوفًا (بدون قيد FK) → المعرّف فقط بدون استعلام
+        return f"{self.submission_id} | {self.field_id} | {self.value}"
+
+
+class FormEvent(models.Model):
+    ACTION_CHOICES = [
+        ('create_template', 'إنشاء نموذج'),
+        ('add_field', 'إضافة حقل'),
+        ('submit', 'تقديم نموذج'),
+        ('deactivate', 'إيقاف نموذج'),
+    ]
+
+    form = models.ForeignKey(
+        FormTemplate,
+        on_delete=models.CASCADE,
+        related_name="events",
+        verbose_name="النموذج"
+    )
+
+    submission = models.ForeignKey(
+        FormSubmission,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="events",
+        verbose_name="التقديم"
+    )
+
+    action = models.CharField(
+        max_length=50,
+        choices=ACTION_CHOICES,
+        verbose_name="الإجراء"
+    )
+
+    actor = models.ForeignKey(
+        "auth.User",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        verbose_name="المنفذ"
+    )
+
+    payload = models.JSONField(default=dict, blank=True, verbose_name="بيانات إضافية")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="تاريخ الحدث")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "action"], name="ohsms_formevent_created_idx"),
+        ]
+
     def __str__(self):
-        return f"{self.field.label}"
+        return f"{self.form} | {self.action}"
 # =========================
 # RBAC - Roles & Scopes
 # =========================
@@ -654,3 +1284,239 @@ class SystemContent(models.Model):
 
     def __str__(self):
         return self.get_content_type_display()
+
+
+# =========================
+# Dashboard Rollups
+# =========================
+
+class IncidentDailyRollup(models.Model):
+    """
+    عدد البلاغات لكل يوم إنشاء × فرع × إدارة × قسم × نوع × حالة
+
+    يُحدّث تزايديًا داخل نفس معاملة IncidentService (ohsms.services.rollups)
+    ويُعاد بناؤه بالكامل بـ: manage.py rebuild_rollups
+    """
+
+    day = models.DateField(verbose_name="اليوم")
+
+    branch = models.ForeignKey(
+        Branch,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="الفرع"
+    )
+    department = models.ForeignKey(
+        Department,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="الإدارة"
+    )
+    section = models.ForeignKey(
+        Section,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="القسم"
+    )
+
+    incident_type = models.CharField(max_length=20, verbose_name="نوع البلاغ")
+    status = models.CharField(max_length=50, verbose_name="الحالة")
+
+    count = models.IntegerField(default=0, verbose_name="العدد")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "branch", "department", "section", "incident_type", "status"],
+                name="ohsms_incrollup_key_uniq",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} | {self.incident_type} | {self.status} | {self.count}"
+
+
+class RiskDailyRollup(models.Model):
+    """
+    عدد المخاطر لكل يوم إدخال × فرع × إدارة × قسم × فئة × حالة
+
+    بدون شريحة التقييم: الشرائح تتبع مصفوفة المخاطر القابلة للتعديل،
+    فتخزينها يجعل نقل العدّ بعد تعديل المصفوفة يصيب صفًا غير موجود
+    """
+
+    day = models.DateField(verbose_name="اليوم")
+
+    branch = models.ForeignKey(
+        Branch,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="الفرع"
+    )
+    department = models.ForeignKey(
+        Department,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="الإدارة"
+    )
+    section = models.ForeignKey(
+        Section,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="القسم"
+    )
+
+    category = models.ForeignKey(
+        RiskCategory,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="فئة الخطر"
+    )
+
+    status = models.CharField(max_length=20, verbose_name="الحالة")
+
+    count = models.IntegerField(default=0, verbose_name="العدد")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "branch", "department", "section", "category", "status"],
+                name="ohsms_riskrollup_key_uniq",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} | {self.category_id} | {self.status} | {self.count}"
+
+
+class IncidentResponseRollup(models.Model):
+    """
+    مدد الاستجابة كمدرّج تكراري ثابت الشرائح (ohsms.core.histogram.DURATION_HISTOGRAM)
+    لكل يوم إنشاء × فرع × إدارة × قسم × نوع × مقياس × شريحة
+
+    دمج أي نطاق تاريخي/تنظيمي = SUM(count) GROUP BY bucket → النسب المئوية (p50/p90/p99)
+    بدون فرز البلاغات نفسها
+    """
+
+    METRIC_CHOICES = [
+        ('receive', 'زمن الاستلام'),
+        ('close', 'زمن الإغلاق'),
+    ]
+
+    day = models.DateField(verbose_name="اليوم")
+
+    branch = models.ForeignKey(
+        Branch,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="الفرع"
+    )
+    department = models.ForeignKey(
+        Department,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="الإدارة"
+    )
+    section = models.ForeignKey(
+        Section,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="القسم"
+    )
+
+    incident_type = models.CharField(max_length=20, verbose_name="نوع البلاغ")
+    metric = models.CharField(max_length=10, choices=METRIC_CHOICES, verbose_name="المقياس")
+    bucket = models.PositiveSmallIntegerField(verbose_name="الشريحة")
+
+    count = models.IntegerField(default=0, verbose_name="العدد")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "branch", "department", "section", "incident_type", "metric", "bucket"],
+                name="ohsms_incresp_key_uniq",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} | {self.incident_type} | {self.metric} | {self.bucket} | {self.count}"
+
+
+class FormFieldDailyStat(models.Model):
+    """
+    ملخصات إجابات كل حقل لكل يوم تقديم (تُحدّث تزايديًا مع submit_form)
+
+    - option: تكرار كل خيار (select / radio / checkbox: true / false)
+    - number: العدد / المجموع / الأدنى / الأعلى
+    - number_bucket: مدرّج القيم (ohsms.core.histogram.NUMBER_HISTOGRAM) للنسب المئوية
+    - date: تكرار القيم حسب الشهر (YYYY-MM)
+    - answered: عدد الإجابات غير الفارغة (كل الأنواع)
+
+    تحليلات أي فترة = دمج صفوف الأيام (SUM / MIN / MAX) بدل مسح FormAnswer
+    """
+
+    METRIC_CHOICES = [
+        ('answered', 'إجابات'),
+        ('option', 'خيار'),
+        ('number', 'رقم'),
+        ('number_bucket', 'شريحة رقم'),
+        ('date', 'تاريخ'),
+    ]
+
+    day = models.DateField(verbose_name="اليوم")
+
+    form = models.ForeignKey(
+        FormTemplate,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="النموذج"
+    )
+
+    # بدون قيد: الإحصاءات السابقة تبقى بعد حذف الحقل (مثل FormAnswer.field)
+    field = models.ForeignKey(
+        FormField,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+        verbose_name="الحقل"
+    )
+
+    metric = models.CharField(max_length=20, choices=METRIC_CHOICES, verbose_name="المقياس")
+
+    key = models.CharField(max_length=255, blank=True, default="", verbose_name="المفتاح")
+
+    count = models.IntegerField(default=0, verbose_name="العدد")
+    total = models.FloatField(default=0, verbose_name="المجموع")
+    min_value = models.FloatField(null=True, blank=True, verbose_name="الأدنى")
+    max_value = models.FloatField(null=True, blank=True, verbose_name="الأعلى")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["field", "day", "metric", "key"],
+                name="ohsms_formstat_key_uniq",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["form", "day"], name="ohsms_formstat_form_day_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} | {self.field_id} | {self.metric} | {self.key} | {self.count}"
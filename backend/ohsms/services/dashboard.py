@@ -1,22 +1,27 @@
 from datetime import timedelta
 
 from django.db.models import Count, Avg, DurationField, ExpressionWrapper, F, Q
-from django.db.models.functions import TruncDate
-from django.utils.timezone import now
-from django.core.exceptions import FieldDoesNotExist
-
-from ohsms.models import Incident, Risk
-
-# إذا كان عندك IncidentEvent في models.py (وهذا غالبًا صحيح عندك)
-try:
-    from ohsms.models import IncidentEvent
-except Exception:
-    IncidentEvent = None
+from django.db.models.functions import Coalesce
+from django.utils.timezone import localdate, now
+
+from ohsms.core.authorization import AuthorizationContext
+from ohsms.core.errors import ValidationFailed
+from ohsms.core.histogram import DURATION_HISTOGRAM
+from ohsms.core.instrumentation import instrumented
+from ohsms.managers import restrict_to_scope
+from ohsms.models import Incident, IncidentResponseRollup, Risk
+from ohsms.services.dashboard_cache import DashboardCache
+from ohsms.services.org_tree import OrgTree
+from ohsms.services.risk_matrix import RiskMatrixConfig, RISK_MATRIX_VERSION
+from ohsms.services.rollups import RollupService
+from ohsms.services.status_durations import StatusDurationService
 
 
 class DashboardService:
     """
     مؤشرات وإحصاءات النظام (Backend) - جاهزة للاستهلاك من أي واجهة لاحقًا
+
+    user=None → بدون تقييد (مهام النظام)، وإلا تُطبّق نطاقات RBAC للمستخدم
     """
 
     # ======================
@@ -24,12 +29,17 @@ class DashboardService:
     # ======================
 
     @staticmethod
-    def _has_field(model, field_name: str) -> bool:
-        try:
-            model._meta.get_field(field_name)
-            return True
-        except FieldDoesNotExist:
-            return False
+    def _context(user):
+        return AuthorizationContext.for_user(user) if user is not None else None
+
+    @staticmethod
+    def _incidents(context):
+        return restrict_to_scope(Incident.objects.all(), context, denormalized=True)
+
+    @staticmethod
+    def _risks(context):
+        # المخاطر قد تُربط بمستوى واحد فقط → شرط النطاق يشمل المسارات عبر العلاقات
+        return restrict_to_scope(Risk.objects.all(), context, denormalized=False)
 
     @staticmethod
     def _date_range(days: int = 30):
@@ -37,148 +47,315 @@ class DashboardService:
         start = end - timedelta(days=days)
         return start, end
 
+    @staticmethod
+    def _day_range(days: int = 30):
+        """
+        نفس _date_range لكن بالأيام (لجداول التجميع اليومية)
+        """
+        start, end = DashboardService._date_range(days)
+        return localdate(start), localdate(end)
+
+    @staticmethod
+    def _counts_list(totals, prefix, key, choices):
+        """
+        تحويل أعمدة Count(filter=...) إلى نفس شكل values().annotate():
+        [{key: code, "count": n}, ...] مرتبة تنازليًا (بدون الأصفار)
+        """
+        rows = [
+            {key: code, "count": totals[f"{prefix}{code}"]}
+            for code, _ in choices
+            if totals[f"{prefix}{code}"]
+        ]
+        rows.sort(key=lambda row: -row["count"])
+        return rows
+
+    @staticmethod
+    def _top(counter, key, limit):
+        return [
+            {key: name, "count": count}
+            for name, count in sorted(counter.items(), key=lambda item: -item[1])[:limit]
+        ]
+
     # ======================
     # Incidents (بلاغات)
     # ======================
 
     @staticmethod
-    def incidents_kpis(days: int = 30):
-        start, end = DashboardService._date_range(days)
+    @instrumented("dashboard.incident_totals")
+    def _incident_totals(context=None, recent_days: int = 30, top_days: int = 90, sla_hours: int = 24):
+        """
+        كل أرقام البلاغات في استعلام واحد (Count مع filter = CASE داخل التجميع):
+        الإجمالي / آخر N يوم / حسب الحالة / حسب النوع / الأكثر تكرارًا / SLA / متوسط الاستجابة
+        """
+        recent_start, end = DashboardService._date_range(recent_days)
+        top_start, _ = DashboardService._date_range(top_days)
+
+        recent = Q(created_at__gte=recent_start, created_at__lte=end)
+        top_window = Q(created_at__gte=top_start, created_at__lte=end)
+        handled = Q(handled_at__isnull=False)
+
+        aggregates = {
+            "total": Count("id"),
+            "recent": Count("id", filter=recent),
+            "within_sla": Count(
+                "id",
+                filter=handled & Q(handled_at__lte=F("created_at") + timedelta(hours=sla_hours)),
+            ),
+            "avg_response": Avg(
+                ExpressionWrapper(F("handled_at") - F("created_at"), output_field=DurationField()),
+                filter=handled,
+            ),
+        }
+        for code, _ in Incident.STATUS_CHOICES:
+            aggregates[f"status__{code}"] = Count("id", filter=Q(status=code))
+        for code, _ in Incident.INCIDENT_TYPES:
+            aggregates[f"type__{code}"] = Count("id", filter=Q(incident_type=code))
+            aggregates[f"top_type__{code}"] = Count("id", filter=Q(incident_type=code) & top_window)
 
-        base = Incident.objects.all()
-        recent = base.filter(created_at__gte=start, created_at__lte=end)
+        return DashboardService._incidents(context).aggregate(**aggregates)
 
+    @staticmethod
+    def _incidents_kpis_from(totals):
         return {
-            "total": base.count(),
-            "last_days_total": recent.count(),
-            "by_status": list(base.values("status").annotate(count=Count("id")).order_by("-count")),
-            "by_type": list(base.values("incident_type").annotate(count=Count("id")).order_by("-count")),
+            "total": totals["total"],
+            "last_days_total": totals["recent"],
+            "by_status": DashboardService._counts_list(totals, "status__", "status", Incident.STATUS_CHOICES),
+            "by_type": DashboardService._counts_list(totals, "type__", "incident_type", Incident.INCIDENT_TYPES),
         }
 
     @staticmethod
-    def incidents_top_types(limit: int = 5, days: int = 90):
-        start, end = DashboardService._date_range(days)
-        qs = Incident.objects.filter(created_at__gte=start, created_at__lte=end)
-        return list(
-            qs.values("incident_type")
-              .annotate(count=Count("id"))
-              .order_by("-count")[:limit]
-        )
+    def _sla_from(totals, hours):
+        total = totals["total"]
+        if total == 0:
+            return {"sla_hours": hours, "compliance_pct": 0}
+
+        within = totals["within_sla"]
+        return {
+            "sla_hours": hours,
+            "compliance_pct": round((within / total) * 100, 2),
+            "within_sla": within,
+            "total": total,
+        }
+
+    @staticmethod
+    def incidents_kpis(days: int = 30, user=None):
+        totals = DashboardService._incident_totals(DashboardService._context(user), recent_days=days)
+        return DashboardService._incidents_kpis_from(totals)
+
+    @staticmethod
+    def incidents_top_types(limit: int = 5, days: int = 90, user=None):
+        totals = DashboardService._incident_totals(DashboardService._context(user), top_days=days)
+        return DashboardService._counts_list(
+            totals, "top_type__", "incident_type", Incident.INCIDENT_TYPES
+        )[:limit]
+
+    @staticmethod
+    def incidents_by_scope(days: int = 90, user=None):
+        return DashboardService._incidents_by_scope(DashboardService._context(user), days)
 
     @staticmethod
-    def incidents_by_scope(days: int = 90):
+    @instrumented("dashboard.incidents_by_scope")
+    def _incidents_by_scope(context, days):
         """
-        البلاغات حسب الفرع/الإدارة/القسم (Top)
+        البلاغات حسب الفرع/الإدارة/القسم (Top) - من جدول التجميع اليومي على مستوى القسم
+        ثم تجميع الفرع والإدارة منه في الذاكرة
         """
-        start, end = DashboardService._date_range(days)
-        qs = Incident.objects.filter(created_at__gte=start, created_at__lte=end)
-
-        by_branch = list(qs.values("branch__name").annotate(count=Count("id")).order_by("-count")[:10])
-        by_department = list(qs.values("department__name").annotate(count=Count("id")).order_by("-count")[:10])
-        by_section = list(qs.values("section__name").annotate(count=Count("id")).order_by("-count")[:10])
+        start_day, end_day = DashboardService._day_range(days)
+        rows = RollupService.incidents_by_section(start_day, end_day, context)
+
+        by_branch = {}
+        by_department = {}
+        by_section = {}
+        for row in rows:
+            for counter, name in (
+                (by_branch, row["branch__name"]),
+                (by_department, row["department__name"]),
+                (by_section, row["section__name"]),
+            ):
+                counter[name] = counter.get(name, 0) + row["count"]
 
         return {
-            "by_branch_top": by_branch,
-            "by_department_top": by_department,
-            "by_section_top": by_section,
+            "by_branch_top": DashboardService._top(by_branch, "branch__name", 10),
+            "by_department_top": DashboardService._top(by_department, "department__name", 10),
+            "by_section_top": DashboardService._top(by_section, "section__name", 10),
         }
 
     @staticmethod
-    def incidents_trend(days: int = 30):
+    def incidents_trend(days: int = 30, user=None):
         """
-        اتجاه البلاغات يوميًا (آخر N يوم)
+        اتجاه البلاغات يوميًا (آخر N يوم) - من جدول التجميع اليومي
         """
-        start, end = DashboardService._date_range(days)
-        qs = Incident.objects.filter(created_at__gte=start, created_at__lte=end)
-
-        return list(
-            qs.annotate(day=TruncDate("created_at"))
-              .values("day")
-              .annotate(count=Count("id"))
-              .order_by("day")
-        )
+        start_day, end_day = DashboardService._day_range(days)
+        return RollupService.incidents_trend(start_day, end_day, DashboardService._context(user))
 
     @staticmethod
-    def incident_avg_response_time():
+    def incident_avg_response_time(user=None):
         """
-        متوسط سرعة الاستجابة:
-        - إذا كان يوجد handled_at في Incident: نستخدمه
-        - وإلا: نحاول حساب أول "حدث" على IncidentEvent
+        متوسط سرعة الاستجابة (handled_at - created_at) للبلاغات التي بدأت معالجتها
         """
-        # 1) handled_at (إن وجد)
-        if DashboardService._has_field(Incident, "handled_at"):
-            qs = Incident.objects.exclude(handled_at__isnull=True).annotate(
-                response_time=ExpressionWrapper(
-                    F("handled_at") - F("created_at"),
-                    output_field=DurationField()
-                )
-            )
-            return qs.aggregate(avg_response=Avg("response_time"))
+        totals = DashboardService._incident_totals(DashboardService._context(user))
+        return {"avg_response": totals["avg_response"]}
 
-        # 2) IncidentEvent fallback
-        if IncidentEvent is None:
-            return {"avg_response": None, "note": "لا يوجد handled_at ولا IncidentEvent متاح"}
+    @staticmethod
+    def incident_response_percentiles(days: int = 90, user=None):
+        """
+        p50/p90/p99 (بالثواني) لزمن الاستلام وزمن الإغلاق:
+        عام / حسب النوع / حسب الفرع / حسب الإدارة - بدمج ملخصات المدرّج اليومية
+        """
+        return DashboardService._response_percentiles(DashboardService._context(user), days)
 
-        # نحسب أول event لكل incident (أول تفاعل) كوقت استجابة
-        # ملاحظة: هذا يعتمد أن IncidentEvent فيه created_at أو timestamp مشابه
-        time_field = "created_at" if DashboardService._has_field(IncidentEvent, "created_at") else None
-        if time_field is None:
-            return {"avg_response": None, "note": "IncidentEvent لا يحتوي created_at"}
+    @staticmethod
+    @instrumented("dashboard.response_percentiles")
+    def _response_percentiles(context, days):
+        start_day, end_day = DashboardService._day_range(days)
+        rows = RollupService.response_buckets(start_day, end_day, context)
+
+        dimensions = (
+            ("by_type", "incident_type"),
+            ("by_branch", "branch__name"),
+            ("by_department", "department__name"),
+        )
+        sketches = {
+            metric: {"overall": {}, **{name: {} for name, _ in dimensions}}
+            for metric, _ in IncidentResponseRollup.METRIC_CHOICES
+        }
 
-        # أحداث بعد الإنشاء مباشرة تعتبر استجابة (أي event)
-        # (لاحقًا يمكن تقييدها بـ action معين مثل receive/in_progress)
-        # نحسب الفرق عبر تجميع متوسط الفرق بطريقة مبسطة:
-        # سنستخدم آخر حل عملي: متوسط (min_event_time - created_at) عبر Python لاحقًا إن احتجنا.
-        # هنا نُرجع KPI أولي: نسبة البلاغات التي لديها أي Event.
-        with_event = Incident.objects.filter(events__isnull=False).distinct().count() if hasattr(Incident, "events") else None
-        return {"avg_response": None, "note": "فعّل handled_at أو حدّد علاقة events لاحتساب المتوسط بدقة", "incidents_with_any_event": with_event}
+        for row in rows:
+            metric = sketches[row["metric"]]
+            targets = [metric["overall"]]
+            for name, field in dimensions:
+                targets.append(metric[name].setdefault(row[field], {}))
+            for counts in targets:
+                counts[row["bucket"]] = counts.get(row["bucket"], 0) + row["count"]
+
+        def summary(counts):
+            return {"count": sum(counts.values()), **DURATION_HISTOGRAM.percentiles(counts)}
+
+        result = {}
+        for metric, groups in sketches.items():
+            result[metric] = {"overall": summary(groups["overall"])}
+            for name, field in dimensions:
+                result[metric][name] = sorted(
+                    ({field: label, **summary(counts)} for label, counts in groups[name].items()),
+                    key=lambda item: -item["count"],
+                )
+        return result
 
     @staticmethod
-    def incident_sla_compliance(hours: int = 24):
+    @instrumented("dashboard.status_bottlenecks")
+    def status_bottlenecks(days: int = 90, user=None):
         """
-        نسبة الالتزام بـ SLA (مثلاً الرد خلال 24 ساعة)
-        يعتمد على handled_at إذا كان موجود.
+        الاختناقات حسب مرحلة سير العمل (الحالة) وحسب الفرع × الحالة:
+        - الفترات المنتهية خلال آخر N يوم: العدد / المتوسط / p50 / p90 / p99 / إجمالي الوقت
+        - البلاغات العالقة حاليًا في الحالة وعمر أقدمها
+        مرتبة حسب إجمالي الوقت المستهلك (الأكبر = الاختناق الأهم)
         """
-        if not DashboardService._has_field(Incident, "handled_at"):
-            return {"sla_hours": hours, "compliance_pct": None, "note": "أضف handled_at لحساب SLA بدقة"}
-
-        total = Incident.objects.count()
-        if total == 0:
-            return {"sla_hours": hours, "compliance_pct": 0}
-
-        within = Incident.objects.exclude(handled_at__isnull=True).filter(
-            handled_at__lte=F("created_at") + timedelta(hours=hours)
-        ).count()
+        context = DashboardService._context(user)
+        start, end = DashboardService._date_range(days)
+        fields = ("branch__name", "status")
+
+        groups = {}
+
+        def group(key):
+            return groups.setdefault(key, {"buckets": {}, "total_seconds": 0.0, "open": 0, "oldest": None})
+
+        for row in StatusDurationService.completed_buckets(start, end, context, fields):
+            for key in (("status", row["status"]), ("branch", row["branch__name"], row["status"])):
+                entry = group(key)
+                entry["buckets"][row["bucket"]] = entry["buckets"].get(row["bucket"], 0) + row["count"]
+                entry["total_seconds"] += row["total_seconds"] or 0
+
+        for row in StatusDurationService.open_spans(context, fields):
+            for key in (("status", row["status"]), ("branch", row["branch__name"], row["status"])):
+                entry = group(key)
+                entry["open"] += row["count"]
+                if entry["oldest"] is None or row["oldest_entered_at"] < entry["oldest"]:
+                    entry["oldest"] = row["oldest_entered_at"]
+
+        by_status, by_branch = [], []
+        for key, entry in groups.items():
+            completed = sum(entry["buckets"].values())
+            item = {
+                "status": key[-1],
+                "completed": completed,
+                "avg_seconds": round(entry["total_seconds"] / completed, 1) if completed else None,
+                **DURATION_HISTOGRAM.percentiles(entry["buckets"]),
+                "total_seconds": round(entry["total_seconds"], 1),
+                "open_now": entry["open"],
+                "oldest_open_seconds": (
+                    round((end - entry["oldest"]).total_seconds(), 1) if entry["oldest"] else None
+                ),
+            }
+            if key[0] == "status":
+                by_status.append(item)
+            else:
+                by_branch.append({"branch__name": key[1], **item})
 
+        ranking = lambda item: (-item["total_seconds"], -item["open_now"])
         return {
-            "sla_hours": hours,
-            "compliance_pct": round((within / total) * 100, 2),
-            "within_sla": within,
-            "total": total,
+            "by_status": sorted(by_status, key=ranking),
+            "by_branch": sorted(by_branch, key=ranking),
         }
 
+    @staticmethod
+    def incident_sla_compliance(hours: int = 24, user=None):
+        """
+        نسبة الالتزام بـ SLA (مثلاً الرد خلال 24 ساعة) اعتمادًا على handled_at
+        """
+        totals = DashboardService._incident_totals(DashboardService._context(user), sla_hours=hours)
+        return DashboardService._sla_from(totals, hours)
+
     # ======================
     # Risks (مخاطر)
     # ======================
 
     @staticmethod
-    def risks_kpis(days: int = 90):
-        start, end = DashboardService._date_range(days)
+    @instrumented("dashboard.risk_totals")
+    def _risk_totals(context=None, recent_days: int = 90):
+        """
+        كل أرقام المخاطر في استعلام واحد: الإجمالي / آخر N يوم / الحالات / الشرائح
+        """
+        start, end = DashboardService._date_range(recent_days)
 
-        base = Risk.objects.all()
-        recent = base.filter(created_at__gte=start, created_at__lte=end)
+        aggregates = {
+            "total": Count("id"),
+            "recent": Count("id", filter=Q(created_at__gte=start, created_at__lte=end)),
+        }
+        for code, _ in Risk.STATUS_CHOICES:
+            aggregates[f"status__{code}"] = Count("id", filter=Q(status=code))
+        # شرائح مصفوفة المخاطر المفعّلة
+        for band, condition in RiskMatrixConfig.current().filters().items():
+            aggregates[f"band__{band}"] = Count("id", filter=condition)
+
+        return DashboardService._risks(context).aggregate(**aggregates)
 
+    @staticmethod
+    def _risks_kpis_from(totals):
         return {
-            "total": base.count(),
-            "last_days_total": recent.count(),
-            "by_status": list(base.values("status").annotate(count=Count("id")).order_by("-count")),
-            "high_risks_count": base.filter(risk_score__gte=15).count(),
+            "total": totals["total"],
+            "last_days_total": totals["recent"],
+            "by_status": DashboardService._counts_list(totals, "status__", "status", Risk.STATUS_CHOICES),
+            "high_risks_count": totals[f"band__{RiskMatrixConfig.current().top_band}"],
         }
 
     @staticmethod
-    def risks_by_category(limit: int = 10, days: int = 180):
+    def _distribution_from(totals):
+        return {band: totals[f"band__{band}"] for band in RiskMatrixConfig.current().codes}
+
+    @staticmethod
+    def risks_kpis(days: int = 90, user=None):
+        totals = DashboardService._risk_totals(DashboardService._context(user), recent_days=days)
+        return DashboardService._risks_kpis_from(totals)
+
+    @staticmethod
+    def risks_by_category(limit: int = 10, days: int = 180, user=None):
+        return DashboardService._risks_by_category(DashboardService._context(user), limit, days)
+
+    @staticmethod
+    @instrumented("dashboard.risks_by_category")
+    def _risks_by_category(context, limit, days):
         start, end = DashboardService._date_range(days)
-        qs = Risk.objects.filter(created_at__gte=start, created_at__lte=end)
+        qs = DashboardService._risks(context).filter(created_at__gte=start, created_at__lte=end)
 
         return list(
             qs.values("category__name")
@@ -187,47 +364,236 @@ class DashboardService:
         )
 
     @staticmethod
-    def risks_distribution():
+    def risks_distribution(user=None):
         """
-        توزيع المخاطر حسب التقييم (Low/Medium/High) - قابل للتعديل حسب مصفوفة الجهة
+        توزيع المخاطر حسب التقييم (Low/Medium/High) - استعلام واحد بدل ثلاثة
         """
-        qs = Risk.objects.all()
-        low = qs.filter(risk_score__lte=6).count()
-        medium = qs.filter(risk_score__gte=7, risk_score__lte=14).count()
-        high = qs.filter(risk_score__gte=15).count()
+        totals = DashboardService._risk_totals(DashboardService._context(user))
+        return DashboardService._distribution_from(totals)
+
+    @staticmethod
+    def risks_trend(days: int = 30, user=None):
+        start_day, end_day = DashboardService._day_range(days)
+        return RollupService.risks_trend(start_day, end_day, DashboardService._context(user))
 
-        return {"low": low, "medium": medium, "high": high}
+    HEATMAP_BREAKDOWNS = (None, "branch", "category")
 
     @staticmethod
-    def risks_trend(days: int = 30):
-        start, end = DashboardService._date_range(days)
-        qs = Risk.objects.filter(created_at__gte=start, created_at__lte=end)
+    def risks_heatmap(breakdown=None, days: int = None, user=None):
+        """
+        مصفوفة المخاطر (الشدة × الاحتمالية) كاملة: لكل خلية التقييم والشريحة واللون والعدد
 
-        return list(
-            qs.annotate(day=TruncDate("created_at"))
-              .values("day")
+        - breakdown: None / "branch" / "category" → شبكة إضافية لكل فرع أو فئة
+        - days: المخاطر المُدخلة خلال آخر N يوم فقط (None = الكل)
+        - استعلام تجميع واحد (الشرائح كـ CASE في SQL)، ومخزنة حسب توقيع النطاقات
+          وإصدار المصفوفة
+        """
+        DashboardService._check_breakdown(breakdown)
+
+        if user is None:
+            return DashboardService._risks_heatmap(None, breakdown, days)
+
+        context = DashboardService._context(user)
+        return DashboardCache.get_or_compute(
+            f"risk_heatmap:{breakdown or 'all'}:{days or 'all'}",
+            context,
+            lambda: DashboardService._risks_heatmap(context, breakdown, days),
+            extra_versions=[RISK_MATRIX_VERSION],
+        )
+
+    @staticmethod
+    def _check_breakdown(breakdown):
+        if breakdown not in DashboardService.HEATMAP_BREAKDOWNS:
+            raise ValidationFailed(
+                message="تقسيم غير مدعوم لمصفوفة المخاطر",
+                details={"breakdown": breakdown},
+            )
+
+    @staticmethod
+    def _heatmap_grid(matrix, counts):
+        """
+        الشبكة كاملة (بما فيها الخلايا الفارغة) - صف لكل شدة من الأعلى للأدنى
+        """
+        colors = {band.code: band.color for band in matrix.bands}
+        grid = []
+        for severity in range(matrix.severity_levels, 0, -1):
+            row = []
+            for likelihood in range(1, matrix.likelihood_levels + 1):
+                score = severity * likelihood
+                band = matrix.band_for(score)
+                row.append({
+                    "severity": severity,
+                    "likelihood": likelihood,
+                    "score": score,
+                    "band": band,
+                    "color": colors[band],
+                    "count": counts.get((severity, likelihood), 0),
+                })
+            grid.append(row)
+        return grid
+
+    @staticmethod
+    @instrumented("dashboard.risks_heatmap")
+    def _risks_heatmap(context, breakdown, days):
+        matrix = RiskMatrixConfig.current()
+
+        qs = DashboardService._risks(context)
+        if days:
+            start, end = DashboardService._date_range(days)
+            qs = qs.filter(created_at__gte=start, created_at__lte=end)
+
+        group_fields = []
+        if breakdown == "branch":
+            # المخاطر قد تُربط بالإدارة أو القسم فقط → الفرع من أقرب مستوى معبأ
+            qs = qs.annotate(group_id=Coalesce("branch_id", "department__branch_id", "section__department__branch_id"))
+            group_fields = ["group_id"]
+        elif breakdown == "category":
+            qs = qs.annotate(group_id=F("category_id"), group_name=F("category__name"))
+            group_fields = ["group_id", "group_name"]
+
+        rows = (
+            qs.annotate(band=matrix.case())
+              .values("severity", "likelihood", "band", *group_fields)
               .annotate(count=Count("id"))
-              .order_by("day")
+              .order_by()
         )
 
+        def summary():
+            return {"cells": {}, "totals": dict.fromkeys(matrix.codes, 0), "total": 0}
+
+        overall = summary()
+        groups = {}
+        tree = OrgTree.current() if breakdown == "branch" else None
+
+        for row in rows:
+            targets = [overall]
+            if breakdown:
+                group = groups.get(row["group_id"])
+                if group is None:
+                    if tree is not None:
+                        node = tree.node(OrgTree.BRANCH, row["group_id"])
+                        name = node.name if node else "عام"
+                    else:
+                        name = row["group_name"]
+                    group = groups[row["group_id"]] = {"id": row["group_id"], "name": name, **summary()}
+                targets.append(group)
+
+            cell = (row["severity"], row["likelihood"])
+            for target in targets:
+                target["cells"][cell] = target["cells"].get(cell, 0) + row["count"]
+                target["totals"][row["band"]] = target["totals"].get(row["band"], 0) + row["count"]
+                target["total"] += row["count"]
+
+        def render(summary):
+            cells = summary.pop("cells")
+            return {**summary, "grid": DashboardService._heatmap_grid(matrix, cells)}
+
+        result = {"matrix": matrix.as_dict(), **render(overall)}
+        if breakdown:
+            result["groups"] = sorted(
+                (render(group) for group in groups.values()),
+                key=lambda group: -group["total"],
+            )
+        return result
+
     @staticmethod
-    def dashboard_snapshot():
+    @instrumented("dashboard.snapshot")
+    def dashboard_snapshot(user=None):
         """
         لقطة شاملة واحدة للداشبورد (أرقام + قوائم) تُستخدم في API واحدة لاحقًا
+
+        مع user: مقيدة بنطاقاته ومخزنة في الكاش حسب توقيع النطاقات
+        (كل المستخدمين بنفس النطاقات يشتركون في نفس اللقطة)
         """
+        if user is None:
+            return DashboardService._compute_snapshot(None)
+
+        context = DashboardService._context(user)
+        return DashboardCache.get_or_compute(
+            "snapshot",
+            context,
+            lambda: DashboardService._compute_snapshot(context),
+            extra_versions=[RISK_MATRIX_VERSION],
+        )
+
+    # ======================
+    # Widgets (JSON API - ohsms.services.dashboard_widgets)
+    # ======================
+
+    # اسم الودجت → المعاملات المقبولة وقيمها الافتراضية
+    WIDGETS = {
+        "kpis": {"days": 30},
+        "trends": {"days": 30},
+        "by_scope": {"days": 90},
+        "heatmap": {"breakdown": None, "days": None},
+        "sla": {"hours": 24, "days": 90},
+    }
+
+    @staticmethod
+    def widget(name, context, **params):
+        """
+        حساب ودجت واحدة بسياق صلاحيات جاهز (بدون كاش - الكاش في طبقة الودجت)
+        """
+        if name == "kpis":
+            days = params["days"]
+            return {
+                "incidents": DashboardService._incidents_kpis_from(
+                    DashboardService._incident_totals(context, recent_days=days)
+                ),
+                "risks": DashboardService._risks_kpis_from(
+                    DashboardService._risk_totals(context, recent_days=days)
+                ),
+            }
+
+        if name == "trends":
+            start_day, end_day = DashboardService._day_range(params["days"])
+            return {
+                "incidents": RollupService.incidents_trend(start_day, end_day, context),
+                "risks": RollupService.risks_trend(start_day, end_day, context),
+            }
+
+        if name == "by_scope":
+            return DashboardService._incidents_by_scope(context, params["days"])
+
+        if name == "heatmap":
+            DashboardService._check_breakdown(params["breakdown"])
+            return DashboardService._risks_heatmap(context, params["breakdown"], params["days"])
+
+        if name == "sla":
+            hours = params["hours"]
+            totals = DashboardService._incident_totals(context, sla_hours=hours)
+            return {
+                "compliance": DashboardService._sla_from(totals, hours),
+                "avg_response": totals["avg_response"],
+                "response_percentiles": DashboardService._response_percentiles(context, params["days"]),
+            }
+
+        raise ValidationFailed(message="ودجت غير معروفة", details={"widget": name})
+
+    @staticmethod
+    @instrumented("dashboard.compute_snapshot")
+    def _compute_snapshot(context):
+        start_30, end_30 = DashboardService._day_range(30)
+
+        incident_totals = DashboardService._incident_totals(context, recent_days=30, top_days=90, sla_hours=24)
+        risk_totals = DashboardService._risk_totals(context, recent_days=90)
+
         return {
             "incidents": {
-                "kpis": DashboardService.incidents_kpis(days=30),
-                "top_types": DashboardService.incidents_top_types(limit=5, days=90),
-                "by_scope": DashboardService.incidents_by_scope(days=90),
-                "trend_30d": DashboardService.incidents_trend(days=30),
-                "avg_response": DashboardService.incident_avg_response_time(),
-                "sla_24h": DashboardService.incident_sla_compliance(hours=24),
+                "kpis": DashboardService._incidents_kpis_from(incident_totals),
+                "top_types": DashboardService._counts_list(
+                    incident_totals, "top_type__", "incident_type", Incident.INCIDENT_TYPES
+                )[:5],
+                "by_scope": DashboardService._incidents_by_scope(context, 90),
+                "trend_30d": RollupService.incidents_trend(start_30, end_30, context),
+                "avg_response": {"avg_response": incident_totals["avg_response"]},
+                "response_percentiles": DashboardService._response_percentiles(context, 90),
+                "sla_24h": DashboardService._sla_from(incident_totals, 24),
             },
             "risks": {
-                "kpis": DashboardService.risks_kpis(days=90),
-                "by_category": DashboardService.risks_by_category(limit=10, days=180),
-                "distribution": DashboardService.risks_distribution(),
-                "trend_30d": DashboardService.risks_trend(days=30),
+                "kpis": DashboardService._risks_kpis_from(risk_totals),
+                "by_category": DashboardService._risks_by_category(context, 10, 180),
+                "distribution": DashboardService._distribution_from(risk_totals),
+                "trend_30d": RollupService.risks_trend(start_30, end_30, context),
             }
         }
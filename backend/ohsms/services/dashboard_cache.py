@@ -0,0 +1,136 @@
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
+
+from ohsms.core.cache_versions import get_versions, bump_version
+from ohsms.core.single_flight import peek, single_flight
+from ohsms.services.org_tree import OrgTree
+
+DASHBOARD_VERSION = "dashboard"
+_BRANCH_VERSION = "dashboard:b:{branch_id}"
+FORMS_VERSION = "forms_dashboard"
+_CACHE_KEY = "ohsms:dashboard:{name}:{scope}"
+
+
+class DashboardCache:
+    """
+    كاش لقطات لوحة المؤشرات حسب توقيع النطاقات (وليس حسب المستخدم)
+
+    - كل المستخدمين بنفس النطاقات (مثلاً كل الأدوار العالمية) يشتركون في مدخل واحد
+    - البصمة (tag) تحتوي إصدار كل فرع داخل النطاق: كتابة في فرع تُبطل
+      لقطات من يرى ذلك الفرع فقط، والأدوار العالمية تتبع الإصدار العام
+    - OHSMS_DASHBOARD_CACHE_TTL شبكة أمان إضافية فوق الإبطال بالإصدار
+    - الحساب عبر single_flight: طلب واحد يحسب والباقي ينتظره، وبعد الإبطال
+      تُعاد اللقطة السابقة (ضمن OHSMS_DASHBOARD_STALE_TTL) أثناء تحديثها
+    """
+
+    # =========================
+    # Keys
+    # =========================
+
+    @staticmethod
+    def scope_digest(context) -> str:
+        if context is None or context.is_global:
+            return "global"
+
+        raw = repr(context.scope_signature).encode()
+        return hashlib.sha1(raw).hexdigest()[:16]
+
+    @staticmethod
+    def _version_names(context):
+        """
+        مجالات الإصدار التي تؤثر على نطاق المستخدم
+        """
+        if context is None or context.is_global:
+            return [DASHBOARD_VERSION]
+
+        tree = OrgTree.current()
+        branch_ids, department_ids, section_ids = context.scope_signature
+
+        branches = set(branch_ids)
+        for department_id in department_ids:
+            branches.add(tree.ancestors(OrgTree.DEPARTMENT, department_id)[0])
+        for section_id in section_ids:
+            branches.add(tree.ancestors(OrgTree.SECTION, section_id)[0])
+        branches.discard(None)
+
+        return [_BRANCH_VERSION.format(branch_id=pk) for pk in sorted(branches)]
+
+    @staticmethod
+    def key(name, context) -> str:
+        return _CACHE_KEY.format(name=name, scope=DashboardCache.scope_digest(context))
+
+    @staticmethod
+    def tag(context, version_names=None) -> str:
+        """
+        بصمة الإصدارات الحالية: تغيّرها يجعل اللقطة قديمة (stale) وليست مفقودة
+        """
+        names = version_names if version_names is not None else DashboardCache._version_names(context)
+        versions = get_versions(names) if names else {}
+        return ".".join(str(versions[n]) for n in names) or "0"
+
+    @staticmethod
+    def _names(context, version_names=None, extra_versions=()):
+        names = version_names if version_names is not None else DashboardCache._version_names(context)
+        return list(names) + list(extra_versions)
+
+    @staticmethod
+    def etag(name, context, extra_versions=()):
+        """
+        ETag اللقطة المخزنة الحديثة بدون حساب القيمة (None إذا كانت قديمة أو غير موجودة)
+
+        مشتق من المدخل نفسه (بصمته + وقت تخزينه) وليس من الإصدارات الحالية:
+        أثناء stale-while-revalidate تُعاد القيمة القديمة بدون ETag، فلا يخزنها
+        المتصفح تحت بصمة جديدة ويستمر في 304 عليها
+        """
+        key = DashboardCache.key(name, context)
+        tag = DashboardCache.tag(context, DashboardCache._names(context, extra_versions=extra_versions))
+        entry = peek(key, tag)
+        if entry is None:
+            return None
+
+        raw = f"{key}|{entry['tag']}|{entry['fresh_until']}"
+        return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+    # =========================
+    # Read-through
+    # =========================
+
+    @staticmethod
+    def get_or_compute(name, context, compute, version_names=None, extra_versions=()):
+        """
+        version_names: مجالات إصدار بديلة (افتراضيًا: إصدارات فروع النطاق)
+        extra_versions: مجالات إضافية فوقها (مثل إصدار مصفوفة المخاطر)
+        """
+        if extra_versions:
+            version_names = DashboardCache._names(context, version_names, extra_versions)
+
+        return single_flight(
+            DashboardCache.key(name, context),
+            compute,
+            tag=DashboardCache.tag(context, version_names),
+            ttl=getattr(settings, "OHSMS_DASHBOARD_CACHE_TTL", 300),
+            stale_ttl=getattr(settings, "OHSMS_DASHBOARD_STALE_TTL", 600),
+        )
+
+    # =========================
+    # Invalidation
+    # =========================
+
+    @staticmethod
+    def touch(branch_id=None):
+        """
+        إبطال لقطات الأدوار العالمية + من يرى هذا الفرع (بعد نجاح المعاملة فقط،
+        حتى لا يُعاد حساب لقطة قبل ظهور البيانات الجديدة)
+        """
+        def _bump():
+            bump_version(DASHBOARD_VERSION)
+            if branch_id is not None:
+                bump_version(_BRANCH_VERSION.format(branch_id=branch_id))
+
+        transaction.on_commit(_bump)
+
+    @staticmethod
+    def touch_forms():
+        transaction.on_commit(lambda: bump_version(FORMS_VERSION))
@@ -0,0 +1,196 @@
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from ohsms.core.authorization import AuthorizationContext
+from ohsms.core.errors import ValidationFailed
+from ohsms.core.instrumentation import instrument, count_rows
+from ohsms.services.dashboard import DashboardService
+from ohsms.services.dashboard_cache import DashboardCache
+from ohsms.services.risk_matrix import RISK_MATRIX_VERSION
+
+logger = logging.getLogger(__name__)
+
+# كل الودجات تتأثر بشرائح مصفوفة المخاطر (المؤشرات / التوزيع / الخريطة)
+_EXTRA_VERSIONS = (RISK_MATRIX_VERSION,)
+
+_pool_lock = threading.Lock()
+_pool = {"executor": None}
+
+
+def _executor():
+    """
+    مجمع خيوط واحد للعملية بحجم ثابت (OHSMS_DASHBOARD_WORKERS)
+    """
+    if _pool["executor"] is None:
+        with _pool_lock:
+            if _pool["executor"] is None:
+                _pool["executor"] = ThreadPoolExecutor(
+                    max_workers=DashboardWidgetService.workers(),
+                    thread_name_prefix="ohsms-dashboard",
+                )
+    return _pool["executor"]
+
+
+class DashboardWidgetService:
+    """
+    ودجات لوحة المؤشرات كـ JSON مستقلة
+
+    - كل ودجت مخزنة حسب توقيع النطاقات + معاملاتها (DashboardCache / single_flight)
+    - ETag من المدخل المخزن الحديث بدون حساب القيمة → 304 مباشرة إذا لم يتغير شيء
+    - batch(): الودجات المطلوبة تُحسب بالتوازي على مجمع خيوط محدود،
+      لكل خيط اتصال قاعدة بيانات مستقل، فزمن الاستجابة ≈ أبطأ ودجت وليس مجموعها
+    """
+
+    # =========================
+    # Params
+    # =========================
+
+    @staticmethod
+    def names():
+        return list(DashboardService.WIDGETS)
+
+    @staticmethod
+    def params(name, query) -> dict:
+        """
+        معاملات الودجت من QueryDict (الأعداد تُحوّل، وغير المعروف يُتجاهل)
+        """
+        if name not in DashboardService.WIDGETS:
+            raise ValidationFailed(message="ودجت غير معروفة", details={"widget": name})
+
+        params = dict(DashboardService.WIDGETS[name])
+        for key in params:
+            raw = query.get(key)
+            if raw in (None, ""):
+                continue
+            if key == "breakdown":
+                params[key] = raw
+                continue
+            try:
+                params[key] = int(raw)
+            except ValueError:
+                raise ValidationFailed(message="قيمة غير صحيحة", details={key: raw})
+            if params[key] <= 0:
+                raise ValidationFailed(message="قيمة غير صحيحة", details={key: raw})
+        return params
+
+    @staticmethod
+    def parse_names(raw) -> list:
+        names = [name for name in (raw or "").split(",") if name] or DashboardWidgetService.names()
+        unknown = [name for name in names if name not in DashboardService.WIDGETS]
+        if unknown:
+            raise ValidationFailed(message="ودجت غير معروفة", details={"widgets": unknown})
+        return list(dict.fromkeys(names))
+
+    @staticmethod
+    def _cache_name(name, params):
+        suffix = ":".join(f"{key}={params[key]}" for key in sorted(params))
+        return f"widget:{name}:{suffix}"
+
+    # =========================
+    # Single widget
+    # =========================
+
+    @staticmethod
+    def _context(user):
+        return AuthorizationContext.for_user(user)
+
+    @staticmethod
+    def etag(user, name, params):
+        return DashboardCache.etag(
+            DashboardWidgetService._cache_name(name, params),
+            DashboardWidgetService._context(user),
+            extra_versions=_EXTRA_VERSIONS,
+        )
+
+    @staticmethod
+    def compute(user, name, params, context=None):
+        """
+        القياس "widget.<name>" يشمل الكاش (ما يراه المستخدم)، ومكونات الحساب
+        الفعلي تُقاس تحت "dashboard.*" عند عدم وجود الودجت في الكاش
+        """
+        context = context or DashboardWidgetService._context(user)
+        with instrument(f"widget.{name}") as measurement:
+            data = DashboardCache.get_or_compute(
+                DashboardWidgetService._cache_name(name, params),
+                context,
+                lambda: DashboardService.widget(name, context, **params),
+                extra_versions=_EXTRA_VERSIONS,
+            )
+            measurement.rows = count_rows(data)
+        return data
+
+    # =========================
+    # Batch
+    # =========================
+
+    @staticmethod
+    def workers() -> int:
+        return getattr(settings, "OHSMS_DASHBOARD_WORKERS", 4)
+
+    @staticmethod
+    def batch_etag(user, names, query):
+        """
+        None إذا كانت أي ودجت غير مخزنة أو قديمة (الاستجابة تُحسب كاملة)
+        """
+        parts = [
+            DashboardWidgetService.etag(user, name, DashboardWidgetService.params(name, query))
+            for name in names
+        ]
+        if None in parts:
+            return None
+        return hashlib.sha1("|".join(parts).encode()).hexdigest()[:20]
+
+    @staticmethod
+    def _run(user, context, name, params):
+        """
+        تنفيذ داخل خيط المجمع: الاتصال الخاص بالخيط يُعاد استخدامه
+        ويُغلق حسب CONN_MAX_AGE (مثل نهاية الطلب)
+        """
+        try:
+            return DashboardWidgetService.compute(user, name, params, context)
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    def _collect(result, name, get):
+        try:
+            result["widgets"][name] = get()
+        except ValidationFailed as e:
+            result["errors"][name] = e.message
+        except Exception:
+            logger.exception("dashboard widget failed: %s", name)
+            result["errors"][name] = "تعذر حساب المؤشر"
+
+    @staticmethod
+    def batch(user, names, query) -> dict:
+        """
+        {"widgets": {name: data}, "errors": {name: message}}
+
+        ودجت فاشلة لا تُسقط الباقي. OHSMS_DASHBOARD_WORKERS <= 1 → تنفيذ متتابع
+        في نفس الطلب (مثلاً SQLite أو الاختبارات)
+        """
+        context = DashboardWidgetService._context(user)
+        jobs = {name: DashboardWidgetService.params(name, query) for name in names}
+
+        result = {"widgets": {}, "errors": {}}
+
+        if DashboardWidgetService.workers() <= 1 or len(jobs) == 1:
+            for name, params in jobs.items():
+                DashboardWidgetService._collect(
+                    result, name, lambda: DashboardWidgetService.compute(user, name, params, context)
+                )
+            return result
+
+        executor = _executor()
+        futures = {
+            name: executor.submit(DashboardWidgetService._run, user, context, name, params)
+            for name, params in jobs.items()
+        }
+        for name, future in futures.items():
+            DashboardWidgetService._collect(result, name, future.result)
+        return result
@@ -0,0 +1,339 @@
+import re
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import F
+
+from ohsms.core.errors import ValidationFailed
+
+# حقل مترجم: options = frozenset للتحقق، choices = نفس الخيارات بترتيبها للعرض
+SchemaField = namedtuple(
+    "SchemaField",
+    ["id", "label", "field_type", "is_required", "order", "options", "choices"],
+)
+
+# إجابة بعد التحقق: value = النص القانوني للتخزين، typed = القيمة بنوعها
+CleanAnswer = namedtuple("CleanAnswer", ["field", "value", "typed"])
+
+CHOICE_TYPES = ("select", "radio")
+
+_OPTION_SEPARATORS = re.compile(r"[,،]")
+
+_TRUE = frozenset({"1", "true", "yes", "on", "نعم"})
+_FALSE = frozenset({"0", "false", "no", "off", "لا"})
+
+_lock = threading.Lock()
+_cache = OrderedDict()
+
+
+def parse_options(raw) -> tuple:
+    """
+    "أ, ب،ج" → ("أ", "ب", "ج") - بدون فراغات أو تكرار
+    """
+    return tuple(dict.fromkeys(
+        option.strip() for option in _OPTION_SEPARATORS.split(raw or "") if option.strip()
+    ))
+
+
+# =========================
+# Coercers (raw text → (canonical text, typed value))
+# =========================
+
+def _text(field, raw):
+    return raw, raw
+
+
+def _number(field, raw):
+    try:
+        value = Decimal(raw)
+    except InvalidOperation:
+        raise ValueError("رقم غير صحيح")
+    if not value.is_finite():
+        raise ValueError("رقم غير صحيح")
+    return format(value.normalize(), "f"), value
+
+
+def _date(field, raw):
+    try:
+        value = date.fromisoformat(raw)
+    except ValueError:
+        raise ValueError("تاريخ غير صحيح (YYYY-MM-DD)")
+    return value.isoformat(), value
+
+
+def _boolean(field, raw):
+    lowered = raw.lower()
+    if lowered in _TRUE:
+        return "true", True
+    if lowered in _FALSE:
+        return "false", False
+    raise ValueError("القيمة يجب أن تكون نعم أو لا")
+
+
+def _choice(field, raw):
+    if raw not in field.options:
+        raise ValueError("خيار غير موجود")
+    return raw, raw
+
+
+COERCERS = {
+    "text": _text,
+    "textarea": _text,
+    "number": _number,
+    "date": _date,
+    "checkbox": _boolean,
+    "select": _choice,
+    "radio": _choice,
+}
+
+# عمود الإجابة المصنّف لكل نوع (النص الحر يبقى في value فقط)
+TYPED_COLUMNS = {
+    "number": "value_number",
+    "date": "value_date",
+    "checkbox": "value_bool",
+    "select": "value_option",
+    "radio": "value_option",
+}
+
+OPTION_MAX_LENGTH = 255
+
+
+def typed_columns(field_type, typed) -> dict:
+    """
+    {"value_number": 41.5} ... لتمريرها إلى FormAnswer(...)
+    """
+    column = TYPED_COLUMNS.get(field_type)
+    if column is None or typed is None:
+        return {}
+    if column == "value_number":
+        return {column: float(typed)}
+    if column == "value_option" and len(typed) > OPTION_MAX_LENGTH:
+        return {}
+    return {column: typed}
+
+
+# =========================
+# Answer predicates (FormSubmission.objects.where_answer)
+# =========================
+
+ANSWER_OPERATORS = {
+    "eq": "exact",
+    "gt": "gt",
+    "gte": "gte",
+    "lt": "lt",
+    "lte": "lte",
+    "in": "in",
+    "range": "range",
+}
+
+_TEXT_OPERATORS = ("eq", "in")
+
+
+def _field_type(field):
+    field_type = getattr(field, "field_type", None)
+    if field_type is not None:
+        return field.id, field_type
+
+    from ohsms.models import FormField
+
+    field_type = FormField.objects.filter(pk=field).values_list("field_type", flat=True).first()
+    if field_type is None:
+        raise ValidationFailed(message="حقل غير موجود", details={"field": field})
+    return field, field_type
+
+
+def _coerce_operand(field_type, value):
+    raw = "" if value is None else str(value).strip()
+    if field_type in CHOICE_TYPES:
+        return raw
+    try:
+        _, typed = COERCERS.get(field_type, _text)(None, raw)
+    except ValueError as e:
+        raise ValidationFailed(message=str(e), details={"value": value})
+    return float(typed) if field_type == "number" else typed
+
+
+def answer_lookup(field, op, value) -> dict:
+    """
+    (حقل، عملية، قيمة) → شروط filter() على answers__ بعمود نوع الحقل
+
+    field: FormField / SchemaField / id (استعلام واحد لمعرفة النوع)
+    """
+    field_id, field_type = _field_type(field)
+
+    if op not in ANSWER_OPERATORS:
+        raise ValidationFailed(message="عملية غير معروفة", details={"op": op})
+
+    column = TYPED_COLUMNS.get(field_type, "value")
+    if column == "value" and op not in _TEXT_OPERATORS:
+        raise ValidationFailed(message="الحقول النصية تدعم المساواة فقط", details={"op": op})
+
+    if op in ("in", "range"):
+        operand = [_coerce_operand(field_type, item) for item in value]
+        if op == "range" and len(operand) != 2:
+            raise ValidationFailed(message="range يحتاج قيمتين", details={"value": value})
+    else:
+        operand = _coerce_operand(field_type, value)
+
+    return {
+        "answers__field_id": field_id,
+        f"answers__{column}__{ANSWER_OPERATORS[op]}": operand,
+    }
+
+
+class FormSchema:
+    """
+    حقول نموذج مترجمة مرة واحدة لكل (نموذج، schema_version)
+
+    - استعلام واحد عند الترجمة، ثم التحقق من أي تقديم بدون استعلامات
+    - الخيارات مفككة مسبقًا (frozenset)، ولكل نوع محوّل قيمة ثابت
+    - نسخة لكل عملية في LRU محدود؛ الإصدار يُقرأ من صف النموذج نفسه،
+      فأي worker يرى التعديل مع أول FormTemplate محمّل بعده
+    """
+
+    MAX_CACHED = 256
+
+    def __init__(self, form_id, version, fields, title=""):
+        self.form_id = form_id
+        self.version = version
+        self.title = title
+        self.fields = tuple(sorted(fields, key=lambda field: (field.order, field.id)))
+        self.by_id = {field.id: field for field in self.fields}
+
+        # FormTemplateVersion المثبت لهذا الإصدار (ohsms.services.form_versions)
+        self.version_id = None
+
+    # =========================
+    # Loading
+    # =========================
+
+    @classmethod
+    def compile(cls, form_id, version, rows, title=""):
+        """
+        rows: (id, label, field_type, is_required, order, options) من FormField
+        """
+        fields = []
+        for pk, label, field_type, is_required, order, options in rows:
+            choices = parse_options(options) if field_type in CHOICE_TYPES else ()
+            fields.append(SchemaField(pk, label, field_type, is_required, order, frozenset(choices), choices))
+        return cls(form_id, version, fields, title=title)
+
+    @classmethod
+    def from_blob(cls, form_id, version, blob):
+        """
+        عكس as_blob() - من FormTemplateVersion.schema
+        """
+        fields = [
+            SchemaField(
+                item["id"], item["label"], item["field_type"], item["is_required"], item["order"],
+                frozenset(item["choices"]), tuple(item["choices"]),
+            )
+            for item in blob["fields"]
+        ]
+        return cls(form_id, version, fields, title=blob.get("title", ""))
+
+    def as_blob(self) -> dict:
+        return {
+            "title": self.title,
+            "fields": [
+                {
+                    "id": field.id,
+                    "label": field.label,
+                    "field_type": field.field_type,
+                    "is_required": field.is_required,
+                    "order": field.order,
+                    "choices": list(field.choices),
+                }
+                for field in self.fields
+            ],
+        }
+
+    @classmethod
+    def load(cls, form):
+        from ohsms.models import FormField
+
+        rows = FormField.objects.filter(form_id=form.id).values_list(
+            "id", "label", "field_type", "is_required", "order", "options"
+        )
+        return cls.compile(form.id, form.schema_version, rows, title=form.title)
+
+    @classmethod
+    def for_form(cls, form):
+        with _lock:
+            schema = _cache.get(form.id)
+            if schema is not None and schema.version == form.schema_version:
+                _cache.move_to_end(form.id)
+                return schema
+
+        schema = cls.load(form)
+
+        with _lock:
+            _cache[form.id] = schema
+            _cache.move_to_end(form.id)
+            while len(_cache) > cls.MAX_CACHED:
+                _cache.popitem(last=False)
+        return schema
+
+    @staticmethod
+    def bump(form_id, form=None):
+        """
+        تغيّر حقول النموذج → إصدار جديد (ويُحدّث كائن النموذج المحمّل إن وُجد)
+        """
+        from ohsms.models import FormTemplate
+
+        updated = FormTemplate.objects.filter(pk=form_id).update(schema_version=F("schema_version") + 1)
+        with _lock:
+            _cache.pop(form_id, None)
+
+        if form is not None and updated:
+            form.refresh_from_db(fields=["schema_version"])
+
+    # =========================
+    # Validation
+    # =========================
+
+    def validate(self, answers) -> list:
+        """
+        answers: [{"field": FormField | id, "value": ...}] → [CleanAnswer] بترتيب الحقول
+
+        كل الأخطاء في مرور واحد: ValidationFailed(details={field_id: رسالة})
+        (الحقل غير المعروف بموقعه في القائمة: "#index")
+        """
+        errors = {}
+        clean = {}
+
+        for index, answer in enumerate(answers):
+            field_ref = answer.get("field")
+            field = self.by_id.get(getattr(field_ref, "pk", field_ref))
+            if field is None:
+                errors[f"#{index}"] = "الحقل لا يتبع هذا النموذج"
+                continue
+            if field.id in clean:
+                errors[str(field.id)] = "إجابة مكررة لنفس الحقل"
+                continue
+
+            value = answer.get("value")
+            raw = "" if value is None else str(value).strip()
+            if not raw:
+                clean[field.id] = CleanAnswer(field, "", None)
+                continue
+
+            try:
+                text, typed = COERCERS.get(field.field_type, _text)(field, raw)
+            except ValueError as e:
+                errors[str(field.id)] = str(e)
+                continue
+            clean[field.id] = CleanAnswer(field, text, typed)
+
+        for field in self.fields:
+            if field.is_required and str(field.id) not in errors and (
+                field.id not in clean or clean[field.id].typed is None
+            ):
+                errors[str(field.id)] = "هذا الحقل إلزامي"
+
+        if errors:
+            raise ValidationFailed(message="إجابات غير صالحة", details=errors)
+
+        return [clean[field.id] for field in self.fields if field.id in clean]
@@ -1,4 +1,5 @@
 from django.contrib.auth.models import User
+from django.db import transaction
 from ohsms.models import FormEvent
 
 from ohsms.models import (
@@ -8,6 +9,9 @@ from ohsms.models import (
     FormAnswer,
 )
 from ohsms.services.audit_log import AuditLogService
+from ohsms.services.form_schema import CHOICE_TYPES, COERCERS, FormSchema, parse_options, typed_columns
+from ohsms.services.form_stats import FormStatsService
+from ohsms.services.form_versions import FormVersionService
 from ohsms.core.model_context import allow_model_mutation
 from ohsms.core.errors import PermissionDenied, ValidationFailed
 
@@ -17,6 +21,9 @@ class FormService:
     Source of Truth لإدارة النماذج الرقمية
     """
 
+    # الإجابات في INSERT واحد حتى هذا الحجم (ثم دفعات)
+    ANSWERS_BATCH_SIZE = 500
+
     # =========================
     # Guards
     # =========================
@@ -165,8 +172,15 @@ class FormService:
         if not label:
             raise ValidationFailed(message="عنوان الحقل إلزامي")
 
+        if field_type not in COERCERS:
+            raise ValidationFailed(message="نوع حقل غير معروف", details={"field_type": field_type})
+
+        if field_type in CHOICE_TYPES and not parse_options(options):
+            raise ValidationFailed(message="حقل الاختيار يحتاج خيارات", details={"options": options})
+
         allow_model_mutation()
 
+        # الحفظ يرفع form.schema_version (ohsms.signals) → إعادة ترجمة المخطط
         field = FormField.objects.create(
             form=form,
             label=label,
@@ -203,6 +217,7 @@ class FormService:
     # =========================
 
     @staticmethod
+    @transaction.atomic
     def submit_form(
         *,
         form: FormTemplate,
@@ -210,22 +225,50 @@ class FormService:
         actor: User | None = None,
         submitted_by: str = "",
     ) -> FormSubmission:
+        """
+        تقديم كامل أو لا شيء، بعدد ثابت من الاستعلامات مهما كان عدد الحقول:
+        التحقق من المخطط المترجم (بدون استعلامات) ثم
+        التقديم (مثبت على إصدار النموذج) + الإجابات (bulk_create)
+        + إحصاءات الحقول اليومية + FormEvent + AuditLog
+        """
         if not form.is_active:
             raise ValidationFailed(message="النموذج غير مفعل")
 
+        schema = FormSchema.for_form(form)
+        clean = schema.validate(answers)
+
         allow_model_mutation()
 
         submission = FormSubmission.objects.create(
             form=form,
+            template_version_id=FormVersionService.pin(form, schema),
             submitted_by=submitted_by or (actor.username if actor else ""),
         )
 
-        for ans in answers:
-            FormAnswer.objects.create(
-                submission=submission,
-                field=ans["field"],
-                value=ans.get("value", ""),
-            )
+        rows = FormAnswer.objects.bulk_create(
+            [
+                FormAnswer(
+                    submission=submission,
+                    field_id=answer.field.id,
+                    value=answer.value,
+                    **typed_columns(answer.field.field_type, answer.typed),
+                )
+                for answer in clean
+            ],
+            batch_size=FormService.ANSWERS_BATCH_SIZE,
+        )
+        FormStatsService.record(submission, rows)
+
+        FormEvent.objects.create(
+            form=form,
+            submission=submission,
+            action="submit",
+            actor=actor,
+            payload={
+                "answers_count": len(clean),
+                "submitted_by": submitted_by,
+            },
+        )
 
         AuditLogService.log(
             user=actor,
@@ -234,16 +277,5 @@ class FormService:
             object_id=submission.id,
             description=f"تقديم نموذج: {form.title}",
         )
-        FormEvent.objects.create(
-    form=form,
-    submission=submission,
-    action="submit",
-    actor=actor,
-    payload={
-        "answers_count": len(answers),
-        "submitted_by": submitted_by,
-    },
-)
-
 
         return submission
@@ -1,12 +1,15 @@
 from django.db.models import Count
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, time, timedelta
 
+from ohsms.core.instrumentation import instrumented
 from ohsms.models import (
     FormTemplate,
     FormSubmission,
     FormEvent,
 )
+from ohsms.services.dashboard_cache import DashboardCache, FORMS_VERSION
+from ohsms.services.form_stats import FormStatsService
 
 
 class FormSnapshotService:
@@ -19,7 +22,21 @@ class FormSnapshotService:
     # =========================
 
     @staticmethod
+    @instrumented("snapshot.forms_dashboard")
     def forms_dashboard_snapshot():
+        """
+        لقطة واحدة لكل النظام (غير مقيدة بنطاق) - تُبطل مع أي FormEvent
+        وتُحسب مرة واحدة فقط عند تزامن الطلبات
+        """
+        return DashboardCache.get_or_compute(
+            "forms_dashboard",
+            None,
+            FormSnapshotService._forms_dashboard,
+            version_names=[FORMS_VERSION],
+        )
+
+    @staticmethod
+    def _forms_dashboard():
         return {
             "kpis": FormSnapshotService.forms_kpis(days=90),
             "events_by_action": FormSnapshotService.events_by_action(days=90),
@@ -88,3 +105,30 @@ class FormSnapshotService:
             }
             for s in qs
         ]
+
+    # =========================
+    # Per-field analytics
+    # =========================
+
+    @staticmethod
+    @instrumented("snapshot.form_analytics")
+    def form_analytics(*, form, days: int = 30):
+        """
+        تحليلات أسئلة نموذج واحد لآخر N يوم من ملخصات FormFieldDailyStat
+        (استعلامان: عدد التقديمات + دمج ملخصات الأيام)
+
+        نفس حدود الأيام المحلية للاثنين: [بداية start_day، بداية اليوم التالي لـ end_day)
+        """
+        end_day = timezone.localdate()
+        start_day = end_day - timedelta(days=days)
+        start = timezone.make_aware(datetime.combine(start_day, time.min))
+        end = timezone.make_aware(datetime.combine(end_day + timedelta(days=1), time.min))
+
+        return {
+            "form_id": form.id,
+            "title": form.title,
+            "start": start_day,
+            "end": end_day,
+            "submissions": FormSubmission.objects.filter(form=form).submitted_between(start, end).count(),
+            "fields": FormStatsService.field_stats(form, start_day, end_day),
+        }
@@ -0,0 +1,228 @@
+from django.db import connection, transaction
+from django.db.models import Max, Min, Q, Sum
+from django.utils import timezone
+
+from ohsms.core.histogram import NUMBER_HISTOGRAM
+from ohsms.models import FormAnswer, FormFieldDailyStat
+from ohsms.services.form_schema import FormSchema
+
+
+class FormStatsService:
+    """
+    إحصاءات إجابات النماذج لكل حقل × يوم (FormFieldDailyStat)
+
+    - record(): داخل معاملة submit_form باستعلام upsert واحد
+      (INSERT ... ON CONFLICT DO UPDATE بزيادة العدادات؛ PostgreSQL / SQLite)
+    - field_stats(): أي فترة = استعلام واحد يدمج ملخصات الأيام
+    - rebuild() لإعادة البناء الكامل من الأعمدة المصنّفة (manage.py rebuild_form_stats)
+    """
+
+    BATCH_SIZE = 2000
+    # صفوف لكل upsert (9 معاملات للصف ضمن حد متغيرات SQLite)
+    UPSERT_BATCH_SIZE = 100
+
+    # =========================
+    # Deltas
+    # =========================
+
+    @staticmethod
+    def _add(deltas, field_id, metric, key="", number=None):
+        delta = deltas.get((field_id, metric, key))
+        if delta is None:
+            delta = deltas[(field_id, metric, key)] = [0, 0.0, number, number]
+        delta[0] += 1
+        if number is not None:
+            delta[1] += number
+            delta[2] = min(delta[2], number)
+            delta[3] = max(delta[3], number)
+
+    @staticmethod
+    def _collect(deltas, field_id, value, number, day_value, flag, option):
+        """
+        إجابة واحدة (من أعمدتها المصنّفة) → مساهماتها في المقاييس
+        """
+        if not value:
+            return
+
+        add = FormStatsService._add
+        add(deltas, field_id, "answered")
+
+        if option is not None:
+            add(deltas, field_id, "option", option)
+        elif flag is not None:
+            add(deltas, field_id, "option", "true" if flag else "false")
+        elif number is not None:
+            add(deltas, field_id, "number", number=number)
+            add(deltas, field_id, "number_bucket", str(NUMBER_HISTOGRAM.signed_bucket(number)))
+        elif day_value is not None:
+            add(deltas, field_id, "date", day_value.strftime("%Y-%m"))
+
+    @staticmethod
+    def _day(value):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+
+    # =========================
+    # Incremental updates
+    # =========================
+
+    @staticmethod
+    def record(submission, answers):
+        """
+        answers: كائنات FormAnswer بعد bulk_create (الأعمدة المصنّفة معبأة)
+        """
+        deltas = {}
+        for answer in answers:
+            FormStatsService._collect(
+                deltas, answer.field_id, answer.value,
+                answer.value_number, answer.value_date, answer.value_bool, answer.value_option,
+            )
+        if deltas:
+            FormStatsService._apply(FormStatsService._day(submission.submitted_at), submission.form_id, deltas)
+
+    # (دالة القيمة الصغرى/الكبرى لعمودين) حسب قاعدة البيانات
+    _EXTREMES = {
+        "postgresql": ("LEAST", "GREATEST"),
+        "sqlite": ("MIN", "MAX"),
+    }
+
+    @staticmethod
+    def _apply(day, form_id, deltas):
+        """
+        upsert واحد لكل التغييرات: INSERT ... VALUES ... ON CONFLICT DO UPDATE
+        (نفس عبارة SQL مهما كان عدد صفوف اليوم الموجودة، بدون قراءة مسبقة
+         وبدون CASE لكل صف، وآمن مع التقديمات المتزامنة)
+        """
+        least, greatest = FormStatsService._EXTREMES[connection.vendor]
+        qn = connection.ops.quote_name
+        table = qn(FormFieldDailyStat._meta.db_table)
+        columns = ("day", "form_id", "field_id", "metric", "key", "count", "total", "min_value", "max_value")
+
+        def extreme(func, column):
+            # القيمة الجديدة NULL (مقاييس غير رقمية) → تبقى القيمة المخزنة
+            column = qn(column)
+            return (
+                f"{column} = CASE WHEN EXCLUDED.{column} IS NULL THEN {table}.{column} "
+                f"WHEN {table}.{column} IS NULL THEN EXCLUDED.{column} "
+                f"ELSE {func}({table}.{column}, EXCLUDED.{column}) END"
+            )
+
+        items = list(deltas.items())
+        for offset in range(0, len(items), FormStatsService.UPSERT_BATCH_SIZE):
+            chunk = items[offset:offset + FormStatsService.UPSERT_BATCH_SIZE]
+            params = []
+            for (field_id, metric, key), (count, total, low, high) in chunk:
+                params.extend((day, form_id, field_id, metric, key, count, total, low, high))
+
+            row = "(" + ", ".join(["%s"] * len(columns)) + ")"
+            sql = (
+                f"INSERT INTO {table} ({', '.join(qn(column) for column in columns)}) "
+                f"VALUES {', '.join([row] * len(chunk))} "
+                f"ON CONFLICT ({qn('field_id')}, {qn('day')}, {qn('metric')}, {qn('key')}) DO UPDATE SET "
+                f"{qn('count')} = {table}.{qn('count')} + EXCLUDED.{qn('count')}, "
+                f"{qn('total')} = {table}.{qn('total')} + EXCLUDED.{qn('total')}, "
+                f"{extreme(least, 'min_value')}, {extreme(greatest, 'max_value')}"
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+
+    # =========================
+    # Rebuild
+    # =========================
+
+    @staticmethod
+    @transaction.atomic
+    def rebuild(batch_size: int = None) -> int:
+        """
+        إعادة بناء الجدول من FormAnswer (تجميع في الذاكرة: صف لكل حقل × يوم × مفتاح)
+        """
+        batch_size = batch_size or FormStatsService.BATCH_SIZE
+
+        rows = (
+            FormAnswer.objects
+            .values_list(
+                "submission__submitted_at", "submission__form_id", "field_id", "value",
+                "value_number", "value_date", "value_bool", "value_option",
+            )
+            .order_by()
+            .iterator(chunk_size=batch_size)
+        )
+
+        groups = {}
+        for submitted_at, form_id, field_id, *values in rows:
+            deltas = groups.setdefault((FormStatsService._day(submitted_at), form_id), {})
+            FormStatsService._collect(deltas, field_id, *values)
+
+        FormFieldDailyStat.objects.all().delete()
+        objects = FormFieldDailyStat.objects.bulk_create(
+            (
+                FormFieldDailyStat(
+                    day=day, form_id=form_id, field_id=field_id, metric=metric, key=key,
+                    count=count, total=total, min_value=low, max_value=high,
+                )
+                for (day, form_id), deltas in groups.items()
+                for (field_id, metric, key), (count, total, low, high) in deltas.items()
+            ),
+            batch_size=batch_size,
+        )
+        return len(objects)
+
+    # =========================
+    # Reads
+    # =========================
+
+    @staticmethod
+    def field_stats(form, start_day, end_day) -> list:
+        """
+        [{"field_id", "label", "field_type", "answered", ...}] بترتيب حقول النموذج الحالية
+        (ثم الحقول المحذوفة التي لها إجابات في الفترة)
+
+        options: {خيار: عدد} | number: {count, sum, min, max, avg, p50, p90, p99} | dates: {YYYY-MM: عدد}
+        """
+        rows = (
+            FormFieldDailyStat.objects
+            .filter(form=form, day__gte=start_day, day__lte=end_day)
+            .values("field_id", "metric", "key")
+            .annotate(
+                count=Sum("count"),
+                total=Sum("total"),
+                low=Min("min_value", filter=Q(metric="number")),
+                high=Max("max_value", filter=Q(metric="number")),
+            )
+            .order_by()
+        )
+
+        schema = FormSchema.for_form(form)
+        stats = {
+            field.id: {"field_id": field.id, "label": field.label, "field_type": field.field_type, "answered": 0}
+            for field in schema.fields
+        }
+        buckets = {}
+
+        for row in rows:
+            stat = stats.setdefault(
+                row["field_id"],
+                {"field_id": row["field_id"], "label": None, "field_type": None, "answered": 0},
+            )
+            metric = row["metric"]
+
+            if metric == "answered":
+                stat["answered"] = row["count"]
+            elif metric == "option":
+                stat.setdefault("options", {})[row["key"]] = row["count"]
+            elif metric == "date":
+                stat.setdefault("dates", {})[row["key"]] = row["count"]
+            elif metric == "number":
+                stat["number"] = {
+                    "count": row["count"],
+                    "sum": row["total"],
+                    "min": row["low"],
+                    "max": row["high"],
+                    "avg": round(row["total"] / row["count"], 2) if row["count"] else None,
+                }
+            elif metric == "number_bucket":
+                buckets.setdefault(row["field_id"], {})[int(row["key"])] = row["count"]
+
+        for field_id, counts in buckets.items():
+            stats[field_id].setdefault("number", {}).update(NUMBER_HISTOGRAM.signed_percentiles(counts))
+
+        return list(stats.values())
@@ -0,0 +1,215 @@
+import threading
+from collections import OrderedDict
+
+from django.db import transaction
+
+from ohsms.models import FormAnswer, FormTemplateVersion
+from ohsms.services.form_schema import COERCERS, TYPED_COLUMNS, FormSchema, typed_columns
+
+_lock = threading.Lock()
+_versions = OrderedDict()
+
+
+class FormVersionService:
+    """
+    إصدارات النماذج الثابتة (FormTemplateVersion) وقراءة التقديمات منها
+
+    - كل تقديم مثبت على إصدار: الحقول كما كانت وقت التقديم حتى لو عُدّل النموذج
+    - الإصدار يُنشأ مع أول تقديم على schema_version جديد (get_or_create مرة لكل عملية)
+    - القراءة/التصدير: النسخة المترجمة من الكاش (مشتركة بين آلاف التقديمات،
+      ولا تُبطل لأنها لا تتغير) + الإجابات فقط، بدون ربط FormField لكل إجابة
+    """
+
+    MAX_CACHED = 1024
+    EXPORT_BATCH_SIZE = 500
+    BATCH_SIZE = 2000
+
+    # =========================
+    # Pinning (write path)
+    # =========================
+
+    @staticmethod
+    def pin(form, schema) -> int:
+        """
+        id الإصدار الثابت لمخطط النموذج الحالي (يُنشأ إذا لم يوجد)
+
+        الحفظ في المخطط المشترك بعد commit فقط: تراجع أول تقديم يحذف الصف المنشأ،
+        فلا يبقى معرّف إصدار غير موجود لبقية التقديمات
+        """
+        if schema.version_id is not None:
+            return schema.version_id
+
+        version, _ = FormTemplateVersion.objects.get_or_create(
+            form_id=form.id,
+            version=schema.version,
+            defaults={"schema": schema.as_blob()},
+        )
+        transaction.on_commit(lambda: setattr(schema, "version_id", version.id))
+        return version.id
+
+    # =========================
+    # Versions (read path)
+    # =========================
+
+    @staticmethod
+    def schemas(version_ids) -> dict:
+        """
+        {version_id: FormSchema} - الناقص من الكاش في استعلام واحد
+        """
+        found = {}
+        with _lock:
+            for version_id in version_ids:
+                schema = _versions.get(version_id)
+                if schema is not None:
+                    _versions.move_to_end(version_id)
+                    found[version_id] = schema
+
+        missing = set(version_ids) - set(found) - {None}
+        if missing:
+            rows = FormTemplateVersion.objects.filter(id__in=missing).values_list(
+                "id", "form_id", "version", "schema"
+            )
+            loaded = {}
+            for pk, form_id, version, blob in rows:
+                schema = loaded[pk] = FormSchema.from_blob(form_id, version, blob)
+                schema.version_id = pk
+            found.update(loaded)
+
+            with _lock:
+                _versions.update(loaded)
+                while len(_versions) > FormVersionService.MAX_CACHED:
+                    _versions.popitem(last=False)
+
+        return found
+
+    @staticmethod
+    def _schema_of(submission, schemas):
+        schema = schemas.get(submission.template_version_id)
+        if schema is None:
+            # تقديمات أُنشئت خارج FormService (Admin) بدون إصدار → الحقول الحالية
+            schema = FormSchema.for_form(submission.form)
+        return schema
+
+    @staticmethod
+    def _render(submission, schema, values) -> dict:
+        return {
+            "id": submission.id,
+            "form_id": submission.form_id,
+            "title": schema.title,
+            "version": schema.version,
+            "submitted_by": submission.submitted_by,
+            "submitted_at": submission.submitted_at,
+            "answers": [
+                {
+                    "field_id": field.id,
+                    "label": field.label,
+                    "field_type": field.field_type,
+                    "value": values[field.id],
+                }
+                for field in schema.fields
+                if field.id in values
+            ],
+        }
+
+    @staticmethod
+    def read(submission) -> dict:
+        """
+        تقديم واحد كما كان وقت إرساله
+        """
+        schemas = FormVersionService.schemas([submission.template_version_id])
+        values = dict(
+            FormAnswer.objects.filter(submission_id=submission.id).values_list("field_id", "value")
+        )
+        return FormVersionService._render(
+            submission, FormVersionService._schema_of(submission, schemas), values
+        )
+
+    @staticmethod
+    def export(submissions, batch_size: int = None):
+        """
+        تصدير تدفقي: لكل دفعة استعلام للتقديمات + استعلام للإجابات
+        (+ استعلام للإصدارات غير المخزنة فقط)
+        """
+        batch_size = batch_size or FormVersionService.EXPORT_BATCH_SIZE
+
+        batch = []
+        for submission in submissions.order_by("id").iterator(chunk_size=batch_size):
+            batch.append(submission)
+            if len(batch) == batch_size:
+                yield from FormVersionService._export_batch(batch)
+                batch = []
+        if batch:
+            yield from FormVersionService._export_batch(batch)
+
+    @staticmethod
+    def _export_batch(batch):
+        schemas = FormVersionService.schemas({submission.template_version_id for submission in batch})
+
+        values = {submission.id: {} for submission in batch}
+        answers = FormAnswer.objects.filter(submission_id__in=list(values)).values_list(
+            "submission_id", "field_id", "value"
+        )
+        for submission_id, field_id, value in answers:
+            values[submission_id][field_id] = value
+
+        for submission in batch:
+            yield FormVersionService._render(
+                submission, FormVersionService._schema_of(submission, schemas), values[submission.id]
+            )
+
+    # =========================
+    # Typed answer columns
+    # =========================
+
+    @staticmethod
+    def _typed(field, raw):
+        columns = dict.fromkeys(set(TYPED_COLUMNS.values()))
+        coerce = COERCERS.get(field.field_type) if field is not None else None
+        if coerce is not None and raw:
+            try:
+                _, typed = coerce(field, raw.strip())
+            except ValueError:
+                # قيمة قديمة قبل التحقق المصنّف → تبقى نصًا فقط
+                return columns
+            columns.update(typed_columns(field.field_type, typed))
+        return columns
+
+    @staticmethod
+    def rebuild_typed_columns(batch_size: int = None) -> int:
+        """
+        تعبئة value_number / value_date / value_bool / value_option لكل الإجابات
+        حسب نوع الحقل في إصدار التقديم (للبيانات السابقة على الأعمدة المصنّفة)
+        """
+        batch_size = batch_size or FormVersionService.BATCH_SIZE
+        columns = sorted(set(TYPED_COLUMNS.values()))
+
+        rows = (
+            FormAnswer.objects
+            .values_list("id", "field_id", "value", "submission__template_version_id")
+            .order_by("id")
+            .iterator(chunk_size=batch_size)
+        )
+
+        total = 0
+        batch = []
+        for answer_id, field_id, value, version_id in rows:
+            batch.append((answer_id, field_id, value, version_id))
+            if len(batch) >= batch_size:
+                total += FormVersionService._rebuild_batch(batch, columns)
+                batch = []
+        if batch:
+            total += FormVersionService._rebuild_batch(batch, columns)
+        return total
+
+    @staticmethod
+    def _rebuild_batch(batch, columns) -> int:
+        schemas = FormVersionService.schemas({version_id for _, _, _, version_id in batch})
+
+        answers = []
+        for answer_id, field_id, value, version_id in batch:
+            schema = schemas.get(version_id)
+            field = schema.by_id.get(field_id) if schema is not None else None
+            answers.append(FormAnswer(id=answer_id, **FormVersionService._typed(field, value)))
+
+        FormAnswer.objects.bulk_update(answers, columns)
+        return len(answers)
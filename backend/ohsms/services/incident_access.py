@@ -0,0 +1,148 @@
+from django.db import transaction
+
+from ohsms.core.authorization import AuthorizationContext
+from ohsms.models import Incident, IncidentAccess
+
+
+class IncidentAccessService:
+    """
+    صيانة جدول IncidentAccess (ACL البلاغات) بشكل تدريجي
+
+    تغيير UserRole لا يتطلب إعادة كتابة أي سطر: الجدول يربط البلاغ بعُقد
+    الهيكل التنظيمي، وتحويل المستخدم إلى عُقد يتم من AuthorizationContext
+    الذي يُبطل كاشه مع كل تعديل على الأدوار (ohsms.signals).
+    """
+
+    # حقول البلاغ التي تغيّر الرؤية (بالاسم أو attname في update_fields)
+    ACL_FIELDS = frozenset({
+        "actor", "actor_id",
+        "assigned_to", "assigned_to_id",
+        "branch", "branch_id",
+        "department", "department_id",
+        "section", "section_id",
+    })
+
+    BATCH_SIZE = 2000
+
+    # =========================
+    # Principals
+    # =========================
+
+    @staticmethod
+    def _principals(actor_id, assigned_to_id, branch_id, department_id, section_id) -> set:
+        return {
+            f"{prefix}:{value}"
+            for prefix, value in (
+                ("u", actor_id),
+                ("u", assigned_to_id),
+                ("b", branch_id),
+                ("d", department_id),
+                ("s", section_id),
+            )
+            if value
+        }
+
+    @staticmethod
+    def principals_for_incident(incident) -> set:
+        return IncidentAccessService._principals(
+            incident.actor_id,
+            incident.assigned_to_id,
+            incident.branch_id,
+            incident.department_id,
+            incident.section_id,
+        )
+
+    @staticmethod
+    def principals_for_user(user) -> list:
+        """
+        المستخدم نفسه + نطاقاته (بعد إسقاط المغطى) بصيغة principal
+        """
+        context = AuthorizationContext.for_user(user)
+        branch_ids, department_ids, section_ids = context.scope_signature
+
+        principals = [f"u:{user.pk}"]
+        principals += [f"b:{pk}" for pk in branch_ids]
+        principals += [f"d:{pk}" for pk in department_ids]
+        principals += [f"s:{pk}" for pk in section_ids]
+        return principals
+
+    @staticmethod
+    def visible_incident_ids(user):
+        """
+        Subquery لمعرفات البلاغات المرئية (تُستخدم داخل id__in)
+        """
+        return (
+            IncidentAccess.objects
+            .filter(principal__in=IncidentAccessService.principals_for_user(user))
+            .values("incident_id")
+        )
+
+    # =========================
+    # Maintenance
+    # =========================
+
+    @staticmethod
+    @transaction.atomic
+    def sync(incident):
+        """
+        مزامنة أسطر بلاغ واحد (إضافة الناقص وحذف الزائد فقط)
+        """
+        wanted = IncidentAccessService.principals_for_incident(incident)
+        existing = set(
+            IncidentAccess.objects
+            .filter(incident_id=incident.pk)
+            .values_list("principal", flat=True)
+        )
+
+        stale = existing - wanted
+        if stale:
+            IncidentAccess.objects.filter(
+                incident_id=incident.pk,
+                principal__in=stale,
+            ).delete()
+
+        missing = wanted - existing
+        if missing:
+            IncidentAccess.objects.bulk_create(
+                [
+                    IncidentAccess(incident_id=incident.pk, principal=principal)
+                    for principal in missing
+                ],
+                ignore_conflicts=True,
+            )
+
+    @staticmethod
+    @transaction.atomic
+    def rebuild(batch_size: int = None) -> int:
+        """
+        إعادة بناء الجدول بالكامل (للاسترجاع بعد تعديلات خارج الـ ORM)
+        """
+        batch_size = batch_size or IncidentAccessService.BATCH_SIZE
+
+        IncidentAccess.objects.all().delete()
+
+        rows = (
+            Incident.objects
+            .values_list("id", "actor_id", "assigned_to_id", "branch_id", "department_id", "section_id")
+            .order_by("id")
+            .iterator(chunk_size=batch_size)
+        )
+
+        total = 0
+        batch = []
+        for incident_id, *acl_values in rows:
+            batch += [
+                IncidentAccess(incident_id=incident_id, principal=principal)
+                for principal in IncidentAccessService._principals(*acl_values)
+            ]
+
+            if len(batch) >= batch_size:
+                IncidentAccess.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+
+        if batch:
+            IncidentAccess.objects.bulk_create(batch)
+            total += len(batch)
+
+        return total
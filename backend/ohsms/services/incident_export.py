@@ -0,0 +1,213 @@
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from ohsms.core.streaming import stream_csv, stream_xlsx
+from ohsms.models import Incident, IncidentEvent
+from ohsms.services.org_tree import OrgTree
+
+
+def _local(value):
+    """
+    تاريخ بتوقيت النظام وبدون أجزاء الثانية (للقراءة في Excel)
+    """
+    if value is None:
+        return None
+    return timezone.localtime(value).strftime("%Y-%m-%d %H:%M")
+
+
+# بداية نص يفسره Excel / LibreOffice كمعادلة (CSV injection)
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _text(value):
+    """
+    نص مُدخل من المستخدم كما هو، مع ' قبل ما يبدأ كمعادلة
+    """
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _csv_rows(rows):
+    """
+    الهروب في CSV فقط (خلايا XLSX نصية inline فلا تُفسَّر كمعادلات)
+    """
+    for row in rows:
+        yield [_text(value) for value in row]
+
+
+class IncidentExportService:
+    """
+    تصدير سجل البلاغات (CSV / XLSX) بذاكرة ثابتة
+
+    - نفس نطاق سجل البلاغات: Incident.objects.visible_to(user)
+    - values() + iterator(chunk_size) → لا كائنات موديل ولا تحميل كامل
+    - مسار الموقع من OrgTree، وآخر حدث عبر Subquery (بدون N+1)
+    - نصوص CSV تمر عبر _text (لا تُنفذ كمعادلات عند فتح الملف)
+    """
+
+    CHUNK_SIZE = 2000
+
+    INCIDENT_HEADER = [
+        "رقم البلاغ",
+        "التاريخ",
+        "النوع",
+        "الحالة",
+        "العنوان",
+        "الموقع",
+        "المحال إليه",
+        "بدء المعالجة",
+        "آخر إجراء",
+        "آخر حالة",
+        "تاريخ آخر إجراء",
+    ]
+
+    EVENT_HEADER = [
+        "رقم البلاغ",
+        "التاريخ",
+        "الإجراء",
+        "من حالة",
+        "إلى حالة",
+        "المنفذ",
+        "ملاحظة",
+    ]
+
+    # =========================
+    # Querysets
+    # =========================
+
+    @staticmethod
+    def incidents_queryset(user):
+        last_event = (
+            IncidentEvent.objects
+            .filter(incident_id=OuterRef("pk"))
+            .order_by("-created_at", "-id")
+        )
+
+        return (
+            Incident.objects
+            .visible_to(user)
+            .annotate(
+                last_action=Subquery(last_event.values("action")[:1]),
+                last_status=Subquery(last_event.values("to_status")[:1]),
+                last_event_at=Subquery(last_event.values("created_at")[:1]),
+            )
+            .order_by("-created_at", "-id")
+            .values(
+                "id",
+                "created_at",
+                "incident_type",
+                "status",
+                "title",
+                "section_id",
+                "assigned_to__username",
+                "handled_at",
+                "last_action",
+                "last_status",
+                "last_event_at",
+            )
+        )
+
+    @staticmethod
+    def events_queryset(user):
+        return (
+            IncidentEvent.objects
+            .filter(incident_id__in=Incident.objects.visible_to(user).values("id"))
+            .order_by("incident_id", "created_at", "id")
+            .values(
+                "incident_id",
+                "created_at",
+                "action",
+                "from_status",
+                "to_status",
+                "actor",
+                "note",
+            )
+        )
+
+    # =========================
+    # Rows
+    # =========================
+
+    @staticmethod
+    def incident_rows(user):
+        tree = OrgTree.current()
+        types = dict(Incident.INCIDENT_TYPES)
+        statuses = dict(Incident.STATUS_CHOICES)
+        actions = dict(IncidentEvent.ACTION_CHOICES)
+
+        for row in IncidentExportService.incidents_queryset(user).iterator(
+            chunk_size=IncidentExportService.CHUNK_SIZE
+        ):
+            yield [
+                row["id"],
+                _local(row["created_at"]),
+                types.get(row["incident_type"], row["incident_type"]),
+                statuses.get(row["status"], row["status"]),
+                row["title"],
+                tree.label(OrgTree.SECTION, row["section_id"]),
+                row["assigned_to__username"],
+                _local(row["handled_at"]),
+                actions.get(row["last_action"], row["last_action"]),
+                statuses.get(row["last_status"], row["last_status"]),
+                _local(row["last_event_at"]),
+            ]
+
+    @staticmethod
+    def event_rows(user):
+        statuses = dict(Incident.STATUS_CHOICES)
+        actions = dict(IncidentEvent.ACTION_CHOICES)
+
+        for row in IncidentExportService.events_queryset(user).iterator(
+            chunk_size=IncidentExportService.CHUNK_SIZE
+        ):
+            yield [
+                row["incident_id"],
+                _local(row["created_at"]),
+                actions.get(row["action"], row["action"]),
+                statuses.get(row["from_status"], row["from_status"]),
+                statuses.get(row["to_status"], row["to_status"]),
+                row["actor"],
+                row["note"],
+            ]
+
+    # =========================
+    # Streams
+    # =========================
+
+    @staticmethod
+    def csv_stream(user, dataset="incidents"):
+        """
+        CSV لمجموعة واحدة: incidents أو events (المسار الزمني كملف منفصل)
+        """
+        if dataset == "events":
+            return stream_csv(
+                IncidentExportService.EVENT_HEADER,
+                _csv_rows(IncidentExportService.event_rows(user)),
+            )
+        return stream_csv(
+            IncidentExportService.INCIDENT_HEADER,
+            _csv_rows(IncidentExportService.incident_rows(user)),
+        )
+
+    @staticmethod
+    def xlsx_stream(user, include_events=False):
+        """
+        XLSX: ورقة البلاغات + (اختياري) ورقة ثانية للمسار الزمني الكامل
+        """
+        sheets = [
+            (
+                "البلاغات",
+                IncidentExportService.INCIDENT_HEADER,
+                IncidentExportService.incident_rows(user),
+            ),
+        ]
+        if include_events:
+            sheets.append(
+                (
+                    "المسار الزمني",
+                    IncidentExportService.EVENT_HEADER,
+                    IncidentExportService.event_rows(user),
+                )
+            )
+        return stream_xlsx(sheets)
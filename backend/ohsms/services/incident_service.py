@@ -4,6 +4,8 @@ from django.db import transaction
 from ohsms.core.model_context import allow_model_mutation
 from ohsms.models import Incident, IncidentEvent
 from ohsms.services.audit_log import AuditLogService
+from ohsms.services.rollups import RollupService
+from ohsms.services.sla import SlaService
 from ohsms.core.errors import (
     ValidationFailed,
     InvalidTransition,
@@ -35,6 +37,7 @@ class IncidentService:
             title=title,
             description=description,
             incident_type="normal",
+            **SlaService.deadlines("normal"),
             branch_id=branch_id,
             department_id=department_id,
             section_id=section_id,
@@ -75,6 +78,7 @@ class IncidentService:
             title=title,
             description=description,
             incident_type="secret",
+            **SlaService.deadlines("secret"),
             status="open",
             secret_key=secret_key,
             reason_for_secrecy=secrecy_reason,
@@ -101,6 +105,7 @@ class IncidentService:
             title=title,
             description=description,
             incident_type="urgent",
+            **SlaService.deadlines("urgent"),
             branch=branch,
             department=department,
             section=section,
@@ -164,7 +169,8 @@ class IncidentService:
             incident.status = new_status
             if new_status == "in_progress":
                 incident.handled_at = timezone.now()
-            incident.save(update_fields=["status", "handled_at"])
+            SlaService.refresh(incident)
+            incident.save(update_fields=["status", "handled_at", "sla_due_at"])
 
         IncidentEvent.objects.create(
             incident=incident,
@@ -175,6 +181,8 @@ class IncidentService:
             note=note,
         )
 
+        RollupService.incident_status_changed(incident, old_status)
+
         AuditLogService.log(
             user=actor,
             action="status_change",
@@ -185,6 +193,40 @@ class IncidentService:
 
         return incident
 
+    @staticmethod
+    @transaction.atomic
+    def assign_incident(*, incident, assignee, actor, note=""):
+        if not actor:
+            raise PermissionDenied(message="يجب وجود منفذ للعملية")
+
+        if not assignee:
+            raise ValidationFailed(message="يجب اختيار مستخدم للإحالة")
+
+        with allow_model_mutation("incident_assign"):
+            incident.assigned_to = assignee
+            incident.assigned_by = actor
+            incident.assigned_at = timezone.now()
+            incident.save(update_fields=["assigned_to", "assigned_by", "assigned_at"])
+
+        IncidentEvent.objects.create(
+            incident=incident,
+            action="assign",
+            from_status=incident.status,
+            to_status=incident.status,
+            actor=actor.username,
+            note=f"تمت الإحالة إلى {assignee.username}. {note}",
+        )
+
+        AuditLogService.log(
+            user=actor,
+            action="assign",
+            model_name="Incident",
+            object_id=incident.id,
+            description=f"إحالة البلاغ إلى {assignee.username}",
+        )
+
+        return incident
+
     # =========================
     # Notes & Relations
     # =========================
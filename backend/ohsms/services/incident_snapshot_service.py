@@ -1,4 +1,5 @@
 from django.db.models import Count, Max
+from ohsms.core.instrumentation import instrumented
 from ohsms.models import Incident, IncidentEvent
 
 
@@ -11,6 +12,7 @@ class IncidentSnapshotService:
     """
 
     @staticmethod
+    @instrumented("snapshot.incidents_system")
     def system_snapshot():
         """
         Snapshot عام للنظام (للإدارة العليا)
@@ -39,6 +41,7 @@ class IncidentSnapshotService:
             .order_by("created_at")
         )
     @staticmethod
+    @instrumented("snapshot.incident_detail")
     def incident_dashboard_snapshot(*, incident_id, user):
         """
         Snapshot لتفاصيل بلاغ واحد لاستخدامه في شاشة dashboard.
@@ -68,38 +71,17 @@ class IncidentSnapshotService:
             "risks": risks,
         }
     @staticmethod
+    @instrumented("snapshot.incidents_for_user")
     def system_snapshot_for_user(*, user):
         """
         Snapshot عام للوحة التحكم حسب صلاحيات المستخدم.
         Read-only فقط.
         """
-        from django.db.models import Count, Max
-        from ohsms.services.permissions import PermissionService
-
         if not user:
             return {"error": "user is required"}
 
         # تحديد نطاق البيانات
-        if PermissionService.is_global(user):
-            qs = Incident.objects.all()
-        else:
-            scopes = PermissionService.get_user_scopes(user)
-            if not scopes:
-                qs = Incident.objects.none()
-            else:
-                from django.db.models import Q
-                q = Q()
-                for ur in scopes:
-                    if getattr(ur, "section_id", None):
-                        q |= Q(section_id=ur.section_id)
-                    elif getattr(ur, "department_id", None):
-                        q |= Q(department_id=ur.department_id)
-                    elif getattr(ur, "branch_id", None):
-                        q |= Q(branch_id=ur.branch_id)
-                    else:
-                        q = Q()
-                        break
-                qs = Incident.objects.filter(q) if q else Incident.objects.none()
+        qs = Incident.objects.visible_to(user)
 
         # Snapshot
         incidents_total = qs.count()
@@ -0,0 +1,214 @@
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from ohsms.core.cache_versions import get_version, bump_version
+
+ORG_TREE_VERSION = "org_tree"
+
+# عقدة في الهيكل التنظيمي
+# path: المسار المادي من الجذر ((kind, id), ...) - فحص الأب/الابن = فحص بادئة
+OrgNode = namedtuple("OrgNode", ["kind", "id", "name", "parent_id", "path", "label"])
+
+_lock = threading.Lock()
+_current = {"version": None, "tree": None}
+
+# الشجرة المثبتة للطلب الحالي (OrgTree.request_scope): قراءة إصدار واحدة لكل طلب
+_request_tree = ContextVar("ohsms_org_tree", default=None)
+
+
+class OrgTree:
+    """
+    الهيكل التنظيمي (فرع → إدارة → قسم) محمّل بالكامل في الذاكرة
+
+    - ثلاثة استعلامات values() عند التحميل، ثم كل شيء بدون استعلامات
+    - نسخة واحدة لكل عملية، تُستبدل عند تغيّر إصدار org_tree
+      (أي حفظ/حذف على Branch / Department / Section - ohsms.signals)
+    """
+
+    BRANCH = "branch"
+    DEPARTMENT = "department"
+    SECTION = "section"
+
+    def __init__(self, branches, departments, sections, version=None):
+        self.version = version
+
+        self.branches = {}
+        self.departments = {}
+        self.sections = {}
+
+        self._departments_by_branch = {}
+        self._sections_by_department = {}
+
+        for pk, name in branches:
+            path = ((self.BRANCH, pk),)
+            self.branches[pk] = OrgNode(self.BRANCH, pk, name, None, path, name)
+            self._departments_by_branch[pk] = []
+
+        for pk, name, branch_id in departments:
+            parent = self.branches.get(branch_id)
+            if parent is None:
+                continue
+            self.departments[pk] = OrgNode(
+                self.DEPARTMENT, pk, name, branch_id,
+                parent.path + ((self.DEPARTMENT, pk),),
+                f"{parent.label} - {name}",
+            )
+            self._departments_by_branch[branch_id].append(pk)
+            self._sections_by_department[pk] = []
+
+        for pk, name, department_id in sections:
+            parent = self.departments.get(department_id)
+            if parent is None:
+                continue
+            self.sections[pk] = OrgNode(
+                self.SECTION, pk, name, department_id,
+                parent.path + ((self.SECTION, pk),),
+                f"{parent.label} - {name}",
+            )
+            self._sections_by_department[department_id].append(pk)
+
+    # =========================
+    # Loading
+    # =========================
+
+    @classmethod
+    def load(cls, version=None):
+        from ohsms.models import Branch, Department, Section
+
+        return cls(
+            branches=Branch.objects.order_by("name", "id").values_list("id", "name"),
+            departments=Department.objects.order_by("name", "id").values_list("id", "name", "branch_id"),
+            sections=Section.objects.order_by("name", "id").values_list("id", "name", "department_id"),
+            version=version,
+        )
+
+    @classmethod
+    def current(cls):
+        """
+        الشجرة الحالية للعملية (تُعاد تحميلها فقط عند تغيّر الإصدار)
+
+        داخل request_scope يُقرأ الإصدار مرة واحدة فقط، فالمستدعون لكل صف
+        (Section.__str__ / location_label / RollupService.risk_key) بدون رحلات للكاش
+        """
+        pinned = _request_tree.get()
+        if pinned is not None and pinned.get("tree") is not None:
+            return pinned["tree"]
+
+        version = get_version(ORG_TREE_VERSION)
+
+        tree = _current["tree"]
+        if tree is None or _current["version"] != version:
+            with _lock:
+                if _current["tree"] is None or _current["version"] != version:
+                    _current["tree"] = cls.load(version=version)
+                    _current["version"] = version
+                tree = _current["tree"]
+
+        if pinned is not None:
+            pinned["tree"] = tree
+        return tree
+
+    @classmethod
+    @contextmanager
+    def request_scope(cls):
+        """
+        تثبيت الشجرة لطلب واحد (AuthorizationContextMiddleware) - تحميل كسول عند أول استخدام
+        """
+        token = _request_tree.set({})
+        try:
+            yield
+        finally:
+            _request_tree.reset(token)
+
+    @staticmethod
+    def invalidate():
+        # تعديل الهيكل داخل الطلب نفسه → القراءة التالية من الإصدار الجديد
+        pinned = _request_tree.get()
+        if pinned is not None:
+            pinned.pop("tree", None)
+        return bump_version(ORG_TREE_VERSION)
+
+    # =========================
+    # Lookups
+    # =========================
+
+    def node(self, kind, pk):
+        return {
+            self.BRANCH: self.branches,
+            self.DEPARTMENT: self.departments,
+            self.SECTION: self.sections,
+        }[kind].get(pk)
+
+    def label(self, kind, pk, default=""):
+        node = self.node(kind, pk)
+        return node.label if node else default
+
+    def departments_of(self, branch_id):
+        return [self.departments[pk] for pk in self._departments_by_branch.get(branch_id, ())]
+
+    def sections_of(self, department_id):
+        return [self.sections[pk] for pk in self._sections_by_department.get(department_id, ())]
+
+    def ancestors(self, kind, pk):
+        """
+        (branch_id, department_id, section_id) للعقدة - None للمستويات غير المعروفة
+        """
+        node = self.node(kind, pk)
+        if node is None:
+            return (None, None, None)
+
+        ids = dict(node.path)
+        return (
+            ids.get(self.BRANCH),
+            ids.get(self.DEPARTMENT),
+            ids.get(self.SECTION),
+        )
+
+    def is_descendant(self, kind, pk, of_kind, of_pk) -> bool:
+        """
+        هل العقدة (kind, pk) داخل (of_kind, of_pk)؟ (العقدة نفسها تُعتبر داخلها)
+        """
+        node = self.node(kind, pk)
+        return node is not None and (of_kind, of_pk) in node.path
+
+    def resolve(self, branch_id=None, department_id=None, section_id=None):
+        """
+        إكمال المستويات الناقصة من أدق مستوى معروف
+        (سجل مربوط بقسم فقط → نعرف إدارته وفرعه بدون استعلام)
+        """
+        if section_id and section_id in self.sections:
+            return self.ancestors(self.SECTION, section_id)
+        if department_id and department_id in self.departments:
+            resolved_branch, resolved_department, _ = self.ancestors(self.DEPARTMENT, department_id)
+            return (resolved_branch, resolved_department, section_id)
+        return (branch_id, department_id, section_id)
+
+    def as_nested(self):
+        """
+        الشجرة كاملة بصيغة مضغوطة متداخلة (تُحسب مرة واحدة لكل إصدار):
+        [{"id", "name", "departments": [{"id", "name", "sections": [[id, name], ...]}]}]
+        """
+        nested = getattr(self, "_nested", None)
+        if nested is None:
+            nested = [
+                {
+                    "id": branch.id,
+                    "name": branch.name,
+                    "departments": [
+                        {
+                            "id": department.id,
+                            "name": department.name,
+                            "sections": [
+                                [section.id, section.name]
+                                for section in self.sections_of(department.id)
+                            ],
+                        }
+                        for department in self.departments_of(branch.id)
+                    ],
+                }
+                for branch in self.branches.values()
+            ]
+            self._nested = nested
+        return nested
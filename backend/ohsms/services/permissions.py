@@ -1,32 +1,36 @@
-from ohsms.models import UserRole, Branch, Department, Section, UserProfile
+from ohsms.core.authorization import AuthorizationContext
 
 
 class PermissionService:
     """
     Scope + RBAC Engine
     مصدر الحقيقة للصلاحيات داخل النظام
+
+    كل الفحوصات تُجاب من AuthorizationContext (استعلام UserRole واحد لكل طلب)
     """
 
+    @staticmethod
+    def context(user) -> AuthorizationContext:
+        return AuthorizationContext.for_user(user)
+
     # =========================
     # Role checks
     # =========================
 
     @staticmethod
     def has_role(user, role_code: str) -> bool:
-        return UserRole.objects.filter(
-            user=user,
-            role__code=role_code
-        ).exists()
+        return PermissionService.context(user).has_role(role_code)
+
+    @staticmethod
+    def has_any_role(user, role_codes) -> bool:
+        return PermissionService.context(user).has_any_role(role_codes)
 
     @staticmethod
     def is_global(user) -> bool:
         """
         دور عالمي (System Admin / System Staff)
         """
-        return UserRole.objects.filter(
-            user=user,
-            role__is_global=True
-        ).exists()
+        return PermissionService.context(user).is_global
 
     @staticmethod
     def is_system_admin(user) -> bool:
@@ -39,9 +43,9 @@ class PermissionService:
     @staticmethod
     def get_user_scopes(user):
         """
-        إرجاع كل نطاقات المستخدم
+        إرجاع كل نطاقات المستخدم (ScopeGrant: branch_id / department_id / section_id)
         """
-        return UserRole.objects.filter(user=user)
+        return list(PermissionService.context(user).grants)
 
     @staticmethod
     def has_scope(
@@ -54,21 +58,11 @@ class PermissionService:
         """
         التحقق من أن المستخدم ضمن هذا النطاق
         """
-
-        # صلاحية مطلقة
-        if PermissionService.is_global(user):
-            return True
-
-        qs = UserRole.objects.filter(user=user)
-
-        if section:
-            qs = qs.filter(section=section)
-        elif department:
-            qs = qs.filter(department=department)
-        elif branch:
-            qs = qs.filter(branch=branch)
-
-        return qs.exists()
+        return PermissionService.context(user).has_scope(
+            branch=branch,
+            department=department,
+            section=section,
+        )
 
     # =========================
     # Unified access check
@@ -89,34 +83,55 @@ class PermissionService:
         - Global role
         - Role + Scope
         """
+        return PermissionService.context(user).can_access(
+            role_code=role_code,
+            branch=branch,
+            department=department,
+            section=section,
+        )
 
-        if PermissionService.is_global(user):
-            return True
-
-        qs = UserRole.objects.filter(user=user)
+    @staticmethod
+    def can_access_risk(user, risk) -> bool:
+        """
+        هل الخطر ضمن نطاق المستخدم؟ نفس قواعد Risk.objects.visible_to
+        (نطاق الفرع / الإدارة يغطي المخاطر المسجلة على أقسامه)
+        """
+        from ohsms.models import Risk
 
-        if role_code:
-            qs = qs.filter(role__code=role_code)
+        return Risk.objects.get_queryset().is_visible(
+            user,
+            risk,
+            context=PermissionService.context(user),
+        )
 
-        if section:
-            qs = qs.filter(section=section)
-        elif department:
-            qs = qs.filter(department=department)
-        elif branch:
-            qs = qs.filter(branch=branch)
+    # =========================
+    # Batch checks (list pages / bulk actions)
+    # =========================
 
-        if qs.exists():
-            return True
+    @staticmethod
+    def can_access_many(user, objects) -> dict:
+        """
+        {pk: bool} لمجموعة بلاغات / مخاطر / نماذج في مرور واحد على الذاكرة
+        بدون أي استعلام لكل كائن (نفس قواعد visible_to)
+        """
+        context = PermissionService.context(user)
+        result = {}
 
-        # fallback مؤقت لـ UserProfile (للأنظمة القديمة)
-        if hasattr(user, "profile"):
-            profile = user.profile
+        for obj in objects:
+            if obj.pk in result:
+                continue
+            queryset = type(obj)._default_manager.get_queryset()
+            if not hasattr(queryset, "is_visible"):
+                raise TypeError(f"{type(obj).__name__} لا يدعم فحص النطاق")
+            result[obj.pk] = queryset.is_visible(user, obj, context=context)
 
-            if section and profile.section_id == section.id:
-                return True
-            if department and profile.department_id == department.id:
-                return True
-            if branch and profile.branch_id == branch.id:
-                return True
+        return result
 
-        return False
+    @staticmethod
+    def filter_accessible(user, objects) -> list:
+        """
+        إرجاع الكائنات المسموح بها فقط (بنفس الترتيب)
+        """
+        objects = list(objects)
+        allowed = PermissionService.can_access_many(user, objects)
+        return [obj for obj in objects if allowed[obj.pk]]
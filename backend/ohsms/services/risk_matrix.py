@@ -0,0 +1,221 @@
+import threading
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Case, CharField, Q, Value, When
+
+from ohsms.core.cache_versions import get_version, bump_version
+from ohsms.services.dashboard_cache import DashboardCache
+
+RISK_MATRIX_VERSION = "risk_matrix"
+
+# شريحة تقييم: الحدود شاملة و None = مفتوح
+MatrixBand = namedtuple("MatrixBand", ["code", "label", "min_score", "max_score", "color"])
+
+# المصفوفة الافتراضية (قبل تعريف أي RiskMatrix مفعّلة)
+DEFAULT_BANDS = (
+    MatrixBand("low", "منخفض", None, 6, "#2e7d32"),
+    MatrixBand("medium", "متوسط", 7, 14, "#f9a825"),
+    MatrixBand("high", "مرتفع", 15, None, "#c62828"),
+)
+
+_lock = threading.Lock()
+_current = {"version": None, "config": None}
+
+
+class RiskMatrixConfig:
+    """
+    مصفوفة المخاطر المفعّلة محمّلة في الذاكرة (مثل OrgTree)
+
+    - استعلامان عند التحميل، ثم كل التصنيف بدون استعلامات
+    - تُستبدل عند تغيّر إصدار risk_matrix (أي حفظ/حذف على RiskMatrix / RiskMatrixBand)
+    - الشرائح تُطبّق في SQL كـ CASE (case) أو Count(filter=...) (filters)
+    """
+
+    def __init__(self, severity_levels=5, likelihood_levels=5, bands=DEFAULT_BANDS, name="", version=None):
+        self.name = name
+        self.severity_levels = severity_levels
+        self.likelihood_levels = likelihood_levels
+        self.bands = tuple(bands) or DEFAULT_BANDS
+        self.version = version
+
+    # =========================
+    # Loading
+    # =========================
+
+    @classmethod
+    def load(cls, version=None):
+        from ohsms.models import RiskMatrix, RiskMatrixBand
+
+        matrix = (
+            RiskMatrix.objects
+            .filter(is_active=True)
+            .values("id", "name", "severity_levels", "likelihood_levels")
+            .first()
+        )
+        if matrix is None:
+            return cls(version=version)
+
+        bands = [
+            MatrixBand(*row)
+            for row in RiskMatrixBand.objects.filter(matrix_id=matrix["id"]).values_list(
+                "code", "label", "min_score", "max_score", "color"
+            )
+        ]
+        return cls(
+            severity_levels=matrix["severity_levels"],
+            likelihood_levels=matrix["likelihood_levels"],
+            bands=bands,
+            name=matrix["name"],
+            version=version,
+        )
+
+    @classmethod
+    def current(cls):
+        version = get_version(RISK_MATRIX_VERSION)
+
+        config = _current["config"]
+        if config is not None and _current["version"] == version:
+            return config
+
+        with _lock:
+            if _current["config"] is None or _current["version"] != version:
+                _current["config"] = cls.load(version=version)
+                _current["version"] = version
+            return _current["config"]
+
+    @staticmethod
+    def invalidate():
+        """
+        تعديل المصفوفة يغيّر تصنيف كل المخاطر → إبطال كل لقطات اللوحات أيضًا
+        (بعد commit فقط، مثل DashboardCache.touch)
+        """
+        transaction.on_commit(lambda: bump_version(RISK_MATRIX_VERSION))
+        DashboardCache.touch()
+
+    # =========================
+    # Bands
+    # =========================
+
+    @property
+    def codes(self):
+        return [band.code for band in self.bands]
+
+    @property
+    def top_band(self):
+        """
+        أعلى شريحة (المخاطر المرتفعة في مؤشرات اللوحة)
+        """
+        return self.bands[-1].code
+
+    def band_for(self, score):
+        for band in self.bands:
+            if (band.min_score is None or score >= band.min_score) and (
+                band.max_score is None or score <= band.max_score
+            ):
+                return band.code
+        return self.top_band
+
+    @staticmethod
+    def _condition(band, field):
+        lookup = {}
+        if band.min_score is not None:
+            lookup[f"{field}__gte"] = band.min_score
+        if band.max_score is not None:
+            lookup[f"{field}__lte"] = band.max_score
+        return Q(**lookup)
+
+    def filters(self, field="risk_score"):
+        """
+        {code: Q(...)} لكل شريحة (للتجميع الشرطي Count(filter=...))
+
+        نفس قواعد band_for / case: أول شريحة مطابقة بالترتيب، وما لا يطابق أي شريحة
+        (فجوة في المصفوفة) يُحسب في أعلى شريحة → مجموع الشرائح = كل المخاطر
+        """
+        filters = {}
+        covered = None
+        for band in self.bands[:-1]:
+            condition = self._condition(band, field)
+            if not condition:
+                # شريحة مفتوحة من الطرفين تطابق كل ما تبقى
+                filters[band.code] = ~covered if covered is not None else Q()
+                for rest in self.bands:
+                    filters.setdefault(rest.code, Q(pk__in=[]))
+                return filters
+            filters[band.code] = condition & ~covered if covered is not None else condition
+            covered = condition if covered is None else covered | condition
+
+        filters[self.top_band] = ~covered if covered is not None else Q()
+        return filters
+
+    def case(self, field="risk_score"):
+        """
+        نفس band_for لكن كـ CASE في SQL
+        """
+        whens = []
+        for band in self.bands[:-1]:
+            condition = self._condition(band, field)
+            if not condition:
+                return Case(*whens, default=Value(band.code), output_field=CharField())
+            whens.append(When(condition, then=Value(band.code)))
+        return Case(*whens, default=Value(self.top_band), output_field=CharField())
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "severity_levels": self.severity_levels,
+            "likelihood_levels": self.likelihood_levels,
+            "bands": [band._asdict() for band in self.bands],
+        }
+
+
+# =========================
+# Validation
+# =========================
+
+def band_errors(bands, max_score=None) -> list:
+    """
+    فجوات / تداخلات الشرائح على المدى 1..max_score (رسائل للمستخدم، فارغة = سليمة)
+
+    bands: MatrixBand أو أي كائن له code / min_score / max_score
+    """
+    errors = []
+    spans = sorted(
+        (
+            band.min_score if band.min_score is not None else 1,
+            band.max_score if band.max_score is not None else float("inf"),
+            band.code,
+        )
+        for band in bands
+    )
+
+    expected = 1
+    for low, high, code in spans:
+        if low > high:
+            errors.append(f"الشريحة {code}: الحد الأدنى أكبر من الحد الأعلى")
+            continue
+        if low > expected:
+            errors.append(f"فجوة في التقييمات {expected}-{low - 1} قبل الشريحة {code}")
+        elif low < expected:
+            errors.append(f"الشريحة {code} تتداخل مع الشريحة السابقة عند {low}")
+        expected = max(expected, high + 1)
+
+    if spans and max_score is not None and expected <= max_score:
+        errors.append(f"التقييمات {expected}-{max_score} خارج كل الشرائح")
+    return errors
+
+
+# =========================
+# Module helpers
+# =========================
+
+def risk_band(score):
+    return RiskMatrixConfig.current().band_for(score)
+
+
+def risk_band_filters(field="risk_score"):
+    return RiskMatrixConfig.current().filters(field)
+
+
+def risk_band_case(field="risk_score"):
+    return RiskMatrixConfig.current().case(field)
@@ -1,8 +1,10 @@
 from django.shortcuts import get_object_or_404
-from django.db.models import Count, Q
+from django.db.models import Count
 
+from ohsms.core.authorization import AuthorizationContext
+from ohsms.core.instrumentation import instrumented
 from ohsms.models import Risk, RiskEvent
-from ohsms.services.permissions import PermissionService
+from ohsms.services.dashboard_cache import DashboardCache
 
 
 class RiskSnapshotService:
@@ -19,30 +21,14 @@ class RiskSnapshotService:
         """
         Apply RBAC scopes to Risk queryset
         """
-        if PermissionService.is_global(user):
-            return Risk.objects.all()
-
-        scopes = PermissionService.get_user_scopes(user)
-        q = Q()
-
-        for ur in scopes:
-            if ur.section_id:
-                q |= Q(section_id=ur.section_id)
-            elif ur.department_id:
-                q |= Q(department_id=ur.department_id)
-            elif ur.branch_id:
-                q |= Q(branch_id=ur.branch_id)
-            else:
-                # نطاق شامل
-                return Risk.objects.all()
-
-        return Risk.objects.filter(q) if q else Risk.objects.none()
+        return Risk.objects.visible_to(user)
 
     # =========================
     # Snapshots
     # =========================
 
     @staticmethod
+    @instrumented("snapshot.risk_detail")
     def risk_detail_snapshot(*, risk_id, user):
         """
         Snapshot تفصيلي لخطر واحد
@@ -64,6 +50,7 @@ class RiskSnapshotService:
         }
 
     @staticmethod
+    @instrumented("snapshot.risk_register")
     def risk_register_snapshot(*, user):
         """
         Snapshot لسجل المخاطر (Risk Register)
@@ -88,10 +75,23 @@ class RiskSnapshotService:
         }
 
     @staticmethod
+    @instrumented("snapshot.risk_dashboard")
     def risk_dashboard_snapshot(*, user):
         """
         Snapshot تحليلي للمخاطر (Dashboard)
+
+        مشترك بين كل المستخدمين بنفس النطاقات، ويُحسب مرة واحدة فقط
+        عند تزامن الطلبات (DashboardCache / single_flight)
         """
+        context = AuthorizationContext.for_user(user)
+        return DashboardCache.get_or_compute(
+            "risk_dashboard",
+            context,
+            lambda: RiskSnapshotService._risk_dashboard(user),
+        )
+
+    @staticmethod
+    def _risk_dashboard(user):
         risks = RiskSnapshotService._scoped_risks(user)
 
         by_status = (
@@ -1,3 +1,5 @@
+from django.db import transaction
+
 from ohsms.models import Risk, RiskNote
 
 
@@ -7,6 +9,7 @@ class RiskService:
     """
 
     @staticmethod
+    @transaction.atomic
     def submit_risk(risk: Risk):
         if risk.status != 'draft':
             raise ValueError("لا يمكن تقديم خطر ليس في حالة مسودة")
@@ -15,6 +18,7 @@ class RiskService:
         risk.save()
 
     @staticmethod
+    @transaction.atomic
     def approve_risk(risk: Risk, actor: str):
         if risk.status != 'submitted':
             raise ValueError("لا يمكن اعتماد خطر غير مقدم")
@@ -29,6 +33,7 @@ class RiskService:
         )
 
     @staticmethod
+    @transaction.atomic
     def reject_risk(risk: Risk, actor: str, reason: str):
         if risk.status != 'submitted':
             raise ValueError("لا يمكن رفض خطر غير مقدم")
@@ -0,0 +1,378 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Min, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from ohsms.core.histogram import DURATION_HISTOGRAM
+from ohsms.managers import restrict_to_scope
+from ohsms.models import (
+    INCIDENT_AWAITING_STATUSES,
+    Incident,
+    IncidentDailyRollup,
+    IncidentResponseRollup,
+    Risk,
+    RiskDailyRollup,
+)
+from ohsms.services.dashboard_cache import DashboardCache
+from ohsms.services.org_tree import OrgTree
+
+# مراحل زمن الاستجابة:
+# - الاستلام: أول خروج من حالات الانتظار (بداية المعالجة / handled_at)
+# - الإغلاق: أول دخول إلى حالات الإنهاء
+AWAITING_STATUSES = INCIDENT_AWAITING_STATUSES
+FINISHED_STATUSES = ("resolved", "closed")
+
+
+class RollupService:
+    """
+    جداول التجميع اليومية للوحة المؤشرات
+
+    - تُحدّث تزايديًا (+1 / -1) من إشارات الحفظ والحذف على Incident / Risk
+      (الخدمات، لوحة الإدارة، والحذف المتتالي) داخل نفس المعاملة
+    - تُقرأ بـ SUM على (الأيام × الوحدات التنظيمية) بدل مسح جداول البلاغات والمخاطر
+    - rebuild() لإعادة البناء الكامل (manage.py rebuild_rollups)
+    - القراءة تقبل سياق صلاحيات (context) لتقييدها بنطاقات المستخدم
+    """
+
+    BATCH_SIZE = 2000
+
+    # =========================
+    # Keys
+    # =========================
+
+    @staticmethod
+    def _day(value):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+
+    @staticmethod
+    def incident_key(incident):
+        return {
+            "day": RollupService._day(incident.created_at),
+            "branch_id": incident.branch_id,
+            "department_id": incident.department_id,
+            "section_id": incident.section_id,
+            "incident_type": incident.incident_type,
+            "status": incident.status,
+        }
+
+    @staticmethod
+    def risk_key(risk):
+        # المخاطر قد تُربط بمستوى واحد فقط: نكمل الآباء من الشجرة المخزنة
+        branch_id, department_id, section_id = OrgTree.current().resolve(
+            risk.branch_id, risk.department_id, risk.section_id
+        )
+        return {
+            "day": RollupService._day(risk.created_at),
+            "branch_id": branch_id,
+            "department_id": department_id,
+            "section_id": section_id,
+            "category_id": risk.category_id,
+            "status": risk.status,
+        }
+
+    # الحقول التي يتكون منها مفتاح التجميع (تغيّرها = نقل العدّ من صف لآخر)
+    KEY_FIELDS = {
+        Incident: ("created_at", "branch", "department", "section", "incident_type", "status"),
+        Risk: ("created_at", "branch", "department", "section", "category", "status"),
+    }
+
+    @staticmethod
+    def daily_key(instance):
+        """
+        (جدول التجميع، المفتاح) لبلاغ أو خطر
+        """
+        if isinstance(instance, Incident):
+            return IncidentDailyRollup, RollupService.incident_key(instance)
+        return RiskDailyRollup, RollupService.risk_key(instance)
+
+    # =========================
+    # Incremental updates
+    # =========================
+
+    @staticmethod
+    def _bump(model, key, delta):
+        """
+        count += delta للصف، مع إنشائه عند أول ظهور (آمن مع التزامن)
+
+        النقص لا يُنشئ صفًا ولا ينزل تحت الصفر (صف أُعيد تصنيفه بعد تعديل
+        الشجرة يُصحح بـ rebuild_rollups)
+        """
+        if delta < 0:
+            model.objects.filter(count__gte=-delta, **key).update(count=F("count") + delta)
+            return
+
+        if model.objects.filter(**key).update(count=F("count") + delta):
+            return
+
+        try:
+            with transaction.atomic():
+                model.objects.create(count=delta, **key)
+        except IntegrityError:
+            # أُنشئ الصف من طلب متزامن بين update و create
+            model.objects.filter(**key).update(count=F("count") + delta)
+
+    @staticmethod
+    def stored_key(instance, update_fields=None):
+        """
+        مفتاح الصف كما هو محفوظ قبل الحفظ الحالي (pre_save)
+        None إذا لم يتغير أي حقل من حقول المفتاح في update_fields
+        """
+        model = type(instance)
+        fields = RollupService.KEY_FIELDS[model]
+        if update_fields is not None and set(fields).isdisjoint(update_fields):
+            return None
+
+        values = model.objects.filter(pk=instance.pk).values(*fields).first()
+        if values is None:
+            return None
+        stored = model(**{model._meta.get_field(name).attname: value for name, value in values.items()})
+        return RollupService.daily_key(stored)[1]
+
+    @staticmethod
+    def record_saved(instance, created, previous_key=None):
+        """
+        الإنشاء: +1 | التعديل (خدمة أو Admin): نقل العدّ إذا تغيّر المفتاح
+        """
+        model, key = RollupService.daily_key(instance)
+        if created:
+            RollupService._bump(model, key, 1)
+        elif previous_key is not None and previous_key != key:
+            RollupService._bump(model, previous_key, -1)
+            RollupService._bump(model, key, 1)
+            DashboardCache.touch(previous_key["branch_id"])
+        else:
+            return
+        DashboardCache.touch(key["branch_id"])
+
+    @staticmethod
+    def record_deleted(instance):
+        model, key = RollupService.daily_key(instance)
+        RollupService._bump(model, key, -1)
+        DashboardCache.touch(key["branch_id"])
+
+    @staticmethod
+    def incident_status_changed(incident, old_status):
+        """
+        صف التجميع اليومي يُنقل في post_save؛ هنا مدد الاستجابة فقط
+        """
+        if old_status == incident.status:
+            return
+        RollupService._record_response(incident, old_status)
+        DashboardCache.touch(incident.branch_id)
+
+    @staticmethod
+    def response_key(incident, metric, seconds):
+        key = RollupService.incident_key(incident)
+        del key["status"]
+        key["metric"] = metric
+        key["bucket"] = DURATION_HISTOGRAM.bucket(seconds)
+        return key
+
+    @staticmethod
+    def _record_response(incident, old_status):
+        """
+        إضافة مدة الاستلام/الإغلاق إلى المدرّج عند عبور البلاغ لتلك المرحلة
+        """
+        now = timezone.now()
+
+        if old_status in AWAITING_STATUSES and incident.status not in AWAITING_STATUSES:
+            received_at = incident.handled_at or now
+            seconds = (received_at - incident.created_at).total_seconds()
+            RollupService._bump(
+                IncidentResponseRollup, RollupService.response_key(incident, "receive", seconds), 1
+            )
+
+        if old_status not in FINISHED_STATUSES and incident.status in FINISHED_STATUSES:
+            seconds = (now - incident.created_at).total_seconds()
+            RollupService._bump(
+                IncidentResponseRollup, RollupService.response_key(incident, "close", seconds), 1
+            )
+
+    # =========================
+    # Rebuild
+    # =========================
+
+    @staticmethod
+    @transaction.atomic
+    def rebuild(batch_size=None):
+        """
+        إعادة بناء الجداول من الصفر بتجميع واحد لكل جدول
+        يُرجع (incident_rows, risk_rows, response_rows)
+        """
+        batch_size = batch_size or RollupService.BATCH_SIZE
+
+        incident_rows = (
+            Incident.objects
+            .annotate(day=TruncDate("created_at"))
+            .values("day", "branch_id", "department_id", "section_id", "incident_type", "status")
+            .annotate(total=Count("id"))
+            .order_by()
+        )
+
+        IncidentDailyRollup.objects.all().delete()
+        incident_objects = IncidentDailyRollup.objects.bulk_create(
+            (
+                IncidentDailyRollup(
+                    day=row["day"],
+                    branch_id=row["branch_id"],
+                    department_id=row["department_id"],
+                    section_id=row["section_id"],
+                    incident_type=row["incident_type"],
+                    status=row["status"],
+                    count=row["total"],
+                )
+                for row in incident_rows.iterator(chunk_size=batch_size)
+            ),
+            batch_size=batch_size,
+        )
+
+        risk_rows = (
+            Risk.objects
+            .annotate(day=TruncDate("created_at"))
+            .values("day", "branch_id", "department_id", "section_id", "category_id", "status")
+            .annotate(total=Count("id"))
+            .order_by()
+        )
+
+        # إكمال آباء النطاق ثم دمج الصفوف التي أصبح لها نفس المفتاح
+        tree = OrgTree.current()
+        risk_counts = Counter()
+        for row in risk_rows.iterator(chunk_size=batch_size):
+            branch_id, department_id, section_id = tree.resolve(
+                row["branch_id"], row["department_id"], row["section_id"]
+            )
+            risk_counts[(
+                row["day"], branch_id, department_id, section_id,
+                row["category_id"], row["status"],
+            )] += row["total"]
+
+        RiskDailyRollup.objects.all().delete()
+        risk_objects = RiskDailyRollup.objects.bulk_create(
+            (
+                RiskDailyRollup(
+                    day=day,
+                    branch_id=branch_id,
+                    department_id=department_id,
+                    section_id=section_id,
+                    category_id=category_id,
+                    status=status,
+                    count=total,
+                )
+                for (day, branch_id, department_id, section_id, category_id, status), total
+                in risk_counts.items()
+            ),
+            batch_size=batch_size,
+        )
+
+        response_objects = RollupService._rebuild_responses(batch_size)
+
+        DashboardCache.touch()
+        return len(incident_objects), len(risk_objects), len(response_objects)
+
+    @staticmethod
+    def _rebuild_responses(batch_size):
+        """
+        وقت الاستلام/الإغلاق لكل بلاغ من سجل الأحداث (أول حدث يعبر المرحلة)
+        ثم تجميعها في شرائح المدرّج
+        """
+        received = Q(events__from_status__in=AWAITING_STATUSES) & ~Q(events__to_status__in=AWAITING_STATUSES)
+        finished = Q(events__to_status__in=FINISHED_STATUSES)
+
+        incidents = (
+            Incident.objects
+            .annotate(
+                received_at=Coalesce("handled_at", Min("events__created_at", filter=received)),
+                finished_at=Min("events__created_at", filter=finished),
+            )
+            .filter(Q(received_at__isnull=False) | Q(finished_at__isnull=False))
+            .values(
+                "created_at", "branch_id", "department_id", "section_id", "incident_type",
+                "received_at", "finished_at",
+            )
+            .order_by()
+        )
+
+        counts = Counter()
+        for row in incidents.iterator(chunk_size=batch_size):
+            base = (
+                RollupService._day(row["created_at"]),
+                row["branch_id"], row["department_id"], row["section_id"], row["incident_type"],
+            )
+            for metric, at in (("receive", row["received_at"]), ("close", row["finished_at"])):
+                if at is not None:
+                    bucket = DURATION_HISTOGRAM.bucket((at - row["created_at"]).total_seconds())
+                    counts[base + (metric, bucket)] += 1
+
+        IncidentResponseRollup.objects.all().delete()
+        return IncidentResponseRollup.objects.bulk_create(
+            (
+                IncidentResponseRollup(
+                    day=day,
+                    branch_id=branch_id,
+                    department_id=department_id,
+                    section_id=section_id,
+                    incident_type=incident_type,
+                    metric=metric,
+                    bucket=bucket,
+                    count=total,
+                )
+                for (day, branch_id, department_id, section_id, incident_type, metric, bucket), total
+                in counts.items()
+            ),
+            batch_size=batch_size,
+        )
+
+    # =========================
+    # Reads
+    # =========================
+
+    @staticmethod
+    def incidents_trend(start_day, end_day, context=None):
+        return list(
+            restrict_to_scope(IncidentDailyRollup.objects.all(), context)
+            .filter(day__gte=start_day, day__lte=end_day)
+            .values("day")
+            .annotate(count=Sum("count"))
+            .filter(count__gt=0)
+            .order_by("day")
+        )
+
+    @staticmethod
+    def incidents_by_section(start_day, end_day, context=None):
+        return (
+            restrict_to_scope(IncidentDailyRollup.objects.all(), context)
+            .filter(day__gte=start_day, day__lte=end_day)
+            .values("branch__name", "department__name", "section__name", "branch_id", "department_id", "section_id")
+            .annotate(count=Sum("count"))
+            .filter(count__gt=0)
+            .order_by()
+        )
+
+    @staticmethod
+    def risks_trend(start_day, end_day, context=None):
+        # صفوف التجميع تحمل الفرع والإدارة والقسم معاً (denormalized)
+        return list(
+            restrict_to_scope(RiskDailyRollup.objects.all(), context)
+            .filter(day__gte=start_day, day__lte=end_day)
+            .values("day")
+            .annotate(count=Sum("count"))
+            .filter(count__gt=0)
+            .order_by("day")
+        )
+
+    @staticmethod
+    def response_buckets(start_day, end_day, context=None):
+        """
+        ملخصات المدرّج مجمّعة حسب (المقياس × النوع × الفرع × الإدارة × الشريحة)
+        لدمجها لاحقًا في أي تقسيم (عام / نوع / فرع / إدارة)
+        """
+        return (
+            restrict_to_scope(IncidentResponseRollup.objects.all(), context)
+            .filter(day__gte=start_day, day__lte=end_day)
+            .values("metric", "incident_type", "branch__name", "department__name", "bucket")
+            .annotate(count=Sum("count"))
+            .filter(count__gt=0)
+            .order_by()
+        )
@@ -0,0 +1,153 @@
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ohsms.models import (
+    INCIDENT_AWAITING_STATUSES,
+    INCIDENT_OPEN_STATUSES,
+    Incident,
+    IncidentSlaPolicy,
+)
+from ohsms.services.events.incident_events import IncidentEventWriter
+
+
+class SlaService:
+    """
+    مواعيد SLA للبلاغات + مُجمّع التجاوزات
+
+    - عند الإنشاء: receive_due_at / resolve_due_at حسب سياسة نوع البلاغ
+    - sla_due_at = أقرب موعد معلّق للمرحلة الحالية، يُعاد حسابه مع كل تغيير حالة
+      ومع كل تصعيد (NULL بعد الإغلاق أو بعد تصعيد كل المواعيد)
+    - sweep(): مسح نطاق على الفهرس الجزئي ohsms_inc_sla_due_idx (المتأخرة فقط)،
+      ويصعّدها على دفعات عبر IncidentEventWriter.escalate
+    - البلاغات المفتوحة السابقة على SLA: مواعيدها من created_at (الترحيل 0029)
+    """
+
+    # (مهلة الاستلام، مهلة المعالجة) بالدقائق
+    DEFAULT_POLICIES = {
+        "urgent": (60, 24 * 60),
+        "secret": (4 * 60, 3 * 24 * 60),
+        "normal": (24 * 60, 7 * 24 * 60),
+    }
+
+    BATCH_SIZE = 200
+
+    # (حقل الموعد، حقل التجاوز، الحالات التي ما زالت ضمن المرحلة، نص الحدث)
+    STAGES = (
+        ("receive_due_at", "receive_breached_at", INCIDENT_AWAITING_STATUSES, "تجاوز موعد الاستلام (SLA)"),
+        ("resolve_due_at", "resolve_breached_at", INCIDENT_OPEN_STATUSES, "تجاوز موعد المعالجة (SLA)"),
+    )
+
+    # =========================
+    # Policies / Deadlines
+    # =========================
+
+    @staticmethod
+    def policy(incident_type):
+        """
+        (receive_minutes, resolve_minutes) لنوع البلاغ
+        """
+        policy = (
+            IncidentSlaPolicy.objects
+            .filter(incident_type=incident_type, is_active=True)
+            .values_list("receive_minutes", "resolve_minutes")
+            .first()
+        )
+        if policy is not None:
+            return policy
+        return SlaService.DEFAULT_POLICIES.get(incident_type, (None, None))
+
+    @staticmethod
+    def deadlines(incident_type, start=None) -> dict:
+        """
+        حقول المواعيد لتمريرها إلى Incident.objects.create(...)
+        """
+        start = start or timezone.now()
+        receive_minutes, resolve_minutes = SlaService.policy(incident_type)
+
+        fields = {
+            "receive_due_at": start + timedelta(minutes=receive_minutes) if receive_minutes else None,
+            "resolve_due_at": start + timedelta(minutes=resolve_minutes) if resolve_minutes else None,
+        }
+        pending = [due for due in fields.values() if due is not None]
+        fields["sla_due_at"] = min(pending) if pending else None
+        return fields
+
+    @staticmethod
+    def _pending(incident):
+        """
+        المواعيد التي ما زالت تنطبق على حالة البلاغ ولم تُصعّد بعد
+        """
+        return [
+            (due_field, breached_field, note)
+            for due_field, breached_field, statuses, note in SlaService.STAGES
+            if incident.status in statuses
+            and getattr(incident, due_field) is not None
+            and getattr(incident, breached_field) is None
+        ]
+
+    @staticmethod
+    def next_deadline(incident):
+        pending = [getattr(incident, due_field) for due_field, _, _ in SlaService._pending(incident)]
+        return min(pending) if pending else None
+
+    @staticmethod
+    def refresh(incident):
+        """
+        إعادة حساب sla_due_at بعد تغيير الحالة (يُحفظ مع حقول الحالة)
+        """
+        incident.sla_due_at = SlaService.next_deadline(incident)
+
+    # =========================
+    # Sweeper
+    # =========================
+
+    @staticmethod
+    def overdue(now=None):
+        return Incident.objects.filter(sla_due_at__isnull=False, sla_due_at__lte=now or timezone.now())
+
+    @staticmethod
+    def _sweep_batch(actor, now, batch_size):
+        with transaction.atomic():
+            batch = list(
+                SlaService.overdue(now)
+                .select_for_update(skip_locked=connection.features.has_select_for_update_skip_locked)
+                .only(
+                    "id", "status", "sla_due_at",
+                    "receive_due_at", "resolve_due_at", "receive_breached_at", "resolve_breached_at",
+                )
+                .order_by("sla_due_at")[:batch_size]
+            )
+
+            escalations = 0
+            for incident in batch:
+                for due_field, breached_field, note in SlaService._pending(incident):
+                    if getattr(incident, due_field) <= now:
+                        IncidentEventWriter.escalate(incident=incident, actor=actor, note=note)
+                        setattr(incident, breached_field, now)
+                        escalations += 1
+                SlaService.refresh(incident)
+
+            Incident.objects.bulk_update(
+                batch, ["receive_breached_at", "resolve_breached_at", "sla_due_at"]
+            )
+
+        return len(batch), escalations
+
+    @staticmethod
+    def sweep(*, actor, now=None, batch_size: int = None) -> int:
+        """
+        تصعيد كل التجاوزات الحالية - دفعة لكل معاملة (قفل قصير)
+        يُرجع عدد أحداث التصعيد
+        """
+        now = now or timezone.now()
+        batch_size = batch_size or SlaService.BATCH_SIZE
+
+        total = 0
+        while True:
+            count, escalations = SlaService._sweep_batch(actor, now, batch_size)
+            total += escalations
+            if count < batch_size:
+                break
+        return total
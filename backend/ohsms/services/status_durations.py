@@ -0,0 +1,238 @@
+from django.db import connection, transaction
+from django.db.models import Count, F, Min, Q, Sum, Window
+from django.db.models.functions import Lag, Lead
+
+from ohsms.core.histogram import DURATION_HISTOGRAM
+from ohsms.managers import restrict_to_scope
+from ohsms.models import IncidentEvent, IncidentStatusSpan
+from ohsms.services.rollups import FINISHED_STATUSES
+
+# أحداث تغيّر الحالة فعلاً (الإنشاء / الاستلام / تغيير الحالة)
+# الملاحظة والإحالة والتصعيد تكتب from_status = to_status فلا تفتح فترة جديدة
+TRANSITION = Q(to_status__gt="") & ~Q(from_status=F("to_status"))
+
+_EVENT_ORDER = [F("created_at").asc(), F("id").asc()]
+
+_EVENT_FIELDS = (
+    "incident_id",
+    "from_status",
+    "to_status",
+    "created_at",
+    "incident__created_at",
+    "incident__branch_id",
+    "incident__department_id",
+    "incident__section_id",
+    "incident__incident_type",
+)
+
+
+class StatusDurationService:
+    """
+    صيانة جدول IncidentStatusSpan (مدة البقاء في كل حالة)
+
+    - تزايديًا: كل حدث انتقال يغلق الفترة المفتوحة ويفتح فترة للحالة الجديدة
+    - إعادة البناء: LAG/LEAD على سجل الأحداث في PostgreSQL،
+      ومرور مرتب على دفعات في Python لباقي القواعد (SQLite)
+    - تقارير الاختناقات تقرأ جدول الفترات فقط (لا تمسح سجل الأحداث)
+    """
+
+    BATCH_SIZE = 2000
+
+    # =========================
+    # Helpers
+    # =========================
+
+    @staticmethod
+    def _span(row, status, entered_at, exited_at):
+        duration = bucket = None
+        if exited_at is not None:
+            duration = max((exited_at - entered_at).total_seconds(), 0.0)
+            bucket = DURATION_HISTOGRAM.bucket(duration)
+
+        return IncidentStatusSpan(
+            incident_id=row["incident_id"],
+            branch_id=row["incident__branch_id"],
+            department_id=row["incident__department_id"],
+            section_id=row["incident__section_id"],
+            incident_type=row["incident__incident_type"],
+            status=status,
+            entered_at=entered_at,
+            exited_at=exited_at,
+            duration_seconds=duration,
+            bucket=bucket,
+        )
+
+    @staticmethod
+    def _close(span, exited_at):
+        span.exited_at = exited_at
+        span.duration_seconds = max((exited_at - span.entered_at).total_seconds(), 0.0)
+        span.bucket = DURATION_HISTOGRAM.bucket(span.duration_seconds)
+        span.save(update_fields=["exited_at", "duration_seconds", "bucket"])
+
+    # =========================
+    # Incremental
+    # =========================
+
+    @staticmethod
+    @transaction.atomic
+    def record_event(event):
+        """
+        تحديث الفترات لحدث جديد (من ohsms.signals داخل نفس معاملة الحدث)
+        """
+        if not event.to_status or event.from_status == event.to_status:
+            return
+
+        incident = event.incident
+        current = (
+            IncidentStatusSpan.objects
+            .select_for_update()
+            .filter(incident_id=incident.pk, exited_at__isnull=True)
+            .first()
+        )
+
+        row = {
+            "incident_id": incident.pk,
+            "incident__branch_id": incident.branch_id,
+            "incident__department_id": incident.department_id,
+            "incident__section_id": incident.section_id,
+            "incident__incident_type": incident.incident_type,
+        }
+
+        spans = []
+        if current is not None:
+            StatusDurationService._close(current, event.created_at)
+        elif event.from_status:
+            # بلاغ قديم بلا حدث إنشاء: الحالة الأولى من تاريخ الإنشاء
+            spans.append(StatusDurationService._span(
+                row, event.from_status, incident.created_at, event.created_at
+            ))
+
+        spans.append(StatusDurationService._span(row, event.to_status, event.created_at, None))
+        IncidentStatusSpan.objects.bulk_create(spans)
+
+    # =========================
+    # Rebuild
+    # =========================
+
+    @staticmethod
+    def _spans_window(batch_size):
+        """
+        PostgreSQL: الحدث السابق/التالي لكل بلاغ من دوال النافذة مباشرة
+        """
+        events = (
+            IncidentEvent.objects
+            .filter(TRANSITION)
+            .annotate(
+                previous_at=Window(Lag("created_at"), partition_by=[F("incident_id")], order_by=_EVENT_ORDER),
+                next_at=Window(Lead("created_at"), partition_by=[F("incident_id")], order_by=_EVENT_ORDER),
+            )
+            .values(*_EVENT_FIELDS, "previous_at", "next_at")
+            .order_by()
+        )
+
+        for row in events.iterator(chunk_size=batch_size):
+            if row["previous_at"] is None and row["from_status"]:
+                yield StatusDurationService._span(
+                    row, row["from_status"], row["incident__created_at"], row["created_at"]
+                )
+            yield StatusDurationService._span(row, row["to_status"], row["created_at"], row["next_at"])
+
+    @staticmethod
+    def _spans_python(batch_size):
+        """
+        باقي القواعد: مرور واحد مرتب (incident, created_at) على دفعات،
+        مع الاحتفاظ بالحدث السابق فقط في الذاكرة
+        """
+        events = (
+            IncidentEvent.objects
+            .filter(TRANSITION)
+            .values(*_EVENT_FIELDS)
+            .order_by("incident_id", "created_at", "id")
+        )
+
+        previous = None
+        for row in events.iterator(chunk_size=batch_size):
+            same_incident = previous is not None and previous["incident_id"] == row["incident_id"]
+
+            if previous is not None:
+                yield StatusDurationService._span(
+                    previous,
+                    previous["to_status"],
+                    previous["created_at"],
+                    row["created_at"] if same_incident else None,
+                )
+
+            if not same_incident and row["from_status"]:
+                yield StatusDurationService._span(
+                    row, row["from_status"], row["incident__created_at"], row["created_at"]
+                )
+
+            previous = row
+
+        if previous is not None:
+            yield StatusDurationService._span(previous, previous["to_status"], previous["created_at"], None)
+
+    @staticmethod
+    @transaction.atomic
+    def rebuild(batch_size: int = None, use_window: bool = None) -> int:
+        """
+        إعادة بناء الجدول بالكامل من سجل الأحداث
+        use_window=None → دوال النافذة في PostgreSQL فقط
+        """
+        batch_size = batch_size or StatusDurationService.BATCH_SIZE
+        if use_window is None:
+            use_window = connection.vendor == "postgresql"
+
+        spans = (
+            StatusDurationService._spans_window(batch_size)
+            if use_window
+            else StatusDurationService._spans_python(batch_size)
+        )
+
+        IncidentStatusSpan.objects.all().delete()
+
+        total = 0
+        batch = []
+        for span in spans:
+            batch.append(span)
+            if len(batch) >= batch_size:
+                IncidentStatusSpan.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+
+        if batch:
+            IncidentStatusSpan.objects.bulk_create(batch)
+            total += len(batch)
+
+        return total
+
+    # =========================
+    # Reads
+    # =========================
+
+    @staticmethod
+    def completed_buckets(start, end, context=None, fields=("status",)):
+        """
+        الفترات المنتهية ضمن المدة: العدد والمجموع لكل (fields × شريحة)
+        """
+        return (
+            restrict_to_scope(IncidentStatusSpan.objects.all(), context)
+            .filter(exited_at__gte=start, exited_at__lte=end)
+            .values(*fields, "bucket")
+            .annotate(count=Count("id"), total_seconds=Sum("duration_seconds"))
+            .order_by()
+        )
+
+    @staticmethod
+    def open_spans(context=None, fields=("status",)):
+        """
+        البلاغات العالقة حاليًا في كل حالة وأقدم دخول إليها (بدون حالات الإنهاء)
+        """
+        return (
+            restrict_to_scope(IncidentStatusSpan.objects.all(), context)
+            .filter(exited_at__isnull=True)
+            .exclude(status__in=FINISHED_STATUSES)
+            .values(*fields)
+            .annotate(count=Count("id"), oldest_entered_at=Min("entered_at"))
+            .order_by()
+        )
@@ -0,0 +1,149 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from ohsms.core.authorization import AuthorizationContext
+from ohsms.models import (
+    Branch, Department, Section, Incident, IncidentEvent, Risk, RiskMatrix, RiskMatrixBand,
+    FormEvent, FormField, Role, UserRole,
+)
+from ohsms.services.incident_access import IncidentAccessService
+from ohsms.services.org_tree import OrgTree
+from ohsms.services.risk_matrix import RiskMatrixConfig
+from ohsms.services.dashboard_cache import DashboardCache
+from ohsms.services.form_schema import FormSchema
+from ohsms.services.rollups import RollupService
+from ohsms.services.status_durations import StatusDurationService
+
+
+# =========================
+# RBAC cache invalidation
+# =========================
+
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def invalidate_permissions(sender, instance, **kwargs):
+    """
+    أي تعديل على الأدوار أو الإسنادات يرفع إصدار الصلاحيات
+    (يشمل الحفظ من UserRoleAdmin.save_model والحذف الجماعي من Admin)
+
+    رفع الإصدار بعد commit فقط: طلب متزامن يقرأ الأدوار القديمة قبل commit
+    كان سيخزنها تحت الإصدار الجديد ويبقى الكاش خاطئًا حتى التعديل التالي
+    """
+    transaction.on_commit(AuthorizationContext.invalidate_all)
+
+
+# =========================
+# Incident ACL
+# =========================
+
+@receiver(post_save, sender=Incident)
+def sync_incident_access(sender, instance, created, update_fields=None, **kwargs):
+    """
+    تحديث IncidentAccess عند الإنشاء / الإحالة / تغيير النطاق فقط
+    (تغيير الحالة لا يمس الجدول)
+    """
+    if not created and update_fields is not None:
+        if IncidentAccessService.ACL_FIELDS.isdisjoint(update_fields):
+            return
+
+    IncidentAccessService.sync(instance)
+
+
+# =========================
+# Organization tree
+# =========================
+
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+@receiver(post_save, sender=Section)
+@receiver(post_delete, sender=Section)
+def invalidate_org_tree(sender, instance, **kwargs):
+    """
+    الشجرة بدون TTL → رفع الإصدار بعد commit فقط حتى لا تُخزن نسخة ما قبل التعديل
+    """
+    transaction.on_commit(OrgTree.invalidate)
+
+
+# =========================
+# Risk matrix
+# =========================
+
+@receiver(post_save, sender=RiskMatrix)
+@receiver(post_delete, sender=RiskMatrix)
+@receiver(post_save, sender=RiskMatrixBand)
+@receiver(post_delete, sender=RiskMatrixBand)
+def invalidate_risk_matrix(sender, instance, **kwargs):
+    RiskMatrixConfig.invalidate()
+
+
+# =========================
+# Dashboard rollups
+# =========================
+
+@receiver(pre_save, sender=Incident)
+@receiver(pre_save, sender=Risk)
+def remember_rollup_key(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    مفتاح التجميع المحفوظ قبل التعديل (تغيير الحالة / النطاق / التقييم من أي مكان)
+    """
+    if raw or instance._state.adding:
+        return
+    instance._rollup_key = RollupService.stored_key(instance, update_fields)
+
+
+@receiver(post_save, sender=Incident)
+@receiver(post_save, sender=Risk)
+def rollup_saved(sender, instance, created, raw=False, **kwargs):
+    """
+    الإنشاء +1، والتعديل ينقل العدّ من المفتاح القديم للجديد - داخل نفس معاملة الحفظ
+    """
+    if raw:
+        return
+    RollupService.record_saved(instance, created, instance.__dict__.pop("_rollup_key", None))
+
+
+@receiver(post_delete, sender=Incident)
+@receiver(post_delete, sender=Risk)
+def rollup_deleted(sender, instance, **kwargs):
+    RollupService.record_deleted(instance)
+
+
+@receiver(post_save, sender=FormField)
+@receiver(post_delete, sender=FormField)
+def invalidate_form_schema(sender, instance, raw=False, **kwargs):
+    """
+    أي تعديل على حقول نموذج (FormService.add_field أو Admin) → إصدار مخطط جديد
+
+    bulk_create / bulk_update / update لا تمر من هنا: FormFieldQuerySet يرفع الإصدار
+    """
+    if raw:
+        return
+    form = instance.form if FormField.form.is_cached(instance) else None
+    FormSchema.bump(instance.form_id, form)
+
+
+@receiver(post_save, sender=FormEvent)
+def invalidate_forms_dashboard(sender, instance, created, **kwargs):
+    """
+    كل عملية على النماذج تكتب FormEvent → إبطال لقطة النماذج
+    """
+    if created:
+        DashboardCache.touch_forms()
+
+
+# =========================
+# Incident status durations
+# =========================
+
+@receiver(post_save, sender=IncidentEvent)
+def record_status_span(sender, instance, created, raw=False, **kwargs):
+    """
+    كل انتقال حالة يغلق فترة الحالة السابقة ويفتح فترة جديدة
+    """
+    if created and not raw:
+        StatusDurationService.record_event(instance)
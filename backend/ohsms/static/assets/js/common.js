@@ -185,3 +185,56 @@ function submitUrgent() {
   document.getElementById('homeMsg').textContent =
     'تم تسجيل بلاغ عاجل بنجاح، رقم البلاغ: ' + report.id;
 }
+
+/* ========= Org Tree (فرع → إدارة → قسم) ========= */
+
+// تُجلب الشجرة مرة واحدة (الرابط يحمل الإصدار ويُخزن في المتصفح)
+// ثم تُبنى القوائم المتتالية بدون أي طلبات إضافية
+function initOrgTreeSelects(url, ids) {
+  ids = ids || { branch: 'branch', department: 'department', section: 'section' };
+
+  const branchSelect = document.getElementById(ids.branch);
+  const departmentSelect = document.getElementById(ids.department);
+  const sectionSelect = document.getElementById(ids.section);
+
+  if (!branchSelect || !departmentSelect || !sectionSelect) return;
+
+  function fill(select, placeholder, items) {
+    select.innerHTML = '';
+    const first = document.createElement('option');
+    first.value = '';
+    first.textContent = placeholder;
+    select.appendChild(first);
+
+    items.forEach(([id, name]) => {
+      const o = document.createElement('option');
+      o.value = id;
+      o.textContent = name;
+      select.appendChild(o);
+    });
+  }
+
+  fetch(url, { credentials: 'same-origin' })
+    .then(res => res.json())
+    .then(tree => {
+      const branches = tree.branches || [];
+
+      fill(branchSelect, 'اختر الفرع', branches.map(b => [b.id, b.name]));
+
+      branchSelect.addEventListener('change', function () {
+        const branch = branches.find(b => String(b.id) === this.value);
+        const departments = branch ? branch.departments : [];
+
+        fill(departmentSelect, 'اختر الإدارة', departments.map(d => [d.id, d.name]));
+        fill(sectionSelect, 'اختر القسم', []);
+        departmentSelect._departments = departments;
+      });
+
+      departmentSelect.addEventListener('change', function () {
+        const departments = this._departments || [];
+        const department = departments.find(d => String(d.id) === this.value);
+
+        fill(sectionSelect, 'اختر القسم', department ? department.sections : []);
+      });
+    });
+}
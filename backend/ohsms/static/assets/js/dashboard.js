@@ -1,62 +1,142 @@
 /* =========================
    OHSMS Dashboard JS
    UI only – no auth, no redirects
+   البيانات من /api/dashboard/batch/ (ودجات JSON محسوبة بالتوازي)
 ========================= */
 
 (function () {
 
-  /**
-   * نحاول قراءة بيانات dashboard التي يمررها Django
-   * نتوقع أنها JSON أو dict مطبوع داخل <pre>
-   */
-  function parseDashboardData() {
-    const pre = document.querySelector('pre');
-    if (!pre) return null;
-
-    const raw = pre.textContent.trim();
-    if (!raw) return null;
-
-    try {
-      // محاولة JSON
-      return JSON.parse(raw);
-    } catch (e) {
-      // ليست JSON – نرجعها كنص
-      return raw;
+  const TITLES = {
+    kpis: '📊 المؤشرات الرئيسية',
+    trends: '📈 الاتجاه اليومي',
+    by_scope: '🏢 البلاغات حسب الوحدة',
+    heatmap: '🔥 مصفوفة المخاطر',
+    sla: '⏱️ الالتزام بالـ SLA'
+  };
+
+  function escapeHtml(value) {
+    return String(value === null || value === undefined ? '-' : value)
+      .replace(/&/g, '&amp;')
+      .replace(/</g, '&lt;')
+      .replace(/>/g, '&gt;')
+      .replace(/"/g, '&quot;');
+  }
+
+  function formatSeconds(seconds) {
+    if (seconds === null || seconds === undefined) return '-';
+    if (seconds < 3600) return Math.round(seconds / 60) + ' د';
+    if (seconds < 86400) return (seconds / 3600).toFixed(1) + ' س';
+    return (seconds / 86400).toFixed(1) + ' يوم';
+  }
+
+  function infoBoxes(items) {
+    return '<div class="grid-3">' + items.map(function (item) {
+      return '<div class="info-box"><strong>' + escapeHtml(item[0]) + '</strong><p>' + escapeHtml(item[1]) + '</p></div>';
+    }).join('') + '</div>';
+  }
+
+  function table(headers, rows) {
+    return '<table class="table"><thead><tr>' +
+      headers.map(function (h) { return '<th>' + escapeHtml(h) + '</th>'; }).join('') +
+      '</tr></thead><tbody>' +
+      rows.map(function (row) {
+        return '<tr>' + row.map(function (c) { return '<td>' + escapeHtml(c) + '</td>'; }).join('') + '</tr>';
+      }).join('') +
+      '</tbody></table>';
+  }
+
+  /* ========= Renderers ========= */
+
+  const RENDERERS = {
+    kpis: function (data) {
+      return infoBoxes([
+        ['إجمالي البلاغات', data.incidents.total],
+        ['بلاغات آخر الفترة', data.incidents.last_days_total],
+        ['إجمالي المخاطر', data.risks.total],
+        ['المخاطر المرتفعة', data.risks.high_risks_count]
+      ]);
+    },
+
+    trends: function (data) {
+      const days = {};
+      data.incidents.forEach(function (row) { days[row.day] = [row.count, 0]; });
+      data.risks.forEach(function (row) { (days[row.day] = days[row.day] || [0, 0])[1] = row.count; });
+      const rows = Object.keys(days).sort().map(function (day) { return [day, days[day][0], days[day][1]]; });
+      return rows.length ? table(['اليوم', 'البلاغات', 'المخاطر'], rows) : '<p class="hint">لا توجد بيانات</p>';
+    },
+
+    by_scope: function (data) {
+      return table(['الفرع', 'العدد'], data.by_branch_top.map(function (r) { return [r.branch__name, r.count]; })) +
+        table(['القسم', 'العدد'], data.by_section_top.map(function (r) { return [r.section__name, r.count]; }));
+    },
+
+    heatmap: function (data) {
+      const rows = data.grid.map(function (row) {
+        return '<tr><th>' + row[0].severity + '</th>' + row.map(function (cell) {
+          return '<td style="background:' + escapeHtml(cell.color) + ';text-align:center" title="' +
+            escapeHtml(cell.band) + ' (' + cell.score + ')">' + cell.count + '</td>';
+        }).join('') + '</tr>';
+      }).join('');
+      const header = '<tr><th>الشدة \\ الاحتمالية</th>' + data.grid[0].map(function (cell) {
+        return '<th>' + cell.likelihood + '</th>';
+      }).join('') + '</tr>';
+      return '<table class="table">' + header + rows + '</table>';
+    },
+
+    sla: function (data) {
+      const receive = data.response_percentiles.receive.overall;
+      const close = data.response_percentiles.close.overall;
+      return infoBoxes([
+        ['نسبة الالتزام (' + data.compliance.sla_hours + ' ساعة)', data.compliance.compliance_pct + '%']
+      ]) + table(
+        ['المقياس', 'العدد', 'p50', 'p90', 'p99'],
+        [
+          ['زمن الاستلام', receive.count, formatSeconds(receive.p50), formatSeconds(receive.p90), formatSeconds(receive.p99)],
+          ['زمن الإغلاق', close.count, formatSeconds(close.p50), formatSeconds(close.p90), formatSeconds(close.p99)]
+        ]
+      );
     }
-}
-
-  function renderSummary(data) {
-    if (!data || typeof data !== 'object') return;
-
-    const container = document.createElement('div');
-    container.className = 'grid-3';
-    container.style.marginBottom = '16px';
-
-    Object.keys(data).forEach(key => {
-      const box = document.createElement('div');
-      box.className = 'info-box';
-      box.innerHTML = `
-        <strong>${key}</strong>
-        <p>${data[key]}</p>
-      `;
-      container.appendChild(box);
-  });
+  };
 
-    const content = document.querySelector('.content');
-    if (content) {
-      content.insertBefore(container, content.firstChild);
+  function renderWidget(section, name, data, error) {
+    let body;
+    if (error) {
+      body = '<p class="hint">' + escapeHtml(error) + '</p>';
+    } else {
+      try {
+        body = RENDERERS[name] ? RENDERERS[name](data) : '<pre>' + escapeHtml(JSON.stringify(data, null, 2)) + '</pre>';
+      } catch (e) {
+        body = '<pre>' + escapeHtml(JSON.stringify(data, null, 2)) + '</pre>';
+      }
     }
+    section.innerHTML = '<h2>' + escapeHtml(TITLES[name] || name) + '</h2>' + body;
   }
 
   document.addEventListener('DOMContentLoaded', function () {
-    const data = parseDashboardData();
+    const container = document.querySelector('.dashboard-widgets');
+    if (!container) return;
 
-    // إذا كانت بيانات منظمة (dict / JSON)
-    if (data && typeof data === 'object') {
-      renderSummary(data);
-    }
+    const sections = {};
+    container.querySelectorAll('[data-widget]').forEach(function (section) {
+      sections[section.dataset.widget] = section;
+    });
+
+    const url = container.dataset.batchUrl + '?widgets=' + Object.keys(sections).join(',');
 
-    // وإلا نترك العرض الخام داخل <pre>
+    fetch(url, { credentials: 'same-origin', headers: { 'Accept': 'application/json' } })
+      .then(function (response) { return response.json(); })
+      .then(function (payload) {
+        Object.keys(sections).forEach(function (name) {
+          const widgets = payload.widgets || {};
+          const errors = payload.errors || {};
+          renderWidget(sections[name], name, widgets[name], errors[name] || (name in widgets ? null : payload.error));
+        });
+      })
+      .catch(function () {
+        Object.keys(sections).forEach(function (name) {
+          renderWidget(sections[name], name, null, 'تعذر تحميل البيانات');
+        });
+      });
   });
 
 })();
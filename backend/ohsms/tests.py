@@ -1,3 +1,1855 @@
+import re
+import statistics
+import time
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import Count
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from ohsms.models import (
+    Branch,
+    Department,
+    Section,
+    Incident,
+    IncidentEvent,
+    IncidentStatusSpan,
+    Risk,
+    RiskCategory,
+    RiskSubCategory,
+    RiskCause,
+    FormTemplate,
+    FormField,
+    FormSubmission,
+    FormAnswer,
+    FormEvent,
+)
+
+
+def _seed_risks(count):
+    """
+    مخاطر بتقييمات موزعة على الشرائح: 1, 4, 9, 16, 25 بالتناوب
+    """
+    category = RiskCategory.objects.create(name="فئة")
+    sub_category = RiskSubCategory.objects.create(category=category, name="فرعية")
+    cause = RiskCause.objects.create(sub_category=sub_category, name="سبب")
+
+    Risk.objects.bulk_create([
+        Risk(
+            title=f"خطر {i}",
+            description="-",
+            category=category,
+            sub_category=sub_category,
+            cause=cause,
+            severity=(i % 5) + 1,
+            likelihood=(i % 5) + 1,
+            risk_score=((i % 5) + 1) ** 2,
+            corrective_action="-",
+            preventive_action="-",
+            owner_department="-",
+            owner_person="-",
+            contact_channel="-",
+            scope_type="general",
+            created_by="seed",
+        )
+        for i in range(count)
+    ])
+
+
+# =====================================================
+# Query plans (hot paths)
+# =====================================================
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN على الاستعلامات الساخنة (لوحة المؤشرات / السجل الزمني / البلاغات المفتوحة)
+    يفشل الاختبار إذا رجع أي استعلام إلى مسح كامل للجدول.
+
+    - SQLite: "SCAN <table>" بدون "USING ... INDEX"
+    - PostgreSQL: "Seq Scan on <table>" (مع enable_seqscan = off حتى لا يختار
+      المخطط المسح بسبب صغر بيانات الاختبار)
+    """
+
+    SEED_SIZE = 300
+
+    @classmethod
+    def setUpTestData(cls):
+        branch = Branch.objects.create(name="فرع")
+        department = Department.objects.create(branch=branch, name="إدارة")
+        cls.section = Section.objects.create(department=department, name="قسم")
+
+        statuses = [code for code, _ in Incident.STATUS_CHOICES]
+        types = [code for code, _ in Incident.INCIDENT_TYPES]
+
+        Incident.objects.bulk_create([
+            Incident(
+                branch=branch,
+                department=department,
+                section=cls.section,
+                title=f"بلاغ {i}",
+                description="-",
+                incident_type=types[i % len(types)],
+                status=statuses[i % len(statuses)],
+            )
+            for i in range(cls.SEED_SIZE)
+        ])
+        cls.incident = Incident.objects.order_by("id").first()
+
+        IncidentEvent.objects.bulk_create([
+            IncidentEvent(incident_id=incident_id, action="note", actor="seed")
+            for incident_id in Incident.objects.values_list("id", flat=True)
+        ])
+
+        _seed_risks(cls.SEED_SIZE)
+
+        form = FormTemplate.objects.create(title="نموذج", created_by="seed")
+        FormEvent.objects.bulk_create([
+            FormEvent(form=form, action="submit")
+            for _ in range(cls.SEED_SIZE)
+        ])
+
+        # إجابات مصنّفة: حرارة 20..49 لكل تقديم
+        cls.temperature = FormField.objects.create(form=form, label="الحرارة", field_type="number", order=1)
+        submissions = FormSubmission.objects.bulk_create([
+            FormSubmission(form=form, submitted_by="seed")
+            for _ in range(cls.SEED_SIZE)
+        ])
+        FormAnswer.objects.bulk_create([
+            FormAnswer(submission=submission, field=cls.temperature, value=str(20 + i % 30), value_number=20 + i % 30)
+            for i, submission in enumerate(submissions)
+        ])
+
+    def setUp(self):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+                cursor.execute("SET enable_seqscan = off")
+        elif connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+    def tearDown(self):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("RESET enable_seqscan")
+
+    # =========================
+    # Helpers
+    # =========================
+
+    def assertNoFullScan(self, queryset, model):
+        if connection.vendor not in ("sqlite", "postgresql"):
+            self.skipTest(f"EXPLAIN checks not defined for {connection.vendor}")
+
+        plan = queryset.explain()
+        table = model._meta.db_table
+
+        if connection.vendor == "sqlite":
+            full_scan = re.search(
+                rf"SCAN {re.escape(table)}\b(?! USING (COVERING )?INDEX)",
+                plan,
+            )
+        else:
+            full_scan = re.search(rf"Seq Scan on {re.escape(table)}\b", plan)
+
+        self.assertIsNone(full_scan, f"Full scan on {table}:\n{plan}")
+        return plan
+
+    @staticmethod
+    def _since(days):
+        return timezone.now() - timedelta(days=days)
+
+    # =========================
+    # Incidents
+    # =========================
+
+    def test_incidents_by_type_in_date_range(self):
+        qs = (
+            Incident.objects
+            .filter(created_at__gte=self._since(30))
+            .values("incident_type")
+            .annotate(count=Count("id"))
+        )
+        self.assertNoFullScan(qs, Incident)
+
+    def test_incidents_by_status_in_date_range(self):
+        qs = Incident.objects.filter(status="new", created_at__gte=self._since(30))
+        self.assertNoFullScan(qs, Incident)
+
+    def test_open_incidents_by_section(self):
+        qs = (
+            Incident.objects
+            .filter(section=self.section, status__in=Incident.OPEN_STATUSES)
+            .order_by("-created_at")
+        )
+        self.assertNoFullScan(qs, Incident)
+
+    def test_incident_timeline(self):
+        qs = IncidentEvent.objects.filter(incident=self.incident).order_by("created_at")
+        plan = self.assertNoFullScan(qs, IncidentEvent)
+
+        if connection.vendor == "sqlite":
+            # الترتيب يأتي من الفهرس (incident, created_at) بدون فرز مؤقت
+            self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_sla_overdue_sweeps(self):
+        from ohsms.services.sla import SlaService
+
+        self.assertNoFullScan(SlaService.overdue(), Incident)
+
+    def test_status_spans_in_date_range(self):
+        qs = IncidentStatusSpan.objects.filter(exited_at__gte=self._since(30))
+        self.assertNoFullScan(qs, IncidentStatusSpan)
+
+    # =========================
+    # Risks / Forms
+    # =========================
+
+    def test_high_risks_band(self):
+        qs = Risk.objects.filter(risk_score__gte=15)
+        self.assertNoFullScan(qs, Risk)
+
+    def test_risks_in_date_range(self):
+        qs = Risk.objects.filter(created_at__gte=self._since(30))
+        self.assertNoFullScan(qs, Risk)
+
+    def test_submissions_by_answer_range(self):
+        qs = FormSubmission.objects.where_answer(self.temperature, "gt", 40)
+        self.assertNoFullScan(qs, FormAnswer)
+        self.assertNoFullScan(qs, FormSubmission)
+        self.assertEqual(qs.count(), 90)
+
+    def test_form_events_in_date_range(self):
+        qs = FormEvent.objects.filter(created_at__gte=self._since(30))
+        self.assertNoFullScan(qs, FormEvent)
+
+
+class KeysetPaginationTests(TestCase):
+    """
+    ترقيم المؤشر: التنقل ذهابًا وإيابًا، ورفض مؤشر من ترتيب آخر أو تالف (400)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        branch = Branch.objects.create(name="فرع")
+        department = Department.objects.create(branch=branch, name="إدارة")
+        section = Section.objects.create(department=department, name="قسم")
+        Incident.objects.bulk_create([
+            Incident(
+                branch=branch, department=department, section=section,
+                title=f"بلاغ {i}", description="-", incident_type="normal", status="open",
+            )
+            for i in range(5)
+        ])
+
+    def _paginator(self):
+        from ohsms.core.pagination import KeysetPaginator
+        from ohsms.views import INCIDENT_SORTS
+
+        return KeysetPaginator(Incident.objects.all(), INCIDENT_SORTS, "newest", page_size=2)
+
+    def test_next_and_prev_pages(self):
+        paginator = self._paginator()
+        ids = list(Incident.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+
+        first = paginator.page()
+        second = paginator.page(cursor=first.next_cursor)
+        third = paginator.page(cursor=second.next_cursor)
+        self.assertEqual([item.id for item in first.items + second.items + third.items], ids)
+        self.assertIsNone(third.next_cursor)
+        self.assertEqual([item.id for item in paginator.page(cursor=second.prev_cursor).items], ids[:2])
+
+    def test_cursor_from_another_sort_is_rejected(self):
+        from django.contrib.auth.models import User
+
+        from ohsms.core.errors import ValidationFailed
+
+        paginator = self._paginator()
+        cursor = paginator.page(sort="newest").next_cursor
+
+        with self.assertRaises(ValidationFailed):
+            paginator.page(cursor=cursor, sort="oldest")
+        with self.assertRaises(ValidationFailed):
+            paginator.page(cursor="not-a-cursor")
+
+        self.client.force_login(User.objects.create_superuser(username="admin", password="-"))
+        self.assertEqual(self.client.get("/reports/", {"cursor": cursor, "sort": "newest"}).status_code, 200)
+        self.assertEqual(self.client.get("/reports/", {"cursor": cursor, "sort": "oldest"}).status_code, 400)
+
+
+# =====================================================
+# Dashboard query budget
+# =====================================================
+
+class DashboardQueryBudgetTests(TestCase):
+    """
+    dashboard_snapshot بعدد استعلامات ثابت (لا يزيد مع الحالات/الأنواع/البيانات)
+    """
+
+    SNAPSHOT_QUERIES = 7
+
+    @classmethod
+    def setUpTestData(cls):
+        branch = Branch.objects.create(name="فرع")
+        department = Department.objects.create(branch=branch, name="إدارة")
+        section = Section.objects.create(department=department, name="قسم")
+
+        now = timezone.now()
+        Incident.objects.bulk_create([
+            Incident(
+                branch=branch,
+                department=department,
+                section=section,
+                title=f"بلاغ {i}",
+                description="-",
+                incident_type=["normal", "urgent", "secret"][i % 3],
+                status=["new", "received", "closed"][i % 3],
+                handled_at=now + timedelta(hours=i),
+            )
+            for i in range(30)
+        ])
+
+        _seed_risks(20)
+
+        # البيانات أُدخلت بـ bulk_create (بدون الخدمات) → نبني جداول التجميع
+        from ohsms.services.rollups import RollupService
+
+        RollupService.rebuild()
+
+    def setUp(self):
+        from ohsms.services.risk_matrix import RiskMatrixConfig
+
+        # المصفوفة مخزنة على مستوى العملية (خارج ميزانية اللقطة)
+        RiskMatrixConfig.current()
+
+    def test_snapshot_query_count(self):
+        from ohsms.services.dashboard import DashboardService
+
+        with self.assertNumQueries(self.SNAPSHOT_QUERIES):
+            snapshot = DashboardService.dashboard_snapshot()
+
+        incidents = snapshot["incidents"]
+        self.assertEqual(incidents["kpis"]["total"], 30)
+        self.assertEqual(sum(row["count"] for row in incidents["kpis"]["by_status"]), 30)
+        self.assertEqual(incidents["by_scope"]["by_section_top"], [{"section__name": "قسم", "count": 30}])
+        self.assertEqual(incidents["sla_24h"]["within_sla"], 25)
+
+        # handled_at = الإنشاء + i ساعة → الوسيط ~ 15 ساعة (خطأ الشرائح ≤ 25%)
+        receive = incidents["response_percentiles"]["receive"]
+        self.assertEqual(receive["overall"]["count"], 30)
+        self.assertAlmostEqual(receive["overall"]["p50"], 15 * 3600, delta=0.25 * 15 * 3600)
+        self.assertEqual(sum(row["count"] for row in receive["by_type"]), 30)
+        self.assertEqual(incidents["response_percentiles"]["close"]["overall"]["count"], 0)
+
+        risks = snapshot["risks"]
+        self.assertEqual(risks["kpis"]["total"], 20)
+        self.assertEqual(risks["distribution"], {"low": 8, "medium": 4, "high": 8})
+        self.assertEqual(risks["kpis"]["high_risks_count"], 8)
+
+    def test_risk_heatmap_single_query(self):
+        from ohsms.services.dashboard import DashboardService
+
+        with self.assertNumQueries(1):
+            heatmap = DashboardService.risks_heatmap(breakdown="category")
+
+        self.assertEqual(heatmap["total"], 20)
+        self.assertEqual(heatmap["totals"], {"low": 8, "medium": 4, "high": 8})
+
+        # الشبكة كاملة 5×5 (صف لكل شدة من الأعلى)، والمخاطر على القطر فقط
+        cells = {(c["severity"], c["likelihood"]): c for row in heatmap["grid"] for c in row}
+        self.assertEqual(len(cells), 25)
+        self.assertEqual(cells[(5, 5)]["band"], "high")
+        self.assertEqual(cells[(3, 3)]["count"], 4)
+        self.assertEqual(cells[(1, 5)]["count"], 0)
+        self.assertEqual(heatmap["groups"][0]["total"], 20)
+
+    def test_risk_matrix_gaps_count_in_top_band_everywhere(self):
+        from ohsms.core.cache_versions import bump_version
+        from ohsms.models import RiskMatrix, RiskMatrixBand
+        from ohsms.services.dashboard import DashboardService
+        from ohsms.services.risk_matrix import RISK_MATRIX_VERSION, RiskMatrixConfig, band_errors
+
+        # فجوات عند 4 و 11-19 → تُصنّف "high" في الخريطة والمؤشرات معًا
+        with self.captureOnCommitCallbacks(execute=True):
+            matrix = RiskMatrix.objects.create(name="بفجوات")
+            RiskMatrixBand.objects.bulk_create([
+                RiskMatrixBand(matrix=matrix, code="low", label="منخفض", max_score=3, order=1),
+                RiskMatrixBand(matrix=matrix, code="medium", label="متوسط", min_score=5, max_score=10, order=2),
+                RiskMatrixBand(matrix=matrix, code="high", label="مرتفع", min_score=20, order=3),
+            ])
+
+        def restore():
+            # المصفوفة المحمّلة في الذاكرة تتبع الإصدار وليس معاملة الاختبار
+            RiskMatrix.objects.filter(pk=matrix.pk).delete()
+            bump_version(RISK_MATRIX_VERSION)
+            RiskMatrixConfig.current()
+
+        self.addCleanup(restore)
+
+        config = RiskMatrixConfig.current()
+        self.assertEqual(len(band_errors(config.bands, max_score=25)), 2)
+
+        distribution = DashboardService.risks_distribution()
+        heatmap = DashboardService.risks_heatmap()
+        self.assertEqual(distribution, {"low": 4, "medium": 4, "high": 12})
+        self.assertEqual(heatmap["totals"], distribution)
+        self.assertEqual(sum(distribution.values()), 20)
+
+        # الحفظ داخل معاملة لم تكتمل لا يغيّر الإصدار
+        version = RiskMatrixConfig.current().version
+        RiskMatrixBand.objects.filter(matrix=matrix, code="low").update(max_score=4)
+        RiskMatrixBand.objects.get(matrix=matrix, code="low").save()
+        self.assertEqual(RiskMatrixConfig.current().version, version)
+
+    def test_instrumentation_matches_query_count(self):
+        from django.test import override_settings
+
+        from ohsms.core import instrumentation
+        from ohsms.services.dashboard import DashboardService
+
+        instrumentation.reset()
+        budgets = {"dashboard.snapshot": {"queries": self.SNAPSHOT_QUERIES - 1}}
+
+        with override_settings(OHSMS_DASHBOARD_BUDGETS=budgets):
+            with self.assertLogs("ohsms.instrumentation", level="WARNING") as logs:
+                DashboardService.dashboard_snapshot()
+
+        metrics = instrumentation.snapshot()
+        self.assertEqual(metrics["dashboard.snapshot"]["max_queries"], self.SNAPSHOT_QUERIES)
+        self.assertEqual(metrics["dashboard.snapshot"]["budget_violations"], 1)
+        self.assertEqual(metrics["dashboard.risk_totals"]["max_queries"], 1)
+        self.assertGreater(metrics["dashboard.snapshot"]["avg_rows"], 0)
+        self.assertIn("budget_exceeded", logs.output[0])
+
+    def test_instrumentation_logs_breaches_to_stdout(self):
+        import logging
+        import sys
+
+        # أزمنة كل استدعاء في /api/dashboard/metrics/، والسجل للتجاوزات فقط
+        logger = logging.getLogger("ohsms.instrumentation")
+        self.assertEqual(logger.level, logging.WARNING)
+        self.assertEqual([handler.stream for handler in logger.handlers], [sys.stdout])
+
+
+# =====================================================
+# Authorization / visibility (visible_to == in-memory checks)
+# =====================================================
+
+class OrgTreeTests(TestCase):
+    """
+    الشجرة: ثلاثة استعلامات عند التحميل ثم كل الفحوصات بدون استعلامات، وتُستبدل بعد commit فقط
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        from ohsms.services.org_tree import OrgTree
+
+        cls.branch = Branch.objects.create(name="الرياض")
+        cls.department = Department.objects.create(branch=cls.branch, name="التشغيل")
+        cls.section = Section.objects.create(department=cls.department, name="الصيانة")
+        cls.other_section = Section.objects.create(department=cls.department, name="المستودع")
+        # الشجرة مخزنة للعملية وليست داخل معاملة الاختبار
+        OrgTree.invalidate()
+
+    def test_lookups_run_without_queries(self):
+        from ohsms.services.org_tree import OrgTree
+
+        OrgTree.invalidate()
+        with self.assertNumQueries(3):
+            tree = OrgTree.current()
+
+        with self.assertNumQueries(0):
+            self.assertIs(OrgTree.current(), tree)
+            self.assertEqual(str(self.section), "الرياض - التشغيل - الصيانة")
+            self.assertEqual(
+                tree.ancestors(OrgTree.SECTION, self.section.id),
+                (self.branch.id, self.department.id, self.section.id),
+            )
+            self.assertEqual(tree.resolve(section_id=self.section.id), tree.ancestors(OrgTree.SECTION, self.section.id))
+            self.assertTrue(tree.is_descendant(OrgTree.SECTION, self.section.id, OrgTree.BRANCH, self.branch.id))
+            self.assertFalse(tree.is_descendant(OrgTree.BRANCH, self.branch.id, OrgTree.SECTION, self.section.id))
+            self.assertEqual(
+                [node.name for node in tree.sections_of(self.department.id)], ["الصيانة", "المستودع"],
+            )
+
+    def test_replaced_only_after_commit(self):
+        from ohsms.services.org_tree import OrgTree
+
+        tree = OrgTree.current()
+        with self.captureOnCommitCallbacks(execute=False):
+            Branch.objects.create(name="جدة")
+        self.assertIs(OrgTree.current(), tree)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Section.objects.filter(pk=self.other_section.pk).delete()
+        self.addCleanup(OrgTree.invalidate)
+
+        fresh = OrgTree.current()
+        self.assertIsNot(fresh, tree)
+        self.assertIsNone(fresh.node(OrgTree.SECTION, self.other_section.id))
+        self.assertEqual({node.name for node in fresh.branches.values()}, {"الرياض", "جدة"})
+
+    def test_request_scope_reads_version_once(self):
+        from unittest import mock
+
+        from ohsms.services import org_tree
+        from ohsms.services.org_tree import OrgTree
+
+        tree = OrgTree.current()
+        with mock.patch.object(org_tree, "get_version", wraps=org_tree.get_version) as get_version:
+            with OrgTree.request_scope():
+                for _ in range(10):
+                    self.assertIs(OrgTree.current(), tree)
+                    str(self.section)
+                    Incident(section_id=self.section.id).location_label
+            self.assertEqual(get_version.call_count, 1)
+
+            # خارج الطلب: قراءة لكل استدعاء (لا تثبيت بين الطلبات)
+            OrgTree.current()
+            self.assertEqual(get_version.call_count, 2)
+
+        # تعديل الهيكل داخل الطلب يسقط الشجرة المثبتة
+        with OrgTree.request_scope():
+            OrgTree.current()
+            with self.captureOnCommitCallbacks(execute=True):
+                Branch.objects.create(name="الدمام")
+            self.addCleanup(OrgTree.invalidate)
+            self.assertIn("الدمام", {node.name for node in OrgTree.current().branches.values()})
+
+    def test_endpoint_etag_and_cache_control(self):
+        from django.contrib.auth.models import User
+
+        from ohsms.services.org_tree import OrgTree
+
+        self.client.force_login(User.objects.create_user(username="reporter"))
+        version = OrgTree.current().version
+
+        response = self.client.get("/ajax/org-tree/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], f'"org-tree-{version}"')
+        self.assertIn("max-age=0", response["Cache-Control"])
+        self.assertEqual(response.json(), {
+            "version": version,
+            "branches": [{
+                "id": self.branch.id,
+                "name": "الرياض",
+                "departments": [{
+                    "id": self.department.id,
+                    "name": "التشغيل",
+                    "sections": [[self.section.id, "الصيانة"], [self.other_section.id, "المستودع"]],
+                }],
+            }],
+        })
+
+        versioned = self.client.get("/ajax/org-tree/", {"v": version})
+        self.assertIn("max-age=86400", versioned["Cache-Control"])
+        self.assertIn("private", versioned["Cache-Control"])
+
+        not_modified = self.client.get("/ajax/org-tree/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b"")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Section.objects.create(department=self.department, name="المختبر")
+        self.addCleanup(OrgTree.invalidate)
+
+        changed = self.client.get("/ajax/org-tree/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], response["ETag"])
+        # الرابط القديم (?v=) لم يعد يطابق الإصدار → لا تخزين
+        self.assertIn("max-age=0", self.client.get("/ajax/org-tree/", {"v": version})["Cache-Control"])
+
+    def test_incident_forms_skip_org_tables(self):
+        from django.contrib.auth.models import User
+
+        from ohsms.services.org_tree import OrgTree
+
+        self.client.force_login(User.objects.create_user(username="reporter"))
+        version = OrgTree.current().version
+        tables = {model._meta.db_table for model in (Branch, Department, Section)}
+
+        for url in ("/incident/normal/", "/incident/secret/"):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, f"/ajax/org-tree/?v={version}")
+            self.assertEqual(
+                [query["sql"] for query in queries if any(table in query["sql"] for table in tables)], [],
+            )
+
+
+class AuthorizationCacheTests(TestCase):
+    """
+    AuthorizationContext: استعلام UserRole واحد ثم الكاش المشترك حتى تغيّر إصدار الصلاحيات
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+
+        from ohsms.models import Role, UserRole
+
+        cls.branch = Branch.objects.create(name="فرع")
+        cls.other_branch = Branch.objects.create(name="فرع آخر")
+        cls.role = Role.objects.create(code="branch_manager", name="مدير فرع")
+        cls.user = User.objects.create_user(username="manager")
+        UserRole.objects.create(user=cls.user, role=cls.role, branch=cls.branch)
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+
+    def _request_user(self):
+        # كائن مستخدم جديد لكل "طلب" (بدون السياق المخزّن على request.user)
+        from django.contrib.auth.models import User
+
+        return User(pk=self.user.pk, username=self.user.username)
+
+    def test_repeat_load_runs_no_rbac_queries(self):
+        from ohsms.core.authorization import AuthorizationContext
+        from ohsms.services.permissions import PermissionService
+
+        user = self._request_user()
+        with self.assertNumQueries(1):
+            context = AuthorizationContext.for_user(user)
+            self.assertTrue(PermissionService.has_any_role(user, ["branch_manager"]))
+        self.assertEqual(context.scope_signature, ((self.branch.id,), (), ()))
+
+        # نفس الطلب: السياق على كائن المستخدم | طلب جديد: من الكاش المشترك
+        with self.assertNumQueries(0):
+            self.assertIs(AuthorizationContext.for_user(user), context)
+            cached = AuthorizationContext.for_user(self._request_user())
+        self.assertEqual(cached.scope_signature, context.scope_signature)
+        self.assertEqual(cached.role_codes, {"branch_manager"})
+
+    def test_role_change_invalidates_after_commit(self):
+        from ohsms.core.authorization import AuthorizationContext
+        from ohsms.models import UserRole
+
+        AuthorizationContext.for_user(self._request_user())
+
+        # قبل commit: الإصدار لم يتغير → نفس المدخل المخزن
+        with self.captureOnCommitCallbacks(execute=False):
+            grant = UserRole.objects.create(user=self.user, role=self.role, branch=self.other_branch)
+        with self.assertNumQueries(0):
+            context = AuthorizationContext.for_user(self._request_user())
+        self.assertEqual(context.scope_signature, ((self.branch.id,), (), ()))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            grant.save()
+        with self.assertNumQueries(1):
+            context = AuthorizationContext.for_user(self._request_user())
+        self.assertEqual(context.scope_signature, (tuple(sorted((self.branch.id, self.other_branch.id))), (), ()))
+
+    def test_role_save_does_not_load_user(self):
+        from ohsms.models import UserRole
+
+        # الإشارة ترفع الإصدار فقط (لا تحميل لـ instance.user لكل إسناد)
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            with self.assertNumQueries(1):
+                UserRole.objects.create(user_id=self.user.pk, role=self.role, branch=self.other_branch)
+        self.assertEqual(len(callbacks), 1)
+
+
+class ScopeVisibilityTests(TestCase):
+    """
+    visible_to (SQL) و can_access_many (الذاكرة) يعطيان نفس النتيجة لكل
+    تركيبات النطاق الجزئية (فرع / إدارة / قسم، بما فيها غير المتسقة)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        import itertools
+
+        from django.contrib.auth.models import User
+
+        from ohsms.models import Role, UserRole
+        from ohsms.services.org_tree import OrgTree
+
+        cls.branches, cls.departments, cls.sections = [], [], []
+        for i in range(2):
+            branch = Branch.objects.create(name=f"فرع {i}")
+            department = Department.objects.create(branch=branch, name=f"إدارة {i}")
+            cls.branches.append(branch)
+            cls.departments.append(department)
+            cls.sections.append(Section.objects.create(department=department, name=f"قسم {i}"))
+
+        category = RiskCategory.objects.create(name="فئة")
+        sub_category = RiskSubCategory.objects.create(category=category, name="فرعية")
+        cause = RiskCause.objects.create(sub_category=sub_category, name="سبب")
+
+        combos = list(itertools.product([None, *cls.branches], [None, *cls.departments], [None, *cls.sections]))
+        Risk.objects.bulk_create([
+            Risk(
+                title=f"خطر {i}", description="-", category=category, sub_category=sub_category, cause=cause,
+                severity=1, likelihood=1, risk_score=1, corrective_action="-", preventive_action="-",
+                owner_department="-", owner_person="-", contact_channel="-", scope_type="general",
+                created_by="seed", branch=branch, department=department, section=section,
+            )
+            for i, (branch, department, section) in enumerate(combos)
+        ])
+        FormTemplate.objects.bulk_create([
+            FormTemplate(
+                title=f"نموذج {i}", created_by="seed", visibility="public" if i % 9 == 0 else "restricted",
+                branch=branch, department=department, section=section,
+            )
+            for i, (branch, department, section) in enumerate(combos)
+        ])
+
+        def user_with(username, code, **scope):
+            user = User.objects.create_user(username=username)
+            role = Role.objects.get_or_create(code=code, defaults={"name": code})[0]
+            UserRole.objects.create(user=user, role=role, **scope)
+            return user
+
+        cls.users = [
+            user_with("branch-0", "branch_manager", branch=cls.branches[0]),
+            user_with("department-1", "department_manager", department=cls.departments[1]),
+            user_with("section-0", "section_manager", section=cls.sections[0]),
+            User.objects.create_user(username="no-roles"),
+        ]
+
+        # is_visible يكمل الآباء من الشجرة المخزنة للعملية
+        OrgTree.invalidate()
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        # سياقات الصلاحيات مخزنة حسب id المستخدم، والمعرفات تتكرر بين فئات الاختبار
+        cache.clear()
+
+    def test_batch_checks_agree_with_visible_to(self):
+        from ohsms.services.permissions import PermissionService
+
+        for model in (Risk, FormTemplate):
+            objects = list(model.objects.all())
+            for user in self.users:
+                with self.subTest(model=model.__name__, user=user.username):
+                    visible = set(model.objects.visible_to(user).values_list("pk", flat=True))
+                    self.assertEqual(
+                        PermissionService.can_access_many(user, objects),
+                        {obj.pk: obj.pk in visible for obj in objects},
+                    )
+
+    def test_covered_scopes_are_dropped_and_predicate_cached(self):
+        from ohsms.core.authorization import AuthorizationContext
+        from ohsms.managers import compile_scope_predicate
+        from ohsms.models import Role, UserRole
+
+        user = self.users[0]
+        role = Role.objects.get(code="branch_manager")
+        UserRole.objects.bulk_create([
+            UserRole(user=user, role=role, department=self.departments[0]),
+            UserRole(user=user, role=role, section=self.sections[0]),
+            UserRole(user=user, role=role, section=self.sections[1]),
+        ])
+
+        context = AuthorizationContext.load(user)
+        self.assertEqual(context.scope_signature, ((self.branches[0].id,), (), (self.sections[1].id,)))
+        self.assertIs(
+            compile_scope_predicate(context.scope_signature, False),
+            compile_scope_predicate(context.scope_signature, False),
+        )
+
+        # شرط IN واحد لكل مستوى مهما كان عدد أسطر UserRole
+        sql = str(Risk.objects.filter(compile_scope_predicate(context.scope_signature, False)).query)
+        self.assertEqual(sql.count(" IN ("), 4)
+
+    def test_visible_to_edges(self):
+        from django.contrib.auth.models import AnonymousUser, User
+
+        from ohsms.models import Role, UserRole
+
+        no_roles = self.users[-1]
+        self.assertFalse(Risk.objects.visible_to(AnonymousUser()).exists())
+        self.assertFalse(Risk.objects.visible_to(no_roles).exists())
+        self.assertEqual(
+            set(FormTemplate.objects.visible_to(no_roles).values_list("visibility", flat=True)), {"public"},
+        )
+
+        admin = User.objects.create_user(username="admin-user")
+        role = Role.objects.create(code="system_admin", name="مدير النظام", is_global=True)
+        UserRole.objects.create(user=admin, role=role)
+        self.assertEqual(Risk.objects.visible_to(admin).count(), Risk.objects.count())
+
+    def test_stored_branch_is_its_own_path(self):
+        from ohsms.services.permissions import PermissionService
+
+        # الفرع المخزن 0 والقسم من الفرع 1: يظهر لمدير الفرع 0 في SQL والذاكرة
+        risk = Risk.objects.get(branch=self.branches[0], department=None, section=self.sections[1])
+        user = self.users[0]
+        self.assertTrue(Risk.objects.visible_to(user).filter(pk=risk.pk).exists())
+        self.assertEqual(PermissionService.can_access_many(user, [risk]), {risk.pk: True})
+
+    def test_branch_scope_covers_section_risk_in_policy(self):
+        from django.contrib.auth.models import User
+
+        from ohsms.core.errors import PermissionDenied
+        from ohsms.models import Role, UserRole
+        from ohsms.policies.risk_event_policy import RiskEventPolicy
+        from ohsms.services.permissions import PermissionService
+
+        coordinator = User.objects.create_user(username="coordinator-branch-0")
+        role = Role.objects.create(code="safety_coordinator", name="منسق السلامة")
+        UserRole.objects.create(user=coordinator, role=role, branch=self.branches[0])
+
+        # خطر مسجل على القسم فقط: يغطيه نطاق فرعه، ولا يغطيه فرع آخر
+        risk = Risk.objects.get(branch=None, department=None, section=self.sections[0])
+        other = Risk.objects.get(branch=None, department=None, section=self.sections[1])
+
+        self.assertTrue(PermissionService.can_access_risk(coordinator, risk))
+        self.assertFalse(PermissionService.can_access_risk(coordinator, other))
+        RiskEventPolicy.can_transition(risk=risk, actor=coordinator, to_status="submitted")
+        with self.assertRaises(PermissionDenied):
+            RiskEventPolicy.can_transition(risk=other, actor=coordinator, to_status="submitted")
+
+        for user in self.users:
+            with self.subTest(user=user.username):
+                visible = set(Risk.objects.visible_to(user).values_list("pk", flat=True))
+                self.assertEqual(
+                    {r.pk for r in Risk.objects.all() if PermissionService.can_access_risk(user, r)},
+                    visible,
+                )
+
+
+class IncidentAccessTests(TestCase):
+    """
+    جدول IncidentAccess يتبع الإنشاء / الإحالة / تغيير النطاق، و rebuild يعيد نفس الأسطر
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+
+        from ohsms.models import Role, UserRole
+
+        cls.sections = []
+        for i in range(2):
+            branch = Branch.objects.create(name=f"فرع {i}")
+            department = Department.objects.create(branch=branch, name=f"إدارة {i}")
+            cls.sections.append(Section.objects.create(department=department, name=f"قسم {i}"))
+
+        cls.reporter = User.objects.create_user(username="reporter")
+        cls.handler = User.objects.create_user(username="handler")
+        cls.manager = User.objects.create_user(username="section-manager")
+        role = Role.objects.create(code="section_manager", name="مدير قسم")
+        UserRole.objects.create(user=cls.manager, role=role, section=cls.sections[1])
+
+    def _incident(self, section):
+        return Incident.objects.create(
+            branch=section.department.branch, department=section.department, section=section,
+            title="بلاغ", description="-", incident_type="normal", status="open", actor=self.reporter,
+        )
+
+    def _principals(self, incident):
+        from ohsms.models import IncidentAccess
+
+        return set(IncidentAccess.objects.filter(incident=incident).values_list("principal", flat=True))
+
+    def _snapshot(self):
+        from ohsms.models import IncidentAccess
+
+        return sorted(IncidentAccess.objects.values_list("incident_id", "principal"))
+
+    def test_sync_follows_assignment_and_scope(self):
+        section = self.sections[0]
+        incident = self._incident(section)
+        self.assertEqual(self._principals(incident), {
+            f"u:{self.reporter.pk}", f"b:{section.department.branch_id}",
+            f"d:{section.department_id}", f"s:{section.id}",
+        })
+        self.assertFalse(Incident.objects.visible_to(self.handler).exists())
+
+        incident.assigned_to = self.handler
+        incident.save(update_fields=["assigned_to"])
+        self.assertIn(f"u:{self.handler.pk}", self._principals(incident))
+        self.assertTrue(Incident.objects.visible_to(self.handler).filter(pk=incident.pk).exists())
+
+        # تغيير الحالة فقط لا يمس الجدول
+        incident.status = "in_progress"
+        with CaptureQueriesContext(connection) as captured:
+            incident.save(update_fields=["status"])
+        self.assertFalse(any("ohsms_incidentaccess" in q["sql"] for q in captured.captured_queries))
+
+        # إعادة النطاق → يراه مدير القسم الجديد
+        self.assertFalse(Incident.objects.visible_to(self.manager).exists())
+        target = self.sections[1]
+        incident.branch, incident.department, incident.section = target.department.branch, target.department, target
+        incident.save()
+        self.assertEqual(self._principals(incident), {
+            f"u:{self.reporter.pk}", f"u:{self.handler.pk}", f"b:{target.department.branch_id}",
+            f"d:{target.department_id}", f"s:{target.id}",
+        })
+        self.assertTrue(Incident.objects.visible_to(self.manager).filter(pk=incident.pk).exists())
+
+    def test_rebuild_matches_incremental(self):
+        from ohsms.services.incident_access import IncidentAccessService
+
+        for section in self.sections * 3:
+            self._incident(section)
+        incremental = self._snapshot()
+
+        # تعديل خارج الـ ORM signals → rebuild يصلحه
+        Incident.objects.update(assigned_to=self.handler)
+        self.assertEqual(self._snapshot(), incremental)
+
+        self.assertEqual(IncidentAccessService.rebuild(batch_size=5), len(incremental) + 6)
+        self.assertEqual(
+            self._snapshot(),
+            sorted(incremental + [(pk, f"u:{self.handler.pk}") for pk in Incident.objects.values_list("pk", flat=True)]),
+        )
+
+
+# =====================================================
+# Dashboard cache (scope keys / versions / single-flight)
+# =====================================================
+
+class DashboardCacheTests(TestCase):
+    """
+    مدخل واحد لكل توقيع نطاقات، إبطال بإصدار الفرع فقط، وحساب واحد للطلبات المتزامنة
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        from ohsms.services.org_tree import OrgTree
+
+        cls.branches = [Branch.objects.create(name=f"فرع {i}") for i in range(2)]
+        department = Department.objects.create(branch=cls.branches[0], name="إدارة")
+        cls.section = Section.objects.create(department=department, name="قسم")
+        OrgTree.invalidate()
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+
+    @staticmethod
+    def _context(user_id, scope_signature=((), (), ()), is_global=False):
+        from ohsms.core.authorization import AuthorizationContext
+
+        grants = [("system_admin" if is_global else "section_manager", is_global, None, None, None)]
+        return AuthorizationContext(user_id=user_id, grants=grants, scope_signature=scope_signature)
+
+    def test_keys_follow_scope_signature(self):
+        from ohsms.services.dashboard_cache import DashboardCache
+
+        section_scope = ((), (), (self.section.id,))
+        self.assertEqual(
+            DashboardCache.key("kpis", self._context(1, is_global=True)),
+            DashboardCache.key("kpis", self._context(2, is_global=True)),
+        )
+        self.assertTrue(DashboardCache.key("kpis", self._context(1, is_global=True)).endswith(":global"))
+        self.assertEqual(
+            DashboardCache.key("kpis", self._context(1, section_scope)),
+            DashboardCache.key("kpis", self._context(2, section_scope)),
+        )
+        self.assertNotEqual(
+            DashboardCache.key("kpis", self._context(1, section_scope)),
+            DashboardCache.key("kpis", self._context(1, ((self.branches[0].id,), (), ()))),
+        )
+
+    def test_branch_touch_invalidates_its_scopes_only(self):
+        from ohsms.services.dashboard_cache import DashboardCache
+
+        contexts = {
+            "section": self._context(1, ((), (), (self.section.id,))),
+            "other_branch": self._context(2, ((self.branches[1].id,), (), ())),
+            "global": self._context(3, is_global=True),
+        }
+        calls = []
+
+        def compute(name):
+            calls.append(name)
+            return len(calls)
+
+        def snapshot():
+            return {
+                name: DashboardCache.get_or_compute("kpis", context, lambda name=name: compute(name))
+                for name, context in contexts.items()
+            }
+
+        first = snapshot()
+        self.assertEqual(snapshot(), first)
+        self.assertEqual(len(calls), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            DashboardCache.touch(self.branches[0].id)
+
+        second = snapshot()
+        self.assertEqual(sorted(calls[3:]), ["global", "section"])
+        self.assertEqual(second["other_branch"], first["other_branch"])
+        self.assertNotEqual(second["section"], first["section"])
+
+    def test_concurrent_requests_compute_once(self):
+        import threading
+
+        from ohsms.core.single_flight import single_flight
+
+        calls = []
+        start = threading.Barrier(8)
+        results = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return "value"
+
+        def request():
+            start.wait()
+            results.append(single_flight("test:coalesce", compute, tag="1"))
+
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ["value"] * 8)
+        self.assertEqual(len(calls), 1)
+
+    def test_stale_value_while_another_process_refreshes(self):
+        from ohsms.core.single_flight import _acquire_lease, single_flight
+
+        self.assertEqual(single_flight("test:stale", lambda: "old", tag="1", stale_ttl=60), "old")
+
+        # lease البصمة الجديدة مع عملية أخرى → القيمة القديمة فورًا بدون حساب
+        self.assertTrue(_acquire_lease("test:stale", "2", 30))
+        self.assertEqual(single_flight("test:stale", lambda: "new", tag="2", stale_ttl=60), "old")
+
+        # lease البصمة السابقة لا يُحذف لكنه لا يمنع تحديث بصمة لاحقة
+        self.assertEqual(single_flight("test:stale", lambda: "new", tag="3", stale_ttl=60), "new")
+        self.assertEqual(single_flight("test:stale", lambda: "newer", tag="3", stale_ttl=60), "new")
+
+
+# =====================================================
+# Dashboard widgets (params / ETag / batch)
+# =====================================================
+
+class DashboardWidgetTests(TestCase):
+    """
+    ودجات اللوحة: التحقق من المعاملات، ETag و 304، عزل الأخطاء في الدفعة، وأدوار الخريطة
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+
+        from ohsms.models import Role, UserRole
+        from ohsms.services.rollups import RollupService
+
+        branch = Branch.objects.create(name="فرع")
+        department = Department.objects.create(branch=branch, name="إدارة")
+        section = Section.objects.create(department=department, name="قسم")
+        Incident.objects.create(
+            branch=branch, department=department, section=section,
+            title="بلاغ", description="-", incident_type="normal", status="open",
+        )
+        _seed_risks(5)
+        RollupService.rebuild()
+
+        cls.admin = User.objects.create_user(username="admin-user")
+        role = Role.objects.create(code="system_admin", name="مدير النظام", is_global=True)
+        UserRole.objects.create(user=cls.admin, role=role)
+
+        cls.viewer = User.objects.create_user(username="viewer")
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+
+    def test_widget_params(self):
+        from django.http import QueryDict
+
+        from ohsms.core.errors import ValidationFailed
+        from ohsms.services.dashboard_widgets import DashboardWidgetService
+
+        self.assertEqual(DashboardWidgetService.params("kpis", QueryDict("days=7&x=1")), {"days": 7})
+        self.assertEqual(
+            DashboardWidgetService.params("heatmap", QueryDict("breakdown=branch")),
+            {"breakdown": "branch", "days": None},
+        )
+        for name, query in (("kpis", "days=0"), ("kpis", "days=abc"), ("nope", "")):
+            with self.assertRaises(ValidationFailed):
+                DashboardWidgetService.params(name, QueryDict(query))
+
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get("/api/dashboard/kpis/", {"days": "abc"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/dashboard/batch/", {"widgets": "kpis,nope"}).status_code, 400)
+
+    def test_etag_follows_stored_entry(self):
+        from ohsms.services.dashboard_cache import DashboardCache
+
+        self.client.force_login(self.admin)
+
+        # أول طلب يحسب القيمة: لا يوجد مدخل حديث → بدون ETag
+        first = self.client.get("/api/dashboard/kpis/")
+        self.assertEqual(first.status_code, 200)
+        self.assertFalse(first.has_header("ETag"))
+
+        second = self.client.get("/api/dashboard/kpis/")
+        etag = second["ETag"]
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(self.client.get("/api/dashboard/kpis/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # بعد الإبطال: المدخل قديم → لا 304 على البصمة القديمة، ثم بصمة جديدة
+        with self.captureOnCommitCallbacks(execute=True):
+            DashboardCache.touch()
+        refreshed = self.client.get("/api/dashboard/kpis/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(refreshed.status_code, 200)
+        self.assertFalse(refreshed.has_header("ETag"))
+        self.assertNotEqual(self.client.get("/api/dashboard/kpis/")["ETag"], etag)
+
+    def test_heatmap_widget_requires_risk_role(self):
+        from ohsms.views import RISK_DENIED_MESSAGE
+
+        self.client.force_login(self.viewer)
+        denied = self.client.get("/api/dashboard/heatmap/")
+        self.assertEqual(denied.status_code, 403)
+        self.assertEqual(denied.json(), {"error": RISK_DENIED_MESSAGE})
+
+        batch = self.client.get("/api/dashboard/batch/", {"widgets": "kpis,heatmap"}).json()
+        self.assertEqual(list(batch["widgets"]), ["kpis"])
+        self.assertIn("heatmap", batch["errors"])
+
+        self.client.force_login(self.admin)
+        response = self.client.get("/api/dashboard/heatmap/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["total"], 5)
+
+    def test_batch_on_thread_pool_isolates_failures(self):
+        import threading
+        from unittest import mock
+
+        from django.http import QueryDict
+        from django.test import override_settings
+
+        from ohsms.services.dashboard_widgets import DashboardWidgetService
+
+        def compute(user, name, params, context=None):
+            if name == "sla":
+                raise RuntimeError("boom")
+            return {"thread": threading.current_thread().name, "params": params}
+
+        with override_settings(OHSMS_DASHBOARD_WORKERS=3), \
+                mock.patch.object(DashboardWidgetService, "compute", side_effect=compute), \
+                self.assertLogs("ohsms.services.dashboard_widgets", level="ERROR"):
+            result = DashboardWidgetService.batch(self.admin, ["kpis", "trends", "sla"], QueryDict("days=7"))
+
+        self.assertEqual(sorted(result["widgets"]), ["kpis", "trends"])
+        self.assertEqual(result["widgets"]["kpis"]["params"], {"days": 7})
+        self.assertTrue(result["widgets"]["kpis"]["thread"].startswith("ohsms-dashboard"))
+        self.assertEqual(list(result["errors"]), ["sla"])
+
+
+# =====================================================
+# Dashboard rollups (incremental == rebuild)
+# =====================================================
+
+class RollupConsistencyTests(TestCase):
+    """
+    جداول التجميع تتبع الإنشاء / الحذف / تعديل النطاق والحالة والتقييم من أي مكان
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.branch = Branch.objects.create(name="فرع")
+        department = Department.objects.create(branch=cls.branch, name="إدارة")
+        cls.section = Section.objects.create(department=department, name="قسم")
+
+        cls.other_branch = Branch.objects.create(name="فرع آخر")
+        other_department = Department.objects.create(branch=cls.other_branch, name="إدارة أخرى")
+        cls.other_section = Section.objects.create(department=other_department, name="قسم آخر")
+
+        # مفاتيح تجميع المخاطر تكمل الآباء من الشجرة المخزنة للعملية
+        from ohsms.services.org_tree import OrgTree
+
+        OrgTree.invalidate()
+
+    def _incident(self, **kwargs):
+        fields = {
+            "branch": self.branch, "department": self.section.department, "section": self.section,
+            "title": "بلاغ", "description": "-", "incident_type": "normal", "status": "open",
+        }
+        fields.update(kwargs)
+        return Incident.objects.create(**fields)
+
+    def assertMatchesRebuild(self):
+        from ohsms.models import IncidentDailyRollup, RiskDailyRollup
+        from ohsms.services.rollups import RollupService
+
+        def rows():
+            return [
+                sorted(
+                    (row for row in model.objects.values_list(
+                        "day", "branch_id", "department_id", "section_id", key, "status", "count",
+                    ) if row[-1]),
+                    key=repr,
+                )
+                for model, key in ((IncidentDailyRollup, "incident_type"), (RiskDailyRollup, "category_id"))
+            ]
+
+        incremental = rows()
+        RollupService.rebuild()
+        self.assertEqual(rows(), incremental)
+        self.assertFalse(IncidentDailyRollup.objects.filter(count__lt=0).exists())
+        self.assertFalse(RiskDailyRollup.objects.filter(count__lt=0).exists())
+
+    def test_incident_delete_and_admin_edits(self):
+        from django.db.models import Sum
+
+        from ohsms.models import IncidentDailyRollup
+
+        first = self._incident()
+        self._incident()
+        first.delete()
+        self.assertEqual(IncidentDailyRollup.objects.aggregate(total=Sum("count"))["total"], 1)
+
+        # تعديل من لوحة الإدارة: النطاق والحالة والنوع معًا
+        incident = Incident.objects.get()
+        incident.branch = self.other_branch
+        incident.department = self.other_section.department
+        incident.section = self.other_section
+        incident.status = "in_progress"
+        incident.incident_type = "urgent"
+        incident.save()
+        self.assertEqual(
+            list(IncidentDailyRollup.objects.filter(count__gt=0).values_list("branch_id", "status", "count")),
+            [(self.other_branch.id, "in_progress", 1)],
+        )
+        self.assertMatchesRebuild()
+
+        # حفظ لا يمس حقول المفتاح → بدون قراءة إضافية
+        with self.assertNumQueries(1):
+            incident.save(update_fields=["title"])
+
+        incident.delete()
+        self.assertMatchesRebuild()
+
+    def test_risk_score_and_delete_move_rollups(self):
+        from ohsms.services.rollups import RollupService
+
+        _seed_risks(5)
+        RollupService.rebuild()
+
+        risk = Risk.objects.get(risk_score=1)
+        risk.severity = risk.likelihood = 5
+        risk.branch = self.branch
+        risk.save()
+        self.assertMatchesRebuild()
+
+        Risk.objects.filter(risk_score=4).delete()
+        self.assertMatchesRebuild()
+
+    def test_matrix_edit_then_transition_keeps_count(self):
+        from django.db.models import Sum
+
+        from ohsms.core.cache_versions import bump_version
+        from ohsms.models import RiskDailyRollup, RiskMatrix, RiskMatrixBand
+        from ohsms.services.risk_matrix import RISK_MATRIX_VERSION, RiskMatrixConfig
+        from ohsms.services.rollups import RollupService
+
+        _seed_risks(1)
+        RollupService.rebuild()
+        risk = Risk.objects.get()
+
+        # الخطر (1) ينتقل من "low" إلى "high" في المصفوفة الجديدة
+        with self.captureOnCommitCallbacks(execute=True):
+            matrix = RiskMatrix.objects.create(name="صارمة")
+            RiskMatrixBand.objects.create(matrix=matrix, code="high", label="مرتفع", order=1)
+
+        def restore():
+            RiskMatrix.objects.filter(pk=matrix.pk).delete()
+            bump_version(RISK_MATRIX_VERSION)
+            RiskMatrixConfig.current()
+
+        self.addCleanup(restore)
+
+        risk.status = "approved"
+        risk.save()
+
+        self.assertEqual(RiskDailyRollup.objects.aggregate(total=Sum("count"))["total"], 1)
+        today = timezone.localdate()
+        self.assertEqual(
+            sum(row["count"] for row in RollupService.risks_trend(today, today)), 1,
+        )
+        self.assertMatchesRebuild()
+
+    def test_status_spans_match_both_rebuilds(self):
+        from ohsms.services.status_durations import StatusDurationService
+
+        def event(incident, action, from_status, to_status):
+            IncidentEvent.objects.create(
+                incident=incident, action=action, from_status=from_status, to_status=to_status, actor="-",
+            )
+
+        closed = self._incident()
+        event(closed, "create", "", "open")
+        event(closed, "note", "open", "open")
+        event(closed, "status_change", "open", "in_progress")
+        event(closed, "status_change", "in_progress", "closed")
+
+        waiting = self._incident(
+            branch=self.other_branch, department=self.other_section.department, section=self.other_section,
+        )
+        event(waiting, "create", "", "open")
+
+        # بلاغ قديم بلا حدث إنشاء: الحالة الأولى من تاريخ الإنشاء
+        legacy = self._incident(incident_type="urgent")
+        event(legacy, "status_change", "open", "in_progress")
+
+        def spans():
+            return sorted(IncidentStatusSpan.objects.values_list(
+                "incident_id", "branch_id", "department_id", "section_id", "incident_type",
+                "status", "entered_at", "exited_at", "duration_seconds", "bucket",
+            ))
+
+        incremental = spans()
+        self.assertEqual(len(incremental), 6)
+        self.assertEqual(
+            [row[5] for row in incremental if row[0] == legacy.pk], ["in_progress", "open"],
+        )
+
+        # مسار Python ودوال النافذة (LAG/LEAD مدعومة في SQLite أيضًا)
+        self.assertEqual(StatusDurationService.rebuild(batch_size=2, use_window=False), 6)
+        self.assertEqual(spans(), incremental)
+        self.assertEqual(StatusDurationService.rebuild(batch_size=2, use_window=True), 6)
+        self.assertEqual(spans(), incremental)
+
+
+# =====================================================
+# Incident export
+# =====================================================
+
+class IncidentExportTests(TestCase):
+    """
+    التصدير: النصوص التي تبدأ كمعادلة تُهرّب في CSV فقط، و XLSX يبقى XML صالحًا
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+
+        from ohsms.models import Role, UserRole
+
+        branch = Branch.objects.create(name="فرع")
+        department = Department.objects.create(branch=branch, name="إدارة")
+        section = Section.objects.create(department=department, name="قسم")
+        cls.incident = Incident.objects.create(
+            branch=branch, department=department, section=section,
+            title='=HYPERLINK("http://evil","x")', description="-", incident_type="normal", status="open",
+        )
+        IncidentEvent.objects.create(incident=cls.incident, action="note", actor="@actor", note="-2+3\x0b")
+
+        cls.admin = User.objects.create_user(username="export-admin")
+        role = Role.objects.create(code="system_admin", name="مدير النظام", is_global=True)
+        UserRole.objects.create(user=cls.admin, role=role)
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+
+    def test_formula_cells_are_escaped_in_csv_only(self):
+        from ohsms.services.incident_export import IncidentExportService
+
+        [incident] = list(IncidentExportService.incident_rows(self.admin))
+        self.assertEqual(incident[4], '=HYPERLINK("http://evil","x")')
+        self.assertEqual(incident[5], "فرع - إدارة - قسم")
+
+        csv = "".join(IncidentExportService.csv_stream(self.admin))
+        self.assertIn('"\'=HYPERLINK(""http://evil"",""x"")"', csv)
+        self.assertNotIn(',=HYPERLINK', csv)
+
+        events = "".join(IncidentExportService.csv_stream(self.admin, dataset="events"))
+        self.assertIn(",'@actor,'-2+3", events)
+
+    def test_xlsx_is_well_formed(self):
+        import io
+        import zipfile
+        from xml.etree import ElementTree
+
+        from ohsms.services.incident_export import IncidentExportService
+
+        data = b"".join(IncidentExportService.xlsx_stream(self.admin, include_events=True))
+        ns = {"x": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            sheets = [
+                ElementTree.fromstring(archive.read(f"xl/worksheets/sheet{n}.xml"))
+                for n in (1, 2)
+            ]
+
+        def texts(sheet):
+            return [
+                [cell.findtext("x:is/x:t", default=None, namespaces=ns) for cell in row]
+                for row in sheet.iterfind("x:sheetData/x:row", ns)
+            ]
+
+        incidents, events = texts(sheets[0]), texts(sheets[1])
+        self.assertEqual(incidents[0], IncidentExportService.INCIDENT_HEADER)
+        self.assertEqual(incidents[1][4], '=HYPERLINK("http://evil","x")')
+
+        # بدون ' مضافة، ومحارف التحكم محذوفة
+        note = [row for row in events if row[2] == "ملاحظة"][0]
+        self.assertEqual(note[5:], ["@actor", "-2+3"])
+
+
+# =====================================================
+# Incident SLA
+# =====================================================
+
+class SlaTests(TestCase):
+    """
+    مواعيد SLA: حسب السياسة عند الإنشاء، تتبع تغيير الحالة، والمُجمّع على دفعات وبدون تكرار
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+
+        branch = Branch.objects.create(name="فرع")
+        department = Department.objects.create(branch=branch, name="إدارة")
+        section = Section.objects.create(department=department, name="قسم")
+        cls.location = {"branch": branch, "department": department, "section": section}
+        cls.actor = User.objects.create_user(username="sla-system")
+
+    def _incident(self, incident_type="normal", start=None):
+        from ohsms.services.sla import SlaService
+
+        return Incident.objects.create(
+            **self.location, title="بلاغ", description="-", incident_type=incident_type, status="open",
+            **SlaService.deadlines(incident_type, start),
+        )
+
+    def test_deadlines_follow_policy(self):
+        from ohsms.models import IncidentSlaPolicy
+        from ohsms.services.sla import SlaService
+
+        start = timezone.now()
+        self.assertEqual(SlaService.deadlines("urgent", start), {
+            "receive_due_at": start + timedelta(hours=1),
+            "resolve_due_at": start + timedelta(days=1),
+            "sla_due_at": start + timedelta(hours=1),
+        })
+
+        IncidentSlaPolicy.objects.create(incident_type="normal", receive_minutes=None, resolve_minutes=30)
+        self.assertEqual(SlaService.deadlines("normal", start), {
+            "receive_due_at": None,
+            "resolve_due_at": start + timedelta(minutes=30),
+            "sla_due_at": start + timedelta(minutes=30),
+        })
+        self.assertEqual(set(SlaService.deadlines("unknown", start).values()), {None})
+
+    def test_status_change_refreshes_next_deadline(self):
+        from ohsms.services.incident_service import IncidentService
+
+        incident = self._incident()
+        self.assertEqual(incident.sla_due_at, incident.receive_due_at)
+
+        IncidentService.change_status(incident=incident, new_status="in_progress", actor=self.actor)
+        incident.refresh_from_db()
+        self.assertEqual(incident.sla_due_at, incident.resolve_due_at)
+
+        IncidentService.change_status(incident=incident, new_status="closed", actor=self.actor)
+        incident.refresh_from_db()
+        self.assertIsNone(incident.sla_due_at)
+
+    def test_sweep_batches_and_is_idempotent(self):
+        from ohsms.services.sla import SlaService
+
+        now = timezone.now()
+        # متأخرة في الاستلام والمعالجة (8 أيام) / في الاستلام فقط (يومان) / لم تتأخر
+        both = [self._incident(start=now - timedelta(days=8)) for _ in range(5)]
+        receive_only = self._incident(start=now - timedelta(days=2))
+        on_time = self._incident(start=now)
+
+        self.assertEqual(SlaService.sweep(actor=self.actor, now=now, batch_size=2), 11)
+        self.assertEqual(IncidentEvent.objects.filter(action="escalate").count(), 11)
+
+        for incident in both:
+            incident.refresh_from_db()
+            self.assertEqual(incident.receive_breached_at, now)
+            self.assertEqual(incident.resolve_breached_at, now)
+            self.assertIsNone(incident.sla_due_at)
+
+        receive_only.refresh_from_db()
+        self.assertIsNone(receive_only.resolve_breached_at)
+        self.assertEqual(receive_only.sla_due_at, receive_only.resolve_due_at)
+        on_time.refresh_from_db()
+        self.assertEqual(on_time.sla_due_at, on_time.receive_due_at)
+
+        self.assertEqual(SlaService.sweep(actor=self.actor, now=now, batch_size=2), 0)
+        self.assertEqual(IncidentEvent.objects.filter(action="escalate").count(), 11)
+
+    def test_backfill_for_incidents_before_sla(self):
+        from importlib import import_module
+
+        from django.apps import apps
+
+        backfill = import_module("ohsms.migrations.0029_backfill_incident_sla").backfill_incident_sla
+
+        open_incident = self._incident()
+        in_progress = self._incident("urgent")
+        closed = self._incident()
+        Incident.objects.filter(pk=in_progress.pk).update(status="in_progress")
+        Incident.objects.filter(pk=closed.pk).update(status="closed")
+        Incident.objects.update(receive_due_at=None, resolve_due_at=None, sla_due_at=None)
+
+        backfill(apps, None)
+
+        open_incident.refresh_from_db()
+        self.assertEqual(open_incident.receive_due_at, open_incident.created_at + timedelta(days=1))
+        self.assertEqual(open_incident.resolve_due_at, open_incident.created_at + timedelta(days=7))
+        self.assertEqual(open_incident.sla_due_at, open_incident.receive_due_at)
+
+        # بعد الاستلام: موعد المعالجة فقط
+        in_progress.refresh_from_db()
+        self.assertEqual(in_progress.sla_due_at, in_progress.created_at + timedelta(days=1))
+
+        closed.refresh_from_db()
+        self.assertIsNone(closed.sla_due_at)
+
+
+# =====================================================
+# Form submission (benchmark)
+# =====================================================
+
+class FormSubmitBenchmarkTests(TestCase):
+    """
+    submit_form بعدد استعلامات ثابت مهما كان عدد الحقول (زمن مسطح تقريبًا)
+    """
+
+    FIELD_COUNTS = (5, 20, 60)
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.contrib.auth.models import User
+
+        cls.actor = User.objects.create_user(username="inspector")
+        cls.forms = {}
+        for count in cls.FIELD_COUNTS:
+            form = FormTemplate.objects.create(title=f"قائمة تفتيش {count}", created_by="seed")
+            FormField.objects.bulk_create([
+                FormField(form=form, label=f"بند {i}", field_type="text", order=i)
+                for i in range(count)
+            ])
+            cls.forms[count] = (form, list(form.fields.order_by("order")))
+
+    def _submit(self, count):
+        from ohsms.services.form_service import FormService
+
+        form, fields = self.forms[count]
+        return FormService.submit_form(
+            form=form,
+            answers=[{"field": field, "value": "نعم"} for field in fields],
+            actor=self.actor,
+        )
+
+    TIMING_RUNS = 7
+
+    def test_submit_latency_is_flat(self):
+        queries = {}
+        timings = {}
+        for count in self.FIELD_COUNTS:
+            self._submit(count)  # إحماء
+
+            with CaptureQueriesContext(connection) as captured:
+                submission = self._submit(count)
+            queries[count] = len(captured.captured_queries)
+            self.assertEqual(submission.answers.count(), count)
+
+            samples = []
+            for _ in range(self.TIMING_RUNS):
+                start = time.perf_counter()
+                self._submit(count)
+                samples.append(time.perf_counter() - start)
+            timings[count] = statistics.median(samples)
+
+        # الشرط الحاسم: نفس عدد الاستعلامات للحقول 5 / 20 / 60
+        self.assertEqual(len(set(queries.values())), 1, queries)
+
+        # الزمن: وسيط عدة تشغيلات بهامش واسع (يلتقط العودة إلى استعلام لكل حقل فقط)
+        self.assertLess(timings[60], timings[5] * 6 + 0.05, timings)
+
+    def test_invalid_answer_writes_nothing(self):
+        from ohsms.core.errors import ValidationFailed
+        from ohsms.services.form_service import FormService
+
+        form, fields = self.forms[5]
+        _, foreign = self.forms[20]
+
+        with self.assertRaises(ValidationFailed) as raised:
+            FormService.submit_form(
+                form=form,
+                answers=[{"field": fields[0], "value": "1"}, {"field": foreign[0], "value": "2"}],
+                actor=self.actor,
+            )
+
+        self.assertIn("#1", raised.exception.details)
+        self.assertFalse(FormSubmission.objects.exists())
+        self.assertFalse(FormAnswer.objects.exists())
+        self.assertFalse(FormEvent.objects.filter(action="submit").exists())
+
+    def test_schema_validates_without_queries(self):
+        from ohsms.core.errors import ValidationFailed
+        from ohsms.services.form_schema import FormSchema
+        from ohsms.services.form_service import FormService
+
+        form = FormTemplate.objects.create(title="فحص معدات", created_by="seed")
+        temperature = FormService.add_field(
+            form=form, label="الحرارة", field_type="number", order=1, actor=self.actor, is_required=True,
+        )
+        status = FormService.add_field(
+            form=form, label="الحالة", field_type="select", order=2, actor=self.actor, options="سليم, معطل",
+        )
+        self.assertEqual(form.schema_version, 3)
+
+        schema = FormSchema.for_form(form)
+        self.assertEqual(schema.by_id[status.id].options, frozenset({"سليم", "معطل"}))
+
+        with self.assertNumQueries(0):
+            self.assertIs(FormSchema.for_form(form), schema)
+            with self.assertRaises(ValidationFailed) as raised:
+                schema.validate([{"field": status.id, "value": "مكسور"}])
+            clean = schema.validate([{"field": temperature, "value": " 41.50 "}, {"field": status, "value": "معطل"}])
+
+        # الخطأ في الخيار + الحقل الإلزامي الناقص في نفس المرة
+        self.assertEqual(set(raised.exception.details), {str(status.id), str(temperature.id)})
+        self.assertEqual(clean[0].value, "41.5")
+
+        # حقل جديد → إصدار جديد → ترجمة جديدة
+        FormService.add_field(form=form, label="التاريخ", field_type="date", order=3, actor=self.actor)
+        self.assertIsNot(FormSchema.for_form(form), schema)
+        self.assertEqual(len(FormSchema.for_form(form).fields), 3)
+
+    def test_bulk_field_writes_bump_schema(self):
+        from ohsms.services.form_schema import FormSchema
+
+        form = FormTemplate.objects.create(title="قائمة مجمعة", created_by="seed")
+        version = form.schema_version
+        schema = FormSchema.for_form(form)
+
+        # bulk_create / update / bulk_update لا تُطلق post_save
+        FormField.objects.bulk_create([
+            FormField(form=form, label=f"بند {i}", field_type="text", order=i) for i in range(3)
+        ])
+        self.assertEqual(form.schema_version, version + 1)
+        self.assertIsNot(FormSchema.for_form(form), schema)
+        self.assertEqual(len(FormSchema.for_form(form).fields), 3)
+
+        FormField.objects.filter(form=form, order=0).update(label="بند معدل")
+        form.refresh_from_db()
+        self.assertEqual(form.schema_version, version + 2)
+        self.assertEqual(FormSchema.for_form(form).fields[0].label, "بند معدل")
+
+        fields = list(form.fields.order_by("order"))
+        fields[1].field_type = "number"
+        FormField.objects.bulk_update(fields[1:2], ["field_type"])
+        self.assertEqual(fields[1].form.schema_version, version + 3)
+        self.assertEqual(FormSchema.for_form(fields[1].form).fields[1].field_type, "number")
+
+    def test_historical_submission_reads_pinned_version(self):
+        from ohsms.services.form_service import FormService
+        from ohsms.services.form_versions import FormVersionService
+
+        form = FormTemplate.objects.create(title="جولة سلامة", created_by="seed")
+        exit_field = FormService.add_field(
+            form=form, label="مخرج الطوارئ", field_type="checkbox", order=1, actor=self.actor,
+        )
+        old = FormService.submit_form(form=form, answers=[{"field": exit_field, "value": "نعم"}], actor=self.actor)
+        exit_field_id = exit_field.id
+
+        # تعديل النموذج بعد التقديم: إعادة تسمية + حذف + حقل جديد
+        exit_field.label = "مخرج الطوارئ (محدث)"
+        exit_field.save()
+        exit_field.delete()
+        FormService.add_field(form=form, label="طفاية الحريق", field_type="text", order=1, actor=self.actor)
+        form.refresh_from_db()
+        new = FormService.submit_form(form=form, answers=[], actor=self.actor)
+
+        self.assertNotEqual(old.template_version_id, new.template_version_id)
+
+        FormVersionService.schemas([old.template_version_id])
+        with self.assertNumQueries(1):
+            snapshot = FormVersionService.read(old)
+        self.assertEqual(snapshot["answers"], [
+            {"field_id": exit_field_id, "label": "مخرج الطوارئ", "field_type": "checkbox", "value": "true"},
+        ])
+
+        # تصدير: استعلام للتقديمات + للإجابات + للإصدار غير المخزن
+        with self.assertNumQueries(3):
+            rows = list(FormVersionService.export(FormSubmission.objects.filter(form=form)))
+        self.assertEqual([row["version"] for row in rows], [old.template_version.version, form.schema_version])
+
+    def test_rolled_back_first_submission_does_not_pin_missing_version(self):
+        from django.db import transaction
+
+        from ohsms.models import FormTemplateVersion
+        from ohsms.services.form_schema import FormSchema
+        from ohsms.services.form_service import FormService
+        from ohsms.services.form_versions import FormVersionService
+
+        form = FormTemplate.objects.create(title="فحص معدات", created_by="seed")
+        field = FormService.add_field(form=form, label="الرافعة", field_type="text", order=1, actor=self.actor)
+        form.refresh_from_db()
+
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                FormService.submit_form(form=form, answers=[{"field": field, "value": "سليمة"}], actor=self.actor)
+                raise RuntimeError
+        self.assertFalse(FormTemplateVersion.objects.filter(form=form).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            submission = FormService.submit_form(
+                form=form, answers=[{"field": field, "value": "سليمة"}], actor=self.actor,
+            )
+        self.assertTrue(FormTemplateVersion.objects.filter(pk=submission.template_version_id).exists())
+
+        # بعد commit: الإصدار محفوظ في المخطط المشترك → بدون استعلام get_or_create
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                FormVersionService.pin(form, FormSchema.for_form(form)), submission.template_version_id,
+            )
+
+        # إجابة حقل محذوف تُعرض بدون الوصول إلى الحقل
+        answer = submission.answers.get()
+        field.delete()
+        answer = FormAnswer.objects.get(pk=answer.pk)
+        with self.assertNumQueries(0):
+            self.assertIn(str(answer.field_id), str(answer))
+
+    def test_typed_answers_filter_by_field_type(self):
+        from datetime import date
+
+        from ohsms.core.errors import ValidationFailed
+        from ohsms.services.form_service import FormService
+
+        form = FormTemplate.objects.create(title="تفتيش موقع", created_by="seed")
+        visited = FormService.add_field(form=form, label="تاريخ الزيارة", field_type="date", order=1, actor=self.actor)
+        safe = FormService.add_field(form=form, label="آمن", field_type="checkbox", order=2, actor=self.actor)
+        area = FormService.add_field(
+            form=form, label="المنطقة", field_type="select", order=3, actor=self.actor, options="أ, ب, ج",
+        )
+        notes = FormService.add_field(form=form, label="ملاحظات", field_type="text", order=4, actor=self.actor)
+        form.refresh_from_db()
+
+        rows = [("2026-01-05", "نعم", "أ"), ("2026-02-10", "لا", "ب"), ("2026-03-15", "yes", "ج")]
+        submissions = [
+            FormService.submit_form(
+                form=form,
+                answers=[
+                    {"field": visited, "value": day}, {"field": safe, "value": flag},
+                    {"field": area, "value": option}, {"field": notes, "value": "-"},
+                ],
+                actor=self.actor,
+            )
+            for day, flag, option in rows
+        ]
+        first, second, third = (submission.pk for submission in submissions)
+
+        # الأعمدة المصنّفة تُعبأ وقت التقديم (النص الحر في value فقط)
+        typed = {
+            answer.field_id: (answer.value, answer.value_date, answer.value_bool, answer.value_option)
+            for answer in submissions[2].answers.all()
+        }
+        self.assertEqual(typed, {
+            visited.id: ("2026-03-15", date(2026, 3, 15), None, None),
+            safe.id: ("true", None, True, None),
+            area.id: ("ج", None, None, "ج"),
+            notes.id: ("-", None, None, None),
+        })
+
+        def matching(field, op, value):
+            return set(FormSubmission.objects.where_answer(field, op, value).values_list("pk", flat=True))
+
+        self.assertEqual(matching(visited, "eq", "2026-02-10"), {second})
+        self.assertEqual(matching(visited, "in", ["2026-01-05", "2026-03-15"]), {first, third})
+        self.assertEqual(matching(visited, "range", ["2026-02-01", "2026-03-31"]), {second, third})
+        self.assertEqual(matching(safe, "eq", "نعم"), {first, third})
+        self.assertEqual(matching(safe.id, "in", [False]), {second})
+        self.assertEqual(matching(safe, "range", [False, True]), {first, second, third})
+        self.assertEqual(matching(area, "eq", "ب"), {second})
+        self.assertEqual(matching(area, "in", ["أ", "ج", "د"]), {first, third})
+        self.assertEqual(matching(area, "range", ["أ", "ب"]), {first, second})
+        self.assertEqual(matching(notes, "eq", "-"), {first, second, third})
+
+        # شرطان على حقلين مختلفين في نفس التقديم
+        both = FormSubmission.objects.where_answer(safe, "eq", True).where_answer(area, "eq", "ج")
+        self.assertEqual(set(both.values_list("pk", flat=True)), {third})
+
+        for field, op, value in ((notes, "gt", "-"), (visited, "eq", "10/02/2026"), (visited, "range", ["2026-01-01"])):
+            with self.assertRaises(ValidationFailed):
+                matching(field, op, value)
+
+    def test_field_stats_incremental_matches_rebuild(self):
+        from ohsms.models import FormFieldDailyStat
+        from ohsms.services.form_service import FormService
+        from ohsms.services.form_stats import FormStatsService
+
+        form = FormTemplate.objects.create(title="قراءات يومية", created_by="seed")
+        temperature = FormService.add_field(form=form, label="الحرارة", field_type="number", order=1, actor=self.actor)
+        shift = FormService.add_field(
+            form=form, label="الوردية", field_type="radio", order=2, actor=self.actor, options="صباحية, مسائية",
+        )
+        checked = FormService.add_field(form=form, label="تم الفحص", field_type="checkbox", order=3, actor=self.actor)
+        form.refresh_from_db()
+
+        for value in range(-5, 45):
+            FormService.submit_form(
+                form=form,
+                answers=[
+                    {"field": temperature, "value": value},
+                    {"field": shift, "value": "صباحية" if value % 2 else "مسائية"},
+                    {"field": checked, "value": value > 40},
+                ],
+                actor=self.actor,
+            )
+
+        def snapshot():
+            return sorted(FormFieldDailyStat.objects.values_list(
+                "day", "field_id", "metric", "key", "count", "total", "min_value", "max_value",
+            ))
+
+        incremental = snapshot()
+        FormStatsService.rebuild()
+        self.assertEqual(snapshot(), incremental)
+
+        today = timezone.localdate()
+        with self.assertNumQueries(1):
+            stats = {row["field_id"]: row for row in FormStatsService.field_stats(form, today, today)}
+
+        number = stats[temperature.id]["number"]
+        self.assertEqual((number["count"], number["min"], number["max"]), (50, -5, 44))
+        self.assertAlmostEqual(number["p50"], 20, delta=0.25 * 20)
+        self.assertEqual(stats[shift.id]["options"], {"صباحية": 25, "مسائية": 25})
+        self.assertEqual(stats[checked.id]["options"], {"true": 4, "false": 46})
+
+    def test_form_analytics_counts_whole_days(self):
+        from datetime import datetime, time as day_time
+
+        from ohsms.services.form_snapshot_service import FormSnapshotService
+        from ohsms.services.form_stats import FormStatsService
+
+        form, fields = self.forms[5]
+        first = self._submit(5)
+        self._submit(5)
+
+        # أول لحظة في أول يوم من الفترة: داخل التقديمات والإحصاءات معًا
+        start_day = timezone.localdate() - timedelta(days=7)
+        FormSubmission.objects.filter(pk=first.pk).update(
+            submitted_at=timezone.make_aware(datetime.combine(start_day, day_time.min))
+        )
+        FormStatsService.rebuild()
+
+        analytics = FormSnapshotService.form_analytics(form=form, days=7)
+        self.assertEqual(analytics["start"], start_day)
+        self.assertEqual(analytics["submissions"], 2)
+        self.assertEqual(analytics["fields"][0]["answered"], 2)
 
-# Create your tests here.
+        analytics = FormSnapshotService.form_analytics(form=form, days=6)
+        self.assertEqual(analytics["submissions"], 1)
+        self.assertEqual(analytics["fields"][0]["answered"], 1)
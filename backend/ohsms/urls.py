@@ -18,6 +18,7 @@ urlpatterns = [
 
     # سجل البلاغات
     path("reports/", views.reports_view, name="reports"),
+    path("reports/export/", views.reports_export, name="reports_export"),
 
     # القوائم (محمية)
     path("risk/", views.risk_view, name="risk"),
@@ -26,8 +27,18 @@ urlpatterns = [
     path("system/", views.system_view, name="system"),
 
     # AJAX
+    path("ajax/org-tree/", views.org_tree, name="org_tree"),
     path("ajax/departments/", views.get_departments, name="get_departments"),
     path("ajax/sections/", views.get_sections, name="get_sections"),
+
+    # API – لوحة المؤشرات
+    path("api/dashboard/batch/", views.dashboard_widgets_batch, name="dashboard_widgets_batch"),
+    path("api/dashboard/metrics/", views.dashboard_metrics, name="dashboard_metrics"),
+    path("api/dashboard/<str:name>/", views.dashboard_widget, name="dashboard_widget"),
+    path("api/forms/<int:form_id>/analytics/", views.form_analytics, name="form_analytics"),
+
+    # API – المخاطر
+    path("api/risks/heatmap/", views.risk_heatmap, name="risk_heatmap"),
 ]
 # API – البلاغات
 path("api/incidents/secret/", views.api_create_secret_incident, name="api_secret_incident"),
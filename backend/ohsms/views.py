@@ -2,16 +2,24 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.contrib.auth.models import User
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.db.models import Q
+from django.views.decorators.http import condition
+from django.utils.cache import patch_cache_control
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
 import json
 
 from ohsms.models import Incident, IncidentEvent, Risk, Branch, Department, Section
 from ohsms.services.incident_service import IncidentService
 from ohsms.services.audit_log import AuditLogService
 from ohsms.services.permissions import PermissionService
+from ohsms.services.org_tree import OrgTree
+from ohsms.services.incident_export import IncidentExportService
+from ohsms.core.pagination import KeysetPaginator
+from ohsms.core.errors import ValidationFailed
 
 
 # =========================
@@ -27,9 +35,9 @@ def require_roles(request, allowed_roles, forbidden_message):
     if request.user.is_superuser:
         return None
 
-    for role_code in allowed_roles:
-        if PermissionService.has_role(request.user, role_code):
-            return None
+    # كل الأدوار من AuthorizationContext (استعلام واحد لكل طلب)
+    if PermissionService.has_any_role(request.user, allowed_roles):
+        return None
 
     return render(
         request,
@@ -39,6 +47,13 @@ def require_roles(request, allowed_roles, forbidden_message):
     )
 
 
+def _org_tree_context():
+    """
+    إصدار شجرة الهيكل التنظيمي لبناء رابط /ajax/org-tree/?v=... في القوالب
+    """
+    return {"org_tree_version": OrgTree.current().version}
+
+
 # =========================
 # Auth
 # =========================
@@ -102,10 +117,10 @@ def normal_incident(request):
     """
     إنشاء بلاغ عادي (مبلّغ معروف)
     مربوط بـ IncidentService
+
+    القوائم المنسدلة تُبنى في المتصفح من /ajax/org-tree/ (لا استعلامات هنا)
     """
-    branches = Branch.objects.all()
-    departments = Department.objects.all()
-    sections = Section.objects.all()
+    context = _org_tree_context()
 
     if request.method == "POST":
         title = request.POST.get("title", "").strip()
@@ -120,9 +135,7 @@ def normal_incident(request):
                 request,
                 "ohsms/incident_normal.html",
                 {
-                    "branches": branches,
-                    "departments": departments,
-                    "sections": sections,
+                    **context,
                     "error": "يرجى تعبئة جميع الحقول المطلوبة",
                 }
             )
@@ -140,23 +153,13 @@ def normal_incident(request):
             request,
             "ohsms/incident_normal.html",
             {
-                "branches": branches,
-                "departments": departments,
-                "sections": sections,
+                **context,
                 "success": True,
                 "incident": incident,
             }
         )
 
-    return render(
-        request,
-        "ohsms/incident_normal.html",
-        {
-            "branches": branches,
-            "departments": departments,
-            "sections": sections,
-        }
-    )
+    return render(request, "ohsms/incident_normal.html", context)
 
 
 @login_required(login_url="/login/")
@@ -165,7 +168,7 @@ def secret_incident(request):
     إنشاء بلاغ سري (مجهول الهوية)
     مربوط بـ IncidentService
     """
-    branches = Branch.objects.all()
+    context = _org_tree_context()
 
     if request.method == "POST":
         title = request.POST.get("title", "").strip()
@@ -182,19 +185,13 @@ def secret_incident(request):
             request,
             "ohsms/incident_secret.html",
             {
-                "branches": branches,
+                **context,
                 "success": True,
                 "secret_key": secret_key,
             }
         )
 
-    return render(
-        request,
-        "ohsms/incident_secret.html",
-        {
-            "branches": branches,
-        }
-    )
+    return render(request, "ohsms/incident_secret.html", context)
 
 
 @login_required(login_url="/login/")
@@ -203,9 +200,7 @@ def urgent_incident(request):
     إنشاء بلاغ عاجل
     مربوط بـ IncidentService
     """
-    branches = Branch.objects.all()
-    departments = Department.objects.all()
-    sections = Section.objects.all()
+    context = _org_tree_context()
 
     if request.method == "POST":
         title = request.POST.get("title", "").strip()
@@ -220,9 +215,7 @@ def urgent_incident(request):
                 request,
                 "ohsms/incident_urgent.html",
                 {
-                    "branches": branches,
-                    "departments": departments,
-                    "sections": sections,
+                    **context,
                     "error": "يرجى تعبئة جميع الحقول المطلوبة",
                 }
             )
@@ -231,104 +224,150 @@ def urgent_incident(request):
             system_user=request.user,
             title=title,
             description=description,
-            branch=Branch.objects.get(id=branch_id),
-            department=Department.objects.get(id=department_id),
-            section=Section.objects.get(id=section_id),
+            branch=get_object_or_404(Branch, id=branch_id),
+            department=get_object_or_404(Department, id=department_id),
+            section=get_object_or_404(Section, id=section_id),
         )
 
         return render(
             request,
             "ohsms/incident_urgent.html",
             {
-                "branches": branches,
-                "departments": departments,
-                "sections": sections,
+                **context,
                 "success": True,
                 "incident": incident,
             }
         )
 
-    return render(
-        request,
-        "ohsms/incident_urgent.html",
-        {
-            "branches": branches,
-            "departments": departments,
-            "sections": sections,
-        }
-    )
+    return render(request, "ohsms/incident_urgent.html", context)
 
 
 # =========================
 # Reports
 # =========================
 
+REPORTS_ROLES = [
+    "system_admin",
+    "system_staff",
+    "safety_committee",
+    "branch_manager",
+    "department_manager",
+    "section_manager",
+    "safety_coordinator",
+]
+
+
 @login_required(login_url="/login/")
 def reports_view(request):
     denied = require_roles(
         request,
-        [
-            "system_admin",
-            "system_staff",
-            "safety_committee",
-            "branch_manager",
-            "department_manager",
-            "section_manager",
-            "safety_coordinator",
-        ],
+        REPORTS_ROLES,
         "غير مخوّل للاطلاع على سجل البلاغات"
     )
     if denied:
         return denied
 
-    user = request.user
+    try:
+        page = _incident_page(request, Incident.objects.visible_to(request.user))
+    except ValidationFailed as e:
+        return HttpResponseBadRequest(e.message)
 
-    # Global يشوف كل شيء
-    if PermissionService.is_global(user):
-        qs = Incident.objects.all()
-    else:
-        scopes = PermissionService.get_user_scopes(user)
-
-        q = Q()
-        for ur in scopes:
-            if getattr(ur, "section_id", None):
-                q |= Q(section_id=ur.section_id)
-            elif getattr(ur, "department_id", None):
-                q |= Q(department_id=ur.department_id)
-            elif getattr(ur, "branch_id", None):
-                q |= Q(branch_id=ur.branch_id)
-            else:
-                q = Q()
-                break
-
-        qs = Incident.objects.filter(q) if q else Incident.objects.none()
+    # الأحداث لصفحة واحدة فقط (وليس لكل البلاغات)
+    prefetch_related_objects(page.items, "events")
 
-    incidents = (
-        qs.select_related("branch", "department", "section", "risk")
-          .prefetch_related("events")
-          .order_by("-created_at")
+    return render(
+        request,
+        "ohsms/reports.html",
+        {"incidents": page.items, "page": page},
+    )
+
+
+@login_required(login_url="/login/")
+def reports_export(request):
+    """
+    تصدير سجل البلاغات (نفس النطاق والصلاحيات)
+    ?format=csv|xlsx  ?events=1 (المسار الزمني: ورقة ثانية أو CSV منفصل عبر ?dataset=events)
+    """
+    denied = require_roles(
+        request,
+        REPORTS_ROLES,
+        "غير مخوّل لتصدير سجل البلاغات"
     )
+    if denied:
+        return denied
+
+    stamp = timezone.localdate().isoformat()
+
+    if request.GET.get("format") == "xlsx":
+        response = StreamingHttpResponse(
+            IncidentExportService.xlsx_stream(
+                request.user,
+                include_events=request.GET.get("events") == "1",
+            ),
+            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
+        filename = f"incidents-{stamp}.xlsx"
+    else:
+        dataset = "events" if request.GET.get("dataset") == "events" else "incidents"
+        response = StreamingHttpResponse(
+            IncidentExportService.csv_stream(request.user, dataset=dataset),
+            content_type="text/csv; charset=utf-8",
+        )
+        filename = f"{dataset}-{stamp}.csv"
+
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+INCIDENT_SORTS = {
+    "newest": ("-created_at", "-id"),
+    "oldest": ("created_at", "id"),
+    "status": ("status", "-created_at", "-id"),
+}
+
+
+def _incident_page(request, queryset):
+    """
+    صفحة واحدة من البلاغات بترقيم المؤشر
+    ?cursor=  ?sort=newest|oldest|status  ?page_size=  ?count=1 (عدد تقريبي)
+
+    مؤشر تالف أو من ترتيب آخر → ValidationFailed (400 في الواجهة)
+    """
+    page_size = _int_param(request, "page_size") or 50
 
-    return render(request, "ohsms/reports.html", {"incidents": incidents})
+    paginator = KeysetPaginator(
+        queryset.select_related("branch", "department", "section"),
+        sort_options=INCIDENT_SORTS,
+        default_sort="newest",
+        page_size=page_size,
+    )
+    return paginator.page(
+        cursor=request.GET.get("cursor"),
+        sort=request.GET.get("sort"),
+        with_total=request.GET.get("count") == "1",
+    )
 
 
 # =========================
 # Risk / Forms / Dashboard / System
 # =========================
 
+RISK_ROLES = [
+    "system_admin",
+    "system_staff",
+    "safety_committee",
+    "branch_manager",
+    "department_manager",
+    "section_manager",
+    "safety_coordinator",
+]
+
+
 @login_required(login_url="/login/")
 def risk_view(request):
     denied = require_roles(
         request,
-        [
-            "system_admin",
-            "system_staff",
-            "safety_committee",
-            "branch_manager",
-            "department_manager",
-            "section_manager",
-            "safety_coordinator",
-        ],
+        RISK_ROLES,
         "غير مخوّل للوصول إلى إدارة المخاطر"
     )
     if denied:
@@ -343,20 +382,12 @@ def forms_view(request):
 
 @login_required(login_url="/login/")
 def dashboard_view(request):
-    from ohsms.services.dashboard import DashboardService
-
-    full = request.GET.get("full") == "1"
-    if not full:
-        data = {"note": "Dashboard light mode. Append ?full=1 for full snapshot."}
-        return render(request, "ohsms/dashboard.html", {"dashboard": data})
-
-    try:
-        # ✅ مهم: تمرير المستخدم حتى تُطبق scopes داخل DashboardService
-        dashboard_data = DashboardService.dashboard_snapshot(user=request.user)
-    except Exception as e:
-        dashboard_data = {"error": str(e)}
+    """
+    هيكل الصفحة فقط - الودجات تُحمّل من /api/dashboard/batch/ (dashboard.js)
+    """
+    from ohsms.services.dashboard_widgets import DashboardWidgetService
 
-    return render(request, "ohsms/dashboard.html", {"dashboard": dashboard_data})
+    return render(request, "ohsms/dashboard.html", {"widgets": DashboardWidgetService.names()})
 
 
 @login_required(login_url="/login/")
@@ -375,9 +406,42 @@ def system_view(request):
 # AJAX
 # =========================
 
+def _int_param(request, name):
+    try:
+        return int(request.GET.get(name, ""))
+    except ValueError:
+        return None
+
+
+def _org_tree_etag(request):
+    return f'"org-tree-{OrgTree.current().version}"'
+
+
+@login_required(login_url="/login/")
+@condition(etag_func=_org_tree_etag)
+def org_tree(request):
+    """
+    الهيكل التنظيمي كاملاً (فرع → إدارة → قسم) في استجابة واحدة
+
+    - ETag = إصدار الشجرة → 304 بدون جسم إذا لم يتغير شيء
+    - الرابط المُصدّر (?v=<version>) يُخزن في المتصفح يومًا كاملاً،
+      وأي تعديل على الهيكل يغيّر الإصدار وبالتالي الرابط
+    """
+    tree = OrgTree.current()
+
+    response = JsonResponse({
+        "version": tree.version,
+        "branches": tree.as_nested(),
+    })
+
+    versioned = request.GET.get("v") == str(tree.version)
+    patch_cache_control(response, private=True, max_age=86400 if versioned else 0)
+    return response
+
+
 @login_required(login_url="/login/")
 def get_departments(request):
-    departments = Department.objects.filter(branch_id=request.GET.get("branch_id"))
+    departments = OrgTree.current().departments_of(_int_param(request, "branch_id"))
     return JsonResponse(
         [{"id": d.id, "name": d.name} for d in departments],
         safe=False
@@ -386,7 +450,7 @@ def get_departments(request):
 
 @login_required(login_url="/login/")
 def get_sections(request):
-    sections = Section.objects.filter(department_id=request.GET.get("department_id"))
+    sections = OrgTree.current().sections_of(_int_param(request, "department_id"))
     return JsonResponse(
         [{"id": s.id, "name": s.name} for s in sections],
         safe=False
@@ -397,6 +461,165 @@ def get_sections(request):
 # API
 # =========================
 
+# ودجات تعرض بيانات إدارة المخاطر → نفس أدوار /api/risks/heatmap/
+RISK_WIDGETS = ("heatmap",)
+RISK_DENIED_MESSAGE = "غير مخوّل للوصول إلى إدارة المخاطر"
+
+
+def _denied_widgets(request, names) -> list:
+    if not any(name in RISK_WIDGETS for name in names):
+        return []
+    if request.user.is_superuser or PermissionService.has_any_role(request.user, RISK_ROLES):
+        return []
+    return [name for name in names if name in RISK_WIDGETS]
+
+
+def _quoted(etag):
+    return f'"{etag}"' if etag else None
+
+
+def _widget_etag(request, name):
+    from ohsms.services.dashboard_widgets import DashboardWidgetService
+
+    if _denied_widgets(request, [name]):
+        return None
+    try:
+        return _quoted(DashboardWidgetService.etag(request.user, name, DashboardWidgetService.params(name, request.GET)))
+    except ValidationFailed:
+        return None
+
+
+def _widgets_batch_etag(request):
+    from ohsms.services.dashboard_widgets import DashboardWidgetService
+
+    try:
+        names = DashboardWidgetService.parse_names(request.GET.get("widgets"))
+    except ValidationFailed:
+        return None
+    denied = _denied_widgets(request, names)
+    names = [name for name in names if name not in denied]
+    try:
+        return _quoted(DashboardWidgetService.batch_etag(request.user, names, request.GET))
+    except ValidationFailed:
+        return None
+
+
+def _no_store_revalidate(response):
+    # المتصفح يحتفظ بالنسخة ويتحقق منها بالـ ETag في كل مرة (304 بدون جسم)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required(login_url="/login/")
+@condition(etag_func=_widget_etag)
+def dashboard_widget(request, name):
+    """
+    ودجت واحدة من لوحة المؤشرات (kpis / trends / by_scope / heatmap / sla)
+    """
+    from ohsms.services.dashboard_widgets import DashboardWidgetService
+
+    if _denied_widgets(request, [name]):
+        return JsonResponse({"error": RISK_DENIED_MESSAGE}, status=403)
+
+    try:
+        params = DashboardWidgetService.params(name, request.GET)
+        data = DashboardWidgetService.compute(request.user, name, params)
+    except ValidationFailed as e:
+        return JsonResponse({"error": e.message, "details": e.details}, status=400)
+
+    return _no_store_revalidate(JsonResponse(data))
+
+
+@login_required(login_url="/login/")
+@condition(etag_func=_widgets_batch_etag)
+def dashboard_widgets_batch(request):
+    """
+    عدة ودجات في استجابة واحدة: ?widgets=kpis,trends,heatmap (الافتراضي: الكل)
+    تُحسب بالتوازي - وزمنها ≈ أبطأ ودجت
+    """
+    from ohsms.services.dashboard_widgets import DashboardWidgetService
+
+    try:
+        names = DashboardWidgetService.parse_names(request.GET.get("widgets"))
+        denied = _denied_widgets(request, names)
+        names = [name for name in names if name not in denied]
+        data = DashboardWidgetService.batch(request.user, names, request.GET)
+    except ValidationFailed as e:
+        return JsonResponse({"error": e.message, "details": e.details}, status=400)
+
+    # الودجات المرفوضة كأخطاء مستقلة (لا تُسقط الباقي)
+    for name in denied:
+        data["errors"][name] = RISK_DENIED_MESSAGE
+
+    data["etags"] = {}
+    for name in names:
+        etag = DashboardWidgetService.etag(request.user, name, DashboardWidgetService.params(name, request.GET))
+        if etag:
+            data["etags"][name] = etag
+    return _no_store_revalidate(JsonResponse(data))
+
+
+@login_required(login_url="/login/")
+def dashboard_metrics(request):
+    """
+    قياسات الودجات واللقطات في هذه العملية (للموظفين فقط):
+    عدد الاستعلامات / زمن قاعدة البيانات / زمن بايثون / الصفوف + مدرّج total_ms
+    """
+    from ohsms.core import instrumentation
+
+    if not request.user.is_staff:
+        return JsonResponse({"error": "غير مخوّل"}, status=403)
+
+    response = JsonResponse({
+        "budgets": getattr(settings, "OHSMS_DASHBOARD_BUDGETS", {}),
+        "metrics": instrumentation.snapshot(),
+    })
+    patch_cache_control(response, private=True, no_store=True)
+    return response
+
+
+@login_required(login_url="/login/")
+def form_analytics(request, form_id):
+    """
+    تحليلات أسئلة نموذج (تكرار الخيارات / إحصاءات الأرقام / توزيع التواريخ) ?days=N
+    """
+    from ohsms.models import FormTemplate
+    from ohsms.services.form_snapshot_service import FormSnapshotService
+
+    form = get_object_or_404(FormTemplate.objects.visible_to(request.user), pk=form_id)
+
+    days = _int_param(request, "days") or 30
+    if days <= 0:
+        return JsonResponse({"error": "قيمة غير صحيحة", "details": {"days": days}}, status=400)
+
+    response = JsonResponse(FormSnapshotService.form_analytics(form=form, days=days))
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required(login_url="/login/")
+def risk_heatmap(request):
+    """
+    مصفوفة المخاطر (الشدة × الاحتمالية) مقيدة بنطاقات المستخدم
+    ?breakdown=branch|category  ?days=N
+    """
+    from ohsms.services.dashboard import DashboardService
+
+    denied = require_roles(request, RISK_ROLES, RISK_DENIED_MESSAGE)
+    if denied:
+        return denied
+
+    try:
+        data = DashboardService.risks_heatmap(
+            breakdown=request.GET.get("breakdown") or None,
+            days=_int_param(request, "days"),
+            user=request.user,
+        )
+    except ValidationFailed as e:
+        return JsonResponse({"error": e.message, "details": e.details}, status=400)
+
+    return JsonResponse(data)
+
 @csrf_exempt
 def api_create_secret_incident(request):
     if request.method != "POST":
@@ -460,16 +683,15 @@ def secret_track(request):
 
 @login_required(login_url="/login/")
 def incidents_dashboard(request):
-    incidents = (
-        Incident.objects
-        .select_related("branch", "department", "section")
-        .order_by("-created_at")
-    )
+    try:
+        page = _incident_page(request, Incident.objects.all())
+    except ValidationFailed as e:
+        return HttpResponseBadRequest(e.message)
 
     return render(
         request,
         "ohsms/incidents_dashboard.html",
-        {"incidents": incidents}
+        {"incidents": page.items, "page": page}
     )
 
 
@@ -551,21 +773,11 @@ def assign_incident(request, incident_id):
 
     assignee = get_object_or_404(User, id=assignee_id)
 
-    IncidentEvent.objects.create(
+    IncidentService.assign_incident(
         incident=incident,
-        action="assign",
-        from_status=incident.status,
-        to_status=incident.status,
-        actor=request.user.username,
-        note=f"تمت الإحالة إلى {assignee.username}. {note}",
-    )
-
-    AuditLogService.log(
-        user=request.user,
-        action="assign",
-        model_name="Incident",
-        object_id=incident.id,
-        description=f"إحالة البلاغ إلى {assignee.username}",
+        assignee=assignee,
+        actor=request.user,
+        note=note,
     )
 
     messages.success(request, "تمت إحالة البلاغ بنجاح")